@@ -0,0 +1,117 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from hybrid_search import KNOWLEDGE_FILES, HybridIndex
+
+
+class HashEmbedding:
+    """
+    未安装 pymilvus[model] 时使用的替代嵌入函数: 根据文本哈希生成固定的随机单位向量
+
+    只用于测量索引本身的开销，不含模型编码耗时，向量检索结果没有语义
+    """
+
+    def __init__(self, dim=768):
+        self.dim = dim
+
+    def encode_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def encode_queries(self, texts):
+        return self.encode_documents(texts)
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+
+def load_embedding():
+    try:
+        from pymilvus import model as milvus_model
+    except ImportError:
+        return HashEmbedding(), "HashEmbedding(未安装 pymilvus[model]，不含模型编码耗时)"
+    return milvus_model.DefaultEmbeddingFunction(), "DefaultEmbeddingFunction"
+
+
+def build_corpus(directory, scale):
+    """把知识库文件复制 scale 份，每份作为独立的来源"""
+    paths = []
+    for copy in range(scale):
+        for path in KNOWLEDGE_FILES:
+            name, ext = os.path.splitext(os.path.basename(path))
+            target = os.path.join(directory, f"{name}-{copy}{ext}")
+            shutil.copyfile(path, target)
+            paths.append(target)
+    return paths
+
+
+def cigar_questions():
+    """雪茄知识中的问答对，用于测量召回率"""
+    with open(KNOWLEDGE_FILES[-1], "r", encoding="utf-8") as file:
+        return re.findall(r"问：(.+?)\s*\n\s*答：(.+?)\s*\n", file.read())
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="HybridIndex 建库、增量更新和查询延迟基准测试")
+    parser.add_argument("--scale", type=int, default=1, help="知识库复制的份数")
+    parser.add_argument("--limit", type=int, default=3, help="每个问题返回的结果数")
+    parser.add_argument("--rounds", type=int, default=3, help="每个问题重复查询的轮数")
+    args = parser.parse_args()
+
+    embedding, embedding_name = load_embedding()
+    print(f"嵌入函数: {embedding_name}")
+    pairs = cigar_questions()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        corpus = os.path.join(tmpdir, "corpus")
+        os.makedirs(corpus)
+        paths = build_corpus(corpus, args.scale)
+        index_path = os.path.join(tmpdir, "index")
+
+        index = HybridIndex(index_path, embedding_fn=embedding)
+        stats, seconds = timed(index.sync, paths)
+        print(f"全量建库: {stats.added} 个分块，{seconds * 1000:.1f}ms")
+        stats, seconds = timed(index.sync, paths)
+        print(f"无变化同步: {stats.unchanged} 个分块未变化，{seconds * 1000:.1f}ms")
+
+        with open(paths[0], "a", encoding="utf-8") as file:
+            file.write("\n\n## 新增章节\n\n客服热线调整为每天 9:00-21:00。\n")
+        stats, seconds = timed(index.sync, paths)
+        print(f"增量同步: 新增 {stats.added}、删除 {stats.deleted} 个分块，{seconds * 1000:.1f}ms")
+
+        reopened, seconds = timed(HybridIndex, index_path, embedding_fn=embedding)
+        info = reopened.stats()
+        print(f"打开索引(mmap): {seconds * 1000:.1f}ms，{info['documents']} 个分块，{info['segments']} 个段，"
+              f"{info['bytes'] / 1024:.0f} KB")
+
+        print(f"\n{'模式':<8}{'p50':>9}{'p95':>9}{'p99':>9}{'召回@' + str(args.limit):>10}")
+        for mode in ("bm25", "dense", "hybrid"):
+            latencies = []
+            found = 0
+            for round_ in range(args.rounds):
+                for question, answer in pairs:
+                    hits, seconds = timed(reopened.search, question, limit=args.limit, mode=mode)
+                    latencies.append(seconds)
+                    if round_ == 0:
+                        found += any(answer in hit.text for hit in hits)
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+            print(f"{mode:<8}{p50:>7.2f}ms{p95:>7.2f}ms{p99:>7.2f}ms{found / len(pairs):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
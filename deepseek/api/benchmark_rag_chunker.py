@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+
+from rag_chunker import MarkdownChunker
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def build_corpus(path, target_bytes, seed_path=os.path.join(HERE, "mfd.md")):
+    """
+    将 mfd.md 重复写入 path，直到文件大小达到 target_bytes
+
+    返回:
+        int: 文件的实际字节数
+    """
+    with open(seed_path, "r", encoding="utf-8") as file:
+        seed = file.read()
+    written = 0
+    with open(path, "w", encoding="utf-8") as file:
+        while written < target_bytes:
+            file.write(seed)
+            file.write("\n\n")
+            written = file.tell()
+    return written
+
+
+def run(chunker, path):
+    """
+    对文件完整分块一次，返回 (分块数, 总 token 数, 耗时秒数)
+    """
+    start = time.perf_counter()
+    count = 0
+    tokens = 0
+    for chunk in chunker.chunk_file(path):
+        count += 1
+        tokens += chunk.tokens
+    return count, tokens, time.perf_counter() - start
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="MarkdownChunker 分块速度基准测试")
+    parser.add_argument("path", nargs="?", help="要分块的文件，默认使用由 mfd.md 重复生成的语料")
+    parser.add_argument("--size-mb", type=float, default=50, help="生成语料的大小(MB)")
+    parser.add_argument("--target-tokens", type=int, default=256)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--overlap-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    chunker = MarkdownChunker(args.target_tokens, args.max_tokens, args.overlap_tokens)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = args.path
+        if path is None:
+            path = os.path.join(tmpdir, "corpus.md")
+            build_corpus(path, int(args.size_mb * 1024 * 1024))
+        size = os.path.getsize(path)
+        count, tokens, seconds = run(chunker, path)
+
+    print(f"语料大小: {size / 1024 / 1024:.1f} MB")
+    print(f"分块数量: {count:,}，平均 {tokens / max(count, 1):.0f} tokens/块")
+    print(f"耗时: {seconds:.2f} 秒")
+    print(f"速度: {count / seconds:,.0f} 块/秒，{size / 1024 / 1024 / seconds:.1f} MB/秒")
+
+
+if __name__ == "__main__":
+    main()
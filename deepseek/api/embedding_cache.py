@@ -0,0 +1,162 @@
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+
+
+def text_key(text):
+    """文本的缓存键: utf-8 编码后的 sha256 摘要"""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class CachedEmbeddingFunction:
+    """
+    pymilvus 嵌入函数的持久化缓存包装器
+
+    向量以 float32 字节存储在 SQLite 中，缓存键为 (模型标识, 编码方式, 文本哈希)。
+    每次调用只把未命中的文本(去重后)一次性交给底层模型编码，
+    缓存条目超过 max_entries 时按最近最少使用的顺序淘汰。
+    返回值与 DefaultEmbeddingFunction 一致: 每个文本对应一个 numpy float32 向量。
+
+    参数:
+        embedding_fn: 提供 encode_queries / encode_documents 的嵌入函数
+        path (str): SQLite 缓存文件路径，":memory:" 表示仅在进程内缓存
+        model_id (str): 模型标识，默认取 embedding_fn.model_name 或其类名
+        max_entries (int): 缓存的最大条目数
+    """
+
+    def __init__(self, embedding_fn, path, model_id=None, max_entries=100_000):
+        self.embedding_fn = embedding_fn
+        self.model_id = model_id or getattr(embedding_fn, "model_name", None) or type(embedding_fn).__name__
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " key BLOB NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used INTEGER NOT NULL,"
+            " PRIMARY KEY (model, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self._db.commit()
+        # 用递增计数代替时间戳记录访问顺序，避免同一时刻的多次访问无法区分先后
+        (self._clock,) = self._db.execute("SELECT COALESCE(MAX(last_used), 0) FROM embeddings").fetchone()
+        (self._size,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    @property
+    def dim(self):
+        return self.embedding_fn.dim
+
+    def __getattr__(self, name):
+        # 其余属性直接转发给底层嵌入函数
+        if name == "embedding_fn":
+            raise AttributeError(name)
+        return getattr(self.embedding_fn, name)
+
+    def encode_queries(self, queries):
+        return self._encode(queries, "query", self.embedding_fn.encode_queries)
+
+    def encode_documents(self, documents):
+        return self._encode(documents, "document", self.embedding_fn.encode_documents)
+
+    def __call__(self, texts):
+        return self.encode_documents(texts)
+
+    def stats(self):
+        """返回缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": self._size,
+        }
+
+    def clear(self):
+        """清空当前模型的缓存条目"""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE model IN (?, ?)",
+                (f"{self.model_id}:query", f"{self.model_id}:document"),
+            )
+            self._db.commit()
+            (self._size,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def close(self):
+        self._db.close()
+
+    def _encode(self, texts, kind, encode):
+        # 查询和文档在部分模型中的编码方式不同，因此分别缓存
+        model = f"{self.model_id}:{kind}"
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            cached = self._lookup(model, set(keys))
+            misses = sum(key not in cached for key in keys)
+            self.hits += len(keys) - misses
+            self.misses += misses
+        # 未命中的文本去重后一次性编码
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+
+        if missing:
+            vectors = encode(list(missing.values()))
+            computed = {
+                key: np.asarray(vector, dtype=np.float32)
+                for key, vector in zip(missing, vectors)
+            }
+            with self._lock:
+                self._store(model, computed)
+            cached.update(computed)
+        # 缓存命中的向量是 SQLite 字节串上的只读视图，批内重复的文本也共享同一个数组，
+        # 返回副本使调用方可以原地修改(例如归一化)而不影响其他结果
+        return [cached[key].copy() for key in keys]
+
+    def _lookup(self, model, keys):
+        found = {}
+        keys = list(keys)
+        # SQLite 对单条语句的参数个数有限制，分批查询
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                (model, *batch),
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        if found:
+            self._clock += 1
+            self._db.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                [(self._clock, model, key) for key in found],
+            )
+            self._db.commit()
+        return found
+
+    def _store(self, model, vectors):
+        self._clock += 1
+        # 并发调用可能同时编码同一文本，已存在的条目直接忽略
+        cursor = self._db.executemany(
+            "INSERT OR IGNORE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(model, key, vector.tobytes(), self._clock) for key, vector in vectors.items()],
+        )
+        self._size += cursor.rowcount
+        overflow = self._size - self.max_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE rowid IN"
+                " (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+            self._size -= overflow
+        self._db.commit()
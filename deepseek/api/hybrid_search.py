@@ -0,0 +1,552 @@
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from rag_chunker import MarkdownChunker
+from rag_ingest import IngestStats, chunk_id
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+
+# 客服知识库: FastGPT 的公司手册、售后和销售文档，以及 Dify 的雪茄知识问答
+KNOWLEDGE_FILES = [
+    os.path.join(ROOT, "fastgpt", "公司手册.md"),
+    os.path.join(ROOT, "fastgpt", "产品售后.md"),
+    os.path.join(ROOT, "fastgpt", "销售咨询.md"),
+    os.path.join(ROOT, "dify", "雪茄知识.md"),
+]
+
+# 连续的汉字，或连续的字母数字(允许中间出现 . 和 -，例如 SPF50+ 中的 spf50、V2.3、XYNHJ-30A)
+TERM_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+|[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+# 只过滤高频的单字虚词，双字词保留
+STOPWORDS = frozenset("的了是在和与及或也就都而之其这那个吗呢吧啊")
+
+MANIFEST = "manifest.json"
+
+
+def tokenize(text):
+    """
+    中文友好的 BM25 分词
+
+    不依赖分词词典: 连续汉字同时产生单字和相邻两字(bigram)，单字保证召回，
+    bigram 让“退货”“保质期”这样的词组得到更高的匹配分；字母数字按整词小写。
+
+    参数:
+        text (str): 要分词的文本
+
+    返回:
+        list[str]: 词项列表，保留重复
+    """
+    terms = []
+    for match in TERM_PATTERN.finditer(unicodedata.normalize("NFKC", text).lower()):
+        run = match.group()
+        if run[0].isascii():
+            terms.append(run)
+            continue
+        terms.extend(char for char in run if char not in STOPWORDS)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def _index_text(chunk):
+    """参与检索的文本: 章节标题路径加上分块正文，使标题中的关键词也能命中"""
+    headings = " > ".join(getattr(chunk, "headings", ()))
+    text = getattr(chunk, "text", chunk)
+    return f"{headings}\n{text}" if headings else text
+
+
+class _Segment:
+    """
+    一个只读的索引段
+
+    倒排表按词项顺序连续存放在 postings.npy / freqs.npy 中，offsets.npy 记录每个词项的起止位置，
+    这些数组和向量矩阵都以 mmap 方式打开，由操作系统按需换入，打开索引不需要读入全部倒排表。
+    删除只记录在 live 数组中，段文件本身从不修改。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "vocab.json"), "r", encoding="utf-8") as file:
+            self.vocab = {term: i for i, term in enumerate(json.load(file))}
+        with open(os.path.join(path, "docs.json"), "r", encoding="utf-8") as file:
+            self.docs = json.load(file)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        self.freqs = np.load(os.path.join(path, "freqs.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(path, "lengths.npy"))
+        vectors = os.path.join(path, "vectors.npy")
+        self.vectors = np.load(vectors, mmap_mode="r") if os.path.exists(vectors) else None
+        self.live = np.ones(len(self.docs), dtype=bool)
+
+    def __len__(self):
+        return len(self.docs)
+
+    @staticmethod
+    def write(path, docs, terms, vectors=None):
+        """
+        把一批文档写为新的段目录
+
+        先写入临时目录再整体重命名，中途失败不会留下不完整的段。
+
+        参数:
+            path (str): 段目录
+            docs (list[dict]): 文档元数据(id、source、text、headings)
+            terms (list[list[str]]): 每个文档的词项
+            vectors (np.ndarray): 文档向量矩阵，None 表示不保存向量
+        """
+        counts = [Counter(doc_terms) for doc_terms in terms]
+        vocab = sorted(set().union(*counts)) if counts else []
+        index = {term: i for i, term in enumerate(vocab)}
+        term_ids, doc_ids, freqs = [], [], []
+        for doc, counter in enumerate(counts):
+            for term, freq in counter.items():
+                term_ids.append(index[term])
+                doc_ids.append(doc)
+                freqs.append(freq)
+        # 按 (词项, 文档) 排序，使每个词项的倒排表连续且文档号递增
+        order = np.lexsort((np.asarray(doc_ids, dtype=np.int64), np.asarray(term_ids, dtype=np.int64)))
+        term_ids = np.asarray(term_ids, dtype=np.int64)[order]
+        offsets = np.searchsorted(term_ids, np.arange(len(vocab) + 1)).astype(np.int64)
+
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+        np.save(os.path.join(tmp_path, "postings.npy"), np.asarray(doc_ids, dtype=np.int32)[order])
+        np.save(os.path.join(tmp_path, "freqs.npy"), np.asarray(freqs, dtype=np.int32)[order])
+        np.save(os.path.join(tmp_path, "lengths.npy"), np.asarray([len(t) for t in terms], dtype=np.int32))
+        if vectors is not None:
+            np.save(os.path.join(tmp_path, "vectors.npy"), np.asarray(vectors, dtype=np.float32))
+        with open(os.path.join(tmp_path, "vocab.json"), "w", encoding="utf-8") as file:
+            json.dump(vocab, file, ensure_ascii=False)
+        with open(os.path.join(tmp_path, "docs.json"), "w", encoding="utf-8") as file:
+            json.dump(docs, file, ensure_ascii=False)
+        # 段名称单调递增、不会复用，同名目录只可能是中断写入留下的残留
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    def posting(self, term):
+        """返回词项的 (文档号数组, 词频数组)，词项不存在时返回 None"""
+        i = self.vocab.get(term)
+        if i is None:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.postings[start:end], self.freqs[start:end]
+
+    def df(self, term):
+        i = self.vocab.get(term)
+        return 0 if i is None else int(self.offsets[i + 1] - self.offsets[i])
+
+    def with_deleted(self, ordinals):
+        """返回标记了删除的新视图，不修改当前对象，正在进行的查询不受影响"""
+        live = self.live.copy()
+        live[list(ordinals)] = False
+        view = object.__new__(_Segment)
+        view.__dict__.update(self.__dict__)
+        view.live = live
+        return view
+
+
+@dataclass
+class SearchHit:
+    """一条检索结果"""
+    id: str
+    source: str
+    text: str
+    headings: list = field(default_factory=list)
+    score: float = 0.0  # hybrid 为 RRF 融合分，bm25 / dense 为各自的原始分
+    bm25_rank: int = None  # 在 BM25 结果中的名次(从 1 开始)，未进入候选时为 None
+    dense_rank: int = None
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """
+    某一时刻的段列表及其统计量，作为整体替换
+
+    查询只读取同一个快照，写入线程切换到新段后，进行中的查询仍使用一致的文档数和平均长度
+    """
+    segments: tuple = ()
+    by_source: dict = field(default_factory=dict)  # 来源 -> {分块 id: (段名称, 文档序号)}
+    documents: int = 0  # 未删除的分块数量
+    average_length: float = 0.0  # 未删除分块的平均词项数
+
+    @classmethod
+    def build(cls, segments):
+        by_source = {}
+        documents = 0
+        total_length = 0
+        for segment in segments:
+            for ordinal in np.flatnonzero(segment.live):
+                doc = segment.docs[ordinal]
+                by_source.setdefault(doc["source"], {})[doc["id"]] = (segment.name, int(ordinal))
+            documents += int(segment.live.sum())
+            total_length += int(segment.lengths[segment.live].sum())
+        return cls(tuple(segments), by_source, documents, total_length / documents if documents else 0.0)
+
+
+class HybridIndex:
+    """
+    本地的 BM25 + 向量混合检索索引
+
+    文档按 MarkdownChunker 分块后写入只读的索引段，倒排表和向量以 mmap 方式读取。
+    sync 按内容哈希比对分块: 只有新增或修改的分块会被编码并写成一个新段，
+    删除的分块只在清单中标记，段数超过 max_segments 时合并为一个段并真正清除已删除的分块。
+    查询时 BM25 和向量检索各取 candidates 个候选，按倒数排名融合(RRF)后返回。
+
+    BM25 的文档频率和文档总数按段内的全部文档统计，已删除但尚未合并的分块仍会计入，与 Lucene 的做法相同。
+
+    参数:
+        path (str): 索引目录
+        embedding_fn: 提供 encode_documents / encode_queries 的嵌入函数，
+            例如 DefaultEmbeddingFunction 或 CachedEmbeddingFunction；None 表示只使用 BM25
+        chunker (callable): 分块函数，接收按行迭代的文本，返回带 text 属性的分块
+        k1 (float): BM25 的词频饱和参数
+        b (float): BM25 的文档长度归一化参数
+        rrf_k (int): RRF 融合的平滑常数
+        max_segments (int): 段数超过该值时自动合并
+        batch_size (int): 每批编码的分块数量
+    """
+
+    def __init__(self, path, embedding_fn=None, chunker=None, k1=1.5, b=0.75, rrf_k=60,
+                 max_segments=8, batch_size=64):
+        self.path = path
+        self.embedding_fn = embedding_fn
+        self.chunker = chunker or MarkdownChunker(target_tokens=160, max_tokens=320, overlap_tokens=0)
+        self.k1 = k1
+        self.b = b
+        self.rrf_k = rrf_k
+        self.max_segments = max_segments
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        manifest = {"next_segment": 0, "dim": None, "segments": []}
+        manifest_path = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        self._next_segment = manifest["next_segment"]
+        self.dim = manifest["dim"]
+        segments = []
+        for entry in manifest["segments"]:
+            segment = _Segment(os.path.join(path, entry["name"]))
+            if entry["deleted"]:
+                segment = segment.with_deleted(entry["deleted"])
+            segments.append(segment)
+        self._remove_orphans({segment.name for segment in segments})
+        self._snapshot = _Snapshot.build(segments)
+
+    @property
+    def segments(self):
+        return self._snapshot.segments
+
+    def __len__(self):
+        return self._snapshot.documents
+
+    def sources(self):
+        return sorted(self._snapshot.by_source)
+
+    def stats(self):
+        """返回文档数、段数、已删除分块数和索引文件大小"""
+        snapshot = self._snapshot
+        segments = snapshot.segments
+        size = 0
+        for segment in segments:
+            for name in os.listdir(segment.path):
+                size += os.path.getsize(os.path.join(segment.path, name))
+        return {
+            "documents": snapshot.documents,
+            "segments": len(segments),
+            "deleted": sum(len(segment) for segment in segments) - snapshot.documents,
+            "terms": sum(len(segment.vocab) for segment in segments),
+            "bytes": size,
+            "average_length": snapshot.average_length,
+        }
+
+    # ---- 写入 ----
+
+    def sync(self, paths=KNOWLEDGE_FILES, encoding="utf-8"):
+        """
+        同步一组文件: 增量更新每个文件的分块，并删除已不在 paths 里的来源
+
+        返回:
+            IngestStats: 新增、未变化和删除的分块数量
+        """
+        start = time.perf_counter()
+        paths = [os.fspath(path) for path in paths]
+        changes = {}
+        for path in paths:
+            with open(path, "r", encoding=encoding) as file:
+                changes[path] = list(self.chunker(file))
+        for source in set(self._snapshot.by_source) - set(paths):
+            changes[source] = []
+        stats = self.update(changes)
+        stats.seconds = time.perf_counter() - start
+        return stats
+
+    def _remove_orphans(self, names):
+        """
+        删除清单中没有登记的段目录和临时目录
+
+        段先写入磁盘、再提交清单，两步之间进程中断时会留下未登记的段，
+        下次以相同的编号写入时会因为目标目录已存在而失败
+        """
+        for name in os.listdir(self.path):
+            if name.startswith("segment-") and name not in names:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def update(self, changes):
+        """
+        用新的分块列表替换一组来源的内容
+
+        参数:
+            changes (dict): 来源 -> 该来源当前的全部分块(字符串或 Chunk)，空列表表示删除该来源
+
+        返回:
+            IngestStats: 新增、未变化和删除的分块数量
+        """
+        start = time.perf_counter()
+        stats = IngestStats()
+        with self._lock:
+            docs, texts = [], []
+            deleted = {}  # 段名称 -> 删除的文档序号
+            for source, chunks in changes.items():
+                existing = self._snapshot.by_source.get(source, {})
+                current = {}
+                for chunk in chunks:
+                    # 标题路径也计入标识，重命名章节后分块会以新的标题重新写入
+                    current.setdefault(chunk_id(source, _index_text(chunk)), chunk)
+                for cid, location in existing.items():
+                    if cid not in current:
+                        deleted.setdefault(location[0], []).append(location[1])
+                        stats.deleted += 1
+                for cid, chunk in current.items():
+                    if cid in existing:
+                        stats.unchanged += 1
+                        continue
+                    docs.append({
+                        "id": cid,
+                        "source": source,
+                        "text": getattr(chunk, "text", chunk),
+                        "headings": list(getattr(chunk, "headings", ())),
+                    })
+                    texts.append(_index_text(chunk))
+            stats.added = len(docs)
+            if not docs and not deleted:
+                return stats
+
+            segments = [
+                segment.with_deleted(deleted[segment.name]) if segment.name in deleted else segment
+                for segment in self._snapshot.segments
+            ]
+            if docs:
+                self._check_vectors(segments)
+                vectors = self._encode(texts)
+                path = os.path.join(self.path, f"segment-{self._next_segment:06d}")
+                self._next_segment += 1
+                _Segment.write(path, docs, [tokenize(text) for text in texts], vectors)
+                segments.append(_Segment(path))
+            self._commit(segments)
+            if len(self._snapshot.segments) > self.max_segments:
+                self._merge()
+        stats.seconds = time.perf_counter() - start
+        return stats
+
+    def merge(self):
+        """把全部段合并为一个段，清除已删除的分块"""
+        with self._lock:
+            self._merge()
+
+    def _merge(self):
+        docs, texts, vectors = [], [], []
+        old = self._snapshot.segments
+        for segment in old:
+            for ordinal in np.flatnonzero(segment.live):
+                doc = segment.docs[ordinal]
+                docs.append(doc)
+                texts.append(_index_text(_Doc(doc)))
+                if segment.vectors is not None:
+                    vectors.append(segment.vectors[ordinal])
+        if vectors and len(vectors) != len(docs):
+            raise ValueError("错误：部分段没有保存向量，无法合并，请重建索引")
+        segments = []
+        if docs:
+            path = os.path.join(self.path, f"segment-{self._next_segment:06d}")
+            self._next_segment += 1
+            _Segment.write(path, docs, [tokenize(text) for text in texts], np.stack(vectors) if vectors else None)
+            segments.append(_Segment(path))
+        self._commit(segments)
+        # 清单已指向新段，旧段目录可以删除；正在使用旧段的查询仍持有已打开的 mmap
+        for segment in old:
+            shutil.rmtree(segment.path, ignore_errors=True)
+
+    def _check_vectors(self, segments):
+        """
+        同一个索引中的段要么都保存向量，要么都不保存，否则合并时向量无法与文档一一对应
+
+        异常:
+            ValueError: 已有的段与当前的 embedding_fn 不一致
+        """
+        if not segments:
+            if self.embedding_fn is None:
+                self.dim = None
+            return
+        if (self.embedding_fn is None) != (self.dim is None):
+            state = "没有向量" if self.dim is None else "已有向量"
+            raise ValueError(f"错误：索引中的分块{state}，与当前的 embedding_fn 不一致，请重建索引")
+
+    def _encode(self, texts):
+        if self.embedding_fn is None:
+            return None
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self.embedding_fn.encode_documents(texts[start:start + self.batch_size]))
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"错误：向量维度 {vectors.shape[1]} 与索引的维度 {self.dim} 不一致，请重建索引")
+        return vectors
+
+    def _commit(self, segments):
+        """原子地写入清单，然后切换到新的段列表"""
+        manifest = {
+            "next_segment": self._next_segment,
+            "dim": self.dim,
+            "segments": [
+                {"name": segment.name, "deleted": np.flatnonzero(~segment.live).tolist()}
+                for segment in segments
+            ],
+        }
+        manifest_path = os.path.join(self.path, MANIFEST)
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        # 一次赋值替换整个快照，查询线程总是读到一致的段列表和统计量
+        self._snapshot = _Snapshot.build(segments)
+
+    # ---- 查询 ----
+
+    def search(self, query, limit=5, mode="hybrid", candidates=50):
+        """
+        检索与问题最相关的分块
+
+        参数:
+            query (str): 问题
+            limit (int): 返回的结果数量
+            mode (str): "hybrid"、"bm25" 或 "dense"；没有嵌入函数时 hybrid 退化为 bm25
+            candidates (int): 融合前 BM25 和向量检索各自保留的候选数量
+
+        返回:
+            list[SearchHit]: 按相关度从高到低排列的结果
+        """
+        if mode not in ("hybrid", "bm25", "dense"):
+            raise ValueError(f"mode 必须是 hybrid、bm25 或 dense: {mode}")
+        if mode == "dense" and self.embedding_fn is None:
+            raise ValueError("错误：没有嵌入函数，无法进行向量检索")
+        snapshot = self._snapshot
+        segments = snapshot.segments
+        if mode == "hybrid" and self.embedding_fn is None:
+            mode = "bm25"
+
+        bm25 = self._bm25(snapshot, query, limit if mode == "bm25" else candidates) if mode != "dense" else []
+        dense = self._dense(segments, query, limit if mode == "dense" else candidates) if mode != "bm25" else []
+        if mode != "hybrid":
+            ranked = bm25 or dense
+            return [self._hit(segments, key, score, mode, rank) for rank, (key, score) in enumerate(ranked, 1)]
+
+        fused = {}
+        ranks = {}
+        for kind, results in (("bm25", bm25), ("dense", dense)):
+            for rank, (key, _) in enumerate(results, 1):
+                fused[key] = fused.get(key, 0.0) + 1.0 / (self.rrf_k + rank)
+                ranks.setdefault(key, {})[kind] = rank
+        top = sorted(fused.items(), key=lambda item: -item[1])[:limit]
+        hits = []
+        for key, score in top:
+            hit = self._hit(segments, key, score)
+            hit.bm25_rank = ranks[key].get("bm25")
+            hit.dense_rank = ranks[key].get("dense")
+            hits.append(hit)
+        return hits
+
+    def _bm25(self, snapshot, query, limit):
+        """返回 [((段序号, 文档序号), 分数)]，按分数从高到低"""
+        terms = Counter(tokenize(query))
+        if not terms or not snapshot.documents:
+            return []
+        segments = snapshot.segments
+        # 与文档频率一致，文档总数也包含尚未合并清除的已删除分块，保证 idf 为正
+        n = sum(len(segment) for segment in segments)
+        idf = {}
+        for term in terms:
+            df = sum(segment.df(term) for segment in segments)
+            if df:
+                idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        results = []
+        for index, segment in enumerate(segments):
+            scores = np.zeros(len(segment), dtype=np.float32)
+            # 文档长度归一化项对每个文档只计算一次
+            norm = self.k1 * (1 - self.b + self.b * segment.lengths / snapshot.average_length)
+            for term, weight in idf.items():
+                found = segment.posting(term)
+                if found is None:
+                    continue
+                docs, freqs = found
+                tf = freqs.astype(np.float32)
+                # 同一词项的倒排表中文档号不重复，可以直接按下标累加
+                scores[docs] += terms[term] * weight * tf * (self.k1 + 1) / (tf + norm[docs])
+            scores[~segment.live] = 0.0
+            results.extend(((index, int(i)), float(scores[i])) for i in _top(scores, limit) if scores[i] > 0)
+        results.sort(key=lambda item: -item[1])
+        return results[:limit]
+
+    def _dense(self, segments, query, limit):
+        vector = np.asarray(self.embedding_fn.encode_queries([query])[0], dtype=np.float32)
+        results = []
+        for index, segment in enumerate(segments):
+            if segment.vectors is None or not segment.live.any():
+                continue
+            scores = segment.vectors @ vector  # 内积距离，与 Milvus 入库时的 metric_type 一致
+            scores[~segment.live] = -np.inf
+            results.extend(((index, int(i)), float(scores[i])) for i in _top(scores, limit) if segment.live[i])
+        results.sort(key=lambda item: -item[1])
+        return results[:limit]
+
+    @staticmethod
+    def _hit(segments, key, score, mode=None, rank=None):
+        doc = segments[key[0]].docs[key[1]]
+        hit = SearchHit(doc["id"], doc["source"], doc["text"], doc["headings"], score)
+        if mode == "bm25":
+            hit.bm25_rank = rank
+        elif mode == "dense":
+            hit.dense_rank = rank
+        return hit
+
+
+class _Doc:
+    """合并段时用已保存的元数据重建检索文本"""
+
+    def __init__(self, doc):
+        self.text = doc["text"]
+        self.headings = doc["headings"]
+
+
+def _top(scores, limit):
+    """分数最高的 limit 个下标，按分数从高到低"""
+    if len(scores) > limit:
+        indexes = np.argpartition(-scores, limit - 1)[:limit]
+    else:
+        indexes = np.arange(len(scores))
+    return indexes[np.argsort(-scores[indexes], kind="stable")]
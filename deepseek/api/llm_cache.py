@@ -0,0 +1,367 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
+
+# 只影响传输方式、不影响模型输出的参数，不参与缓存键的计算
+TRANSPORT_OPTIONS = ("timeout", "extra_headers", "extra_query")
+
+MODES = ("cache", "record", "replay", "off")
+
+
+class ReplayMissError(LookupError):
+    """replay 模式下请求没有对应的录制结果"""
+
+
+def request_key(kwargs):
+    """
+    请求的缓存键: 去掉传输参数后，按键排序序列化请求参数，取 sha256 摘要
+
+    消息中字典键的顺序不影响缓存键；流式与非流式请求的返回格式不同，分别缓存
+    """
+    payload = {key: value for key, value in kwargs.items() if key not in TRANSPORT_OPTIONS}
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _dump(obj):
+    """将 openai 返回的 pydantic 对象转换为可以 JSON 序列化的 dict"""
+    return obj.model_dump(mode="json", exclude_unset=True) if hasattr(obj, "model_dump") else obj
+
+
+@dataclass
+class CallStats:
+    """一次 chat.completions.create 调用的统计信息"""
+    key: str
+    model: str
+    cached: bool
+    stream: bool
+    seconds: float  # 本次调用的耗时，流式调用为读取完全部片段的耗时
+    first_token_seconds: float = None  # 流式调用的首个片段延迟
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    saved_seconds: float = 0.0  # 命中缓存时，录制该结果时的原始耗时
+
+
+class ResponseCache:
+    """
+    SQLite 持久化的模型响应缓存
+
+    非流式响应保存为 ChatCompletion 的 JSON，流式响应保存为全部 chunk 的 JSON 列表。
+    条目超过 ttl 秒视为过期，超过 max_entries 时按最近最少使用的顺序淘汰。
+
+    参数:
+        path (str): SQLite 缓存文件路径，":memory:" 表示仅在进程内缓存
+        ttl (float): 缓存有效期(秒)，None 表示永不过期
+        max_entries (int): 缓存的最大条目数
+    """
+
+    def __init__(self, path, ttl=None, max_entries=10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT,"
+            " payload TEXT NOT NULL,"
+            " seconds REAL NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used)")
+        self._db.commit()
+        # 用递增计数代替时间戳记录访问顺序，避免同一时刻的多次访问无法区分先后
+        (self._clock,) = self._db.execute("SELECT COALESCE(MAX(last_used), 0) FROM responses").fetchone()
+
+    def __len__(self):
+        with self._lock:
+            (size,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        return size
+
+    def get(self, key, ignore_ttl=False):
+        """
+        查找缓存条目
+
+        返回:
+            tuple: (payload, 录制时的耗时秒数)，未命中或已过期时返回 None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT payload, seconds, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            payload, seconds, created = row
+            if not ignore_ttl and self.ttl is not None and time.time() - created > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._clock += 1
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (self._clock, key))
+            self._db.commit()
+        return json.loads(payload), seconds
+
+    def put(self, key, model, payload, seconds):
+        with self._lock:
+            self._clock += 1
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, payload, seconds, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, json.dumps(payload, ensure_ascii=False), seconds, time.time(), self._clock),
+            )
+            (size,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            overflow = size - self.max_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN"
+                    " (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class _CachedClientBase:
+    """同步与异步包装器共用的缓存查找、统计和日志逻辑"""
+
+    def __init__(self, client, path, mode, ttl, max_entries, cache):
+        if mode not in MODES:
+            raise ValueError(f"mode 必须是 {MODES} 之一: {mode}")
+        self._client = client
+        self.mode = mode
+        self.cache = cache if cache is not None else ResponseCache(path, ttl=ttl, max_entries=max_entries)
+        self.calls = []
+        self._lock = threading.Lock()
+        # 与 OpenAI 客户端相同的调用方式: client.chat.completions.create(...)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @property
+    def client(self):
+        # replay 模式不需要真实客户端，只在第一次实际请求时创建，之后所有请求复用同一个连接池
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+
+    def __getattr__(self, name):
+        # 其余属性(例如 models、embeddings)直接转发给底层客户端
+        if name in ("_client", "client"):
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def stats(self):
+        """返回缓存命中、token 用量和耗时的汇总"""
+        with self._lock:
+            calls = list(self.calls)
+        hits = sum(call.cached for call in calls)
+        return {
+            "calls": len(calls),
+            "hits": hits,
+            "misses": len(calls) - hits,
+            "hit_rate": hits / len(calls) if calls else 0.0,
+            "prompt_tokens": sum(call.prompt_tokens for call in calls),
+            "completion_tokens": sum(call.completion_tokens for call in calls),
+            "seconds": sum(call.seconds for call in calls),
+            "saved_seconds": sum(call.saved_seconds for call in calls),
+            "entries": len(self.cache),
+            "evictions": self.cache.evictions,
+        }
+
+    def close(self):
+        self.cache.close()
+
+    def _lookup(self, key):
+        """返回缓存的 (payload, 原始耗时)；需要请求模型时返回 None"""
+        if self.mode in ("record", "off"):
+            return None
+        # 离线回放的录制结果不受有效期限制
+        found = self.cache.get(key, ignore_ttl=self.mode == "replay")
+        if found is None and self.mode == "replay":
+            raise ReplayMissError(f"没有录制该请求的响应: {key}")
+        return found
+
+    def _store(self, key, kwargs, payload, seconds):
+        if self.mode != "off":
+            self.cache.put(key, kwargs.get("model"), payload, seconds)
+
+    def _record(self, key, kwargs, cached, seconds, first_token=None, usage=None, saved_seconds=0.0):
+        usage = usage or {}
+        call = CallStats(
+            key=key,
+            model=kwargs.get("model"),
+            cached=cached,
+            stream=bool(kwargs.get("stream")),
+            seconds=seconds,
+            first_token_seconds=first_token,
+            prompt_tokens=usage.get("prompt_tokens") or 0,
+            completion_tokens=usage.get("completion_tokens") or 0,
+            saved_seconds=saved_seconds,
+        )
+        with self._lock:
+            self.calls.append(call)
+        logger.info(
+            "%s %s: %.3fs，prompt %d tokens，completion %d tokens",
+            "缓存命中" if cached else "请求模型", call.model, seconds, call.prompt_tokens, call.completion_tokens,
+        )
+        return call
+
+    @staticmethod
+    def _chunk_usage(chunks):
+        # stream_options={"include_usage": True} 时最后一个片段带有 usage
+        return next((chunk["usage"] for chunk in reversed(chunks) if chunk.get("usage")), None)
+
+
+class CachedChatClient(_CachedClientBase):
+    """
+    带本地响应缓存的 OpenAI 兼容客户端包装器
+
+    用法与 OpenAI 客户端相同，client.chat.completions.create(...) 按请求参数查找缓存。
+    所有请求复用同一个底层客户端(及其 HTTP 连接池)，每次调用的耗时和 token 用量记录在 calls 中。
+
+    模式:
+        cache: 命中缓存时直接返回，未命中时请求模型并写入缓存(默认)
+        record: 总是请求模型，并用新结果覆盖缓存
+        replay: 只读取缓存，未命中时抛出 ReplayMissError，用于离线测试
+        off: 直接请求模型，不读写缓存，只统计耗时和 token 用量
+
+    流式请求会把模型返回的片段原样转发给调用方，全部读取完毕后写入缓存；
+    命中缓存时按录制的片段重放。提前中断的流不会写入缓存。
+
+    参数:
+        client: openai.OpenAI 实例，None 表示在首次请求时用 DEEPSEEK_API_KEY 创建 DeepSeek 客户端
+        path (str): SQLite 缓存文件路径
+        mode (str): 缓存模式，见上
+        ttl (float): 缓存有效期(秒)，None 表示永不过期；replay 模式忽略有效期
+        max_entries (int): 缓存的最大条目数
+        cache (ResponseCache): 与其他包装器共享的缓存实例，提供时忽略 path、ttl 和 max_entries
+
+    示例:
+        client = CachedChatClient(OpenAI(api_key=api_key, base_url=DEEPSEEK_BASE_URL), "llm_cache.db")
+        response = client.chat.completions.create(model="deepseek-chat", messages=messages)
+    """
+
+    def __init__(self, client=None, path="llm_cache.db", mode="cache", ttl=None, max_entries=10_000, cache=None):
+        super().__init__(client, path, mode, ttl, max_entries, cache)
+
+    @staticmethod
+    def _create_client():
+        from openai import OpenAI
+
+        return OpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), base_url=DEEPSEEK_BASE_URL)
+
+    def create(self, **kwargs):
+        from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+        key = request_key(kwargs)
+        start = time.perf_counter()
+        found = self._lookup(key)
+        if found is not None:
+            payload, original_seconds = found
+            if kwargs.get("stream"):
+                self._record(key, kwargs, True, time.perf_counter() - start, 0.0,
+                             self._chunk_usage(payload), original_seconds)
+                return (ChatCompletionChunk.model_validate(chunk) for chunk in payload)
+            self._record(key, kwargs, True, time.perf_counter() - start,
+                         usage=payload.get("usage"), saved_seconds=original_seconds)
+            return ChatCompletion.model_validate(payload)
+
+        response = self.client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return self._capture(key, kwargs, response, start)
+        payload = _dump(response)
+        seconds = time.perf_counter() - start
+        self._store(key, kwargs, payload, seconds)
+        self._record(key, kwargs, False, seconds, usage=payload.get("usage"))
+        return response
+
+    def _capture(self, key, kwargs, stream, start):
+        """转发流式片段，完整读取后写入缓存"""
+        chunks = []
+        first_token = None
+        with stream:
+            for chunk in stream:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                chunks.append(_dump(chunk))
+                yield chunk
+        seconds = time.perf_counter() - start
+        self._store(key, kwargs, chunks, seconds)
+        self._record(key, kwargs, False, seconds, first_token, self._chunk_usage(chunks))
+
+
+class AsyncCachedChatClient(_CachedClientBase):
+    """
+    CachedChatClient 的异步版本，包装 openai.AsyncOpenAI，用法相同:
+    await client.chat.completions.create(...)，流式响应使用 async for 读取
+
+    参数与 CachedChatClient 相同；两者可以通过 cache 参数共享同一个 ResponseCache
+    """
+
+    def __init__(self, client=None, path="llm_cache.db", mode="cache", ttl=None, max_entries=10_000, cache=None):
+        super().__init__(client, path, mode, ttl, max_entries, cache)
+
+    @staticmethod
+    def _create_client():
+        from openai import AsyncOpenAI
+
+        return AsyncOpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), base_url=DEEPSEEK_BASE_URL)
+
+    async def create(self, **kwargs):
+        from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+        key = request_key(kwargs)
+        start = time.perf_counter()
+        found = self._lookup(key)
+        if found is not None:
+            payload, original_seconds = found
+            if kwargs.get("stream"):
+                self._record(key, kwargs, True, time.perf_counter() - start, 0.0,
+                             self._chunk_usage(payload), original_seconds)
+                return self._replay([ChatCompletionChunk.model_validate(chunk) for chunk in payload])
+            self._record(key, kwargs, True, time.perf_counter() - start,
+                         usage=payload.get("usage"), saved_seconds=original_seconds)
+            return ChatCompletion.model_validate(payload)
+
+        response = await self.client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return self._capture(key, kwargs, response, start)
+        payload = _dump(response)
+        seconds = time.perf_counter() - start
+        self._store(key, kwargs, payload, seconds)
+        self._record(key, kwargs, False, seconds, usage=payload.get("usage"))
+        return response
+
+    @staticmethod
+    async def _replay(chunks):
+        for chunk in chunks:
+            yield chunk
+
+    async def _capture(self, key, kwargs, stream, start):
+        chunks = []
+        first_token = None
+        async with stream:
+            async for chunk in stream:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                chunks.append(_dump(chunk))
+                yield chunk
+        seconds = time.perf_counter() - start
+        self._store(key, kwargs, chunks, seconds)
+        self._record(key, kwargs, False, seconds, first_token, self._chunk_usage(chunks))
@@ -0,0 +1,171 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def echo_responder(body):
+    """默认的应答函数: 回显最后一条用户消息"""
+    last_user = next(
+        (message["content"] for message in reversed(body.get("messages", [])) if message.get("role") == "user"),
+        "",
+    )
+    return {"role": "assistant", "content": f"mock answer: {last_user[:200]}"}
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数量，仅用于填充 usage 字段"""
+    return max(1, len(text or "") // 2)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认的监听队列只有 5，并发请求较多时会出现连接被丢弃后重试的秒级延迟
+    request_queue_size = 128
+
+
+class MockChatServer:
+    """
+    本地的 OpenAI 兼容 chat.completions 模拟服务，用于离线测试和基准测试
+
+    支持普通响应和 stream=True 的 SSE 流式响应，记录收到的全部请求体。
+
+    参数:
+        responder (callable): 接收请求体 dict，返回 assistant 消息 dict
+            (包含 content，可选 tool_calls)；默认回显最后一条用户消息
+        latency (float): 每个请求的模拟延迟(秒)
+        host (str): 监听地址
+        port (int): 监听端口，0 表示自动分配
+
+    示例:
+        with MockChatServer() as server:
+            client = OpenAI(api_key="test", base_url=server.base_url)
+    """
+
+    def __init__(self, responder=echo_responder, latency=0.0, host="127.0.0.1", port=0):
+        self.responder = responder
+        self.latency = latency
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handle(self, body):
+        with self._lock:
+            self.requests.append(body)
+        if self.latency:
+            time.sleep(self.latency)
+        message = dict(self.responder(body))
+        message.setdefault("role", "assistant")
+        message.setdefault("content", None)
+        prompt_tokens = sum(estimate_tokens(str(m.get("content"))) for m in body.get("messages", []))
+        completion_tokens = estimate_tokens(message["content"])
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _stream_events(self, completion):
+        """将完整响应拆分为 chat.completion.chunk 事件"""
+        choice = completion["choices"][0]
+        message = choice["message"]
+        base = {key: completion[key] for key in ("id", "created", "model")}
+        base["object"] = "chat.completion.chunk"
+
+        def chunk(delta, finish_reason=None, **extra):
+            return {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra}
+
+        yield chunk({"role": "assistant", "content": ""})
+        content = message.get("content") or ""
+        # 每次发送若干字符，模拟逐 token 输出
+        for i in range(0, len(content), 4):
+            yield chunk({"content": content[i:i + 4]})
+        for index, call in enumerate(message.get("tool_calls") or []):
+            yield chunk({"tool_calls": [{"index": index, **call}]})
+        yield chunk({}, choice["finish_reason"])
+        yield {**base, "choices": [], "usage": completion["usage"]}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                try:
+                    completion = server._handle(body)
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    for event in server._stream_events(completion):
+                        self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    return
+                payload = json.dumps(completion, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                # 不在终端打印每个请求的访问日志
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容 chat.completions 模拟服务")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的模拟延迟(秒)")
+    args = parser.parse_args()
+
+    server = MockChatServer(latency=args.latency, port=args.port)
+    print(f"模拟服务已启动: {server.base_url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,290 @@
+import re
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+# 近似分词: 每个汉字计为一个 token，连续的字母数字计为一个 token，其余标点各计为一个 token
+TOKEN_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_\u3400-\u9fff\uf900-\ufaff]')
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+FENCE_PATTERN = re.compile(r'^\s*(```|~~~)')
+# 句子以中英文句末标点结尾；英文句点后必须跟空白，避免切开小数和缩写
+# 按空白切分的单词，连同其后的空白；开头的空白单独成为一项，拼接后与原文相同
+WORD_PATTERN = re.compile(r'\s+|\S+\s*')
+SENTENCE_PATTERN = re.compile(r'.+?(?:[。！？；!?;]+[”’」』"\')）]*|\.(?=\s)|\n(?=\s*\n)|$)', re.S)
+
+
+def count_tokens(text):
+    """
+    近似统计文本的 token 数量，不依赖具体模型的分词器
+
+    参数:
+        text (str): 要统计的文本，None 计为 0
+
+    返回:
+        int: 近似 token 数量
+    """
+    return len(TOKEN_PATTERN.findall(text or ""))
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """
+    一个文本分块及其在源文件中的位置
+
+    start / end 为分块首尾在源文件中的字节偏移量，可用于 seek 回原文；
+    headings 为分块所在章节的标题路径，例如 ("中华人民共和国民法典", "（二）物权编")
+    """
+    text: str
+    source: str = ""
+    start: int = 0
+    end: int = 0
+    headings: tuple = field(default=())
+    tokens: int = 0
+
+    def metadata(self):
+        return {
+            "source": self.source,
+            "start": self.start,
+            "end": self.end,
+            "headings": list(self.headings),
+            "tokens": self.tokens,
+        }
+
+
+class _Unit(NamedTuple):
+    """分块的最小组成单位: 标题、段落或句子"""
+    text: str
+    start: int
+    end: int
+    tokens: int
+    joiner: str  # 与前一个单位之间的连接符，同一段落内的句子为空串
+    heading: bool = False
+
+
+class MarkdownChunker:
+    """
+    结构感知的流式分块器，适用于 markdown 和纯文本
+
+    按行流式读取输入，先按标题切分章节，章节内以段落为单位累积到 target_tokens，
+    超过 max_tokens 的段落按句子切分，超长句子再按长度硬切分。
+    相邻分块之间保留不超过 overlap_tokens 的重叠内容，但不跨越章节。
+    任意时刻只在内存中保留当前分块和当前段落，可以处理远大于内存的语料。
+
+    参数:
+        target_tokens (int): 分块的目标 token 数，累积超过该值时开始新的分块
+        max_tokens (int): 分块的最大 token 数
+        overlap_tokens (int): 相邻分块之间的最大重叠 token 数
+        token_counter (callable): token 计数函数，默认使用近似计数 count_tokens
+        markdown (bool): 是否识别 markdown 标题和代码块，纯文本请设为 False
+    """
+
+    def __init__(self, target_tokens=256, max_tokens=512, overlap_tokens=32,
+                 token_counter=count_tokens, markdown=True):
+        if not 0 < target_tokens <= max_tokens:
+            raise ValueError("必须满足 0 < target_tokens <= max_tokens")
+        if not 0 <= overlap_tokens < target_tokens:
+            raise ValueError("必须满足 0 <= overlap_tokens < target_tokens")
+        self.target_tokens = target_tokens
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.token_counter = token_counter
+        self.markdown = markdown
+        # 单个段落在内存中的最大字符数，超过后按同一段落的后续部分继续处理
+        self.paragraph_limit = max_tokens * 8
+
+    def __call__(self, lines, source=""):
+        return self.chunk_lines(lines, source)
+
+    def chunk_file(self, path, encoding="utf-8"):
+        """流式读取文件并分块，source 为文件路径"""
+        with open(path, "r", encoding=encoding, newline="") as file:
+            yield from self.chunk_lines(file, source=str(path), encoding=encoding)
+
+    def chunk_text(self, text, source=""):
+        """对内存中的字符串分块"""
+        return self.chunk_lines(text.splitlines(keepends=True), source)
+
+    def chunk_lines(self, lines, source="", encoding="utf-8"):
+        """
+        对按行迭代的文本分块
+
+        参数:
+            lines (Iterable[str]): 保留换行符的文本行，例如打开的文件对象
+            source (str): 来源标识，写入每个分块的元数据
+            encoding (str): 计算字节偏移量所用的编码
+
+        返回:
+            Iterator[Chunk]: 分块生成器
+        """
+        headings = []
+        units = []
+        tokens = 0
+        fresh = 0  # 当前分块中除标题和重叠内容以外的单位数量
+
+        def emit():
+            text = units[0].text + "".join(unit.joiner + unit.text for unit in units[1:])
+            path = tuple(title for title in headings if title)
+            return Chunk(text, source, units[0].start, units[-1].end, path, tokens)
+
+        for block in self._blocks(lines, encoding):
+            if not isinstance(block, _Unit):
+                # 遇到标题时结束当前分块；只有标题而没有正文的分块直接丢弃
+                level, title, unit = block
+                if fresh:
+                    yield emit()
+                del headings[level - 1:]
+                headings.extend([""] * (level - 1 - len(headings)))
+                headings.append(title)
+                units, tokens, fresh = [unit], unit.tokens, 0
+                continue
+
+            for unit in self._split(block, encoding):
+                if fresh and tokens + unit.tokens > self.target_tokens:
+                    yield emit()
+                    units = self._overlap(units)
+                    tokens, fresh = sum(u.tokens for u in units), 0
+                # 重叠内容和标题加上新单位超过上限时，从最早的单位开始丢弃
+                while units and tokens + unit.tokens > self.max_tokens:
+                    tokens -= units.pop(0).tokens
+                if not units:
+                    unit = unit._replace(joiner="")
+                units.append(unit)
+                tokens += unit.tokens
+                fresh += 1
+
+        if fresh:
+            yield emit()
+
+    def _overlap(self, units):
+        """取当前分块末尾不超过 overlap_tokens 的正文单位，作为下一个分块的开头"""
+        carried = []
+        budget = self.overlap_tokens
+        for unit in reversed(units):
+            if unit.heading or unit.tokens > budget:
+                break
+            carried.append(unit)
+            budget -= unit.tokens
+        carried.reverse()
+        if carried:
+            carried[0] = carried[0]._replace(joiner="")
+        return carried
+
+    def _blocks(self, lines, encoding):
+        """
+        将文本行组合为标题和段落
+
+        标题以 (级别, 标题文本, _Unit) 元组返回，段落以 _Unit 返回
+        """
+        offset = 0
+        paragraph = []
+        paragraph_start = 0
+        paragraph_chars = 0
+        continued = None  # 超长段落的后续部分与前一部分之间被去掉的空白，None 表示新段落
+        in_fence = False
+
+        def flush_paragraph():
+            raw = "".join(paragraph)
+            text = raw.rstrip()
+            start = paragraph_start
+            end = start + len(text.encode(encoding))
+            joiner = "\n\n" if continued is None else continued
+            return _Unit(text, start, end, 0, joiner), raw[len(text):]
+
+        for line in lines:
+            size = len(line.encode(encoding))
+            stripped = line.strip()
+            if self.markdown and FENCE_PATTERN.match(line):
+                in_fence = not in_fence
+            heading = None
+            if self.markdown and not in_fence:
+                heading = HEADING_PATTERN.match(line)
+
+            if heading or (not stripped and not in_fence):
+                if paragraph:
+                    yield flush_paragraph()[0]
+                    paragraph, paragraph_chars, continued = [], 0, None
+                if heading:
+                    title = heading.group(2)
+                    text = line.rstrip()
+                    unit = _Unit(text, offset, offset + len(text.encode(encoding)),
+                                 self.token_counter(text), "\n\n", heading=True)
+                    yield len(heading.group(1)), title, unit
+                offset += size
+                continue
+
+            if not paragraph:
+                paragraph_start = offset
+                if not in_fence:
+                    # 段落的起始位置跳过行首空白；后续部分把跳过的空白并入连接符，避免单词粘连
+                    indent = line[:len(line) - len(line.lstrip())]
+                    paragraph_start += len(indent.encode(encoding))
+                    line = line.lstrip()
+                    if continued is not None:
+                        continued += indent
+            paragraph.append(line)
+            paragraph_chars += len(line)
+            offset += size
+            # 超长段落分段处理，保证内存占用有上限
+            if paragraph_chars >= self.paragraph_limit:
+                unit, continued = flush_paragraph()
+                yield unit
+                paragraph, paragraph_chars = [], 0
+                paragraph_start = offset
+
+        if paragraph:
+            yield flush_paragraph()[0]
+
+    def _split(self, unit, encoding):
+        """段落不超过 max_tokens 时原样返回，否则按句子切分，超长句子再按长度硬切分"""
+        if not unit.text:
+            return
+        tokens = self.token_counter(unit.text)
+        if tokens <= self.max_tokens:
+            yield unit._replace(tokens=tokens)
+            return
+
+        start = unit.start
+        joiner = unit.joiner
+        for sentence in SENTENCE_PATTERN.findall(unit.text):
+            for piece in self._hard_split(sentence):
+                size = len(piece.encode(encoding))
+                if piece.strip():
+                    yield _Unit(piece, start, start + size, self.token_counter(piece), joiner)
+                    joiner = ""
+                start += size
+
+    def _hard_split(self, sentence):
+        """超长句子在空白处切分，单词保持完整；每段都用 token_counter 校验不超过 max_tokens"""
+        if self.token_counter(sentence) <= self.max_tokens:
+            yield sentence
+            return
+        piece = ""
+        for word in WORD_PATTERN.findall(sentence):
+            if piece and self.token_counter(piece + word) > self.max_tokens:
+                yield piece
+                piece = ""
+            if self.token_counter(word) > self.max_tokens:
+                # 没有空白的超长片段(例如不含标点的中文长句)只能按字符切分
+                yield from self._split_chars(word)
+            else:
+                piece += word
+        if piece:
+            yield piece
+
+    def _split_chars(self, text):
+        """按字符切分，每段取 token_counter 计数不超过 max_tokens 的最长前缀(按倍增和二分查找)"""
+        start = 0
+        while start < len(text):
+            low, high = start + 1, start + 1
+            while high < len(text) and self.token_counter(text[start:high]) <= self.max_tokens:
+                low, high = high, min(len(text), start + 2 * (high - start))
+            if self.token_counter(text[start:high]) <= self.max_tokens:
+                low = high
+            # 此时 text[start:low] 不超限；在 (low, high) 之间二分查找最长的不超限前缀
+            while high - low > 1:
+                middle = (low + high) // 2
+                if self.token_counter(text[start:middle]) <= self.max_tokens:
+                    low = middle
+                else:
+                    high = middle
+            yield text[start:low]
+            start = low
@@ -0,0 +1,256 @@
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass
+from itertools import islice
+
+# 主键为内容哈希(sha256 十六进制)，长度固定为 64
+ID_MAX_LENGTH = 64
+
+
+def split_markdown(lines):
+    """
+    与教程中的 file_text.split("# ") 保持一致的默认分块方式，并丢弃空白分块
+
+    lines 可以是字符串或按行迭代的文本(例如打开的文件对象)。分隔符 "# " 不会跨行，
+    因此逐行切分与整体切分的结果相同，内存中只保留当前分块
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines(keepends=True)
+    chunk = []
+    for line in lines:
+        if "# " not in line:
+            chunk.append(line)
+            continue
+        head, *parts = line.split("# ")
+        chunk.append(head)
+        for part in parts:
+            text = "".join(chunk)
+            if text.strip():
+                yield text
+            chunk = [part]
+    text = "".join(chunk)
+    if text.strip():
+        yield text
+
+
+def chunk_id(source, text):
+    """
+    根据来源和分块内容计算分块主键
+
+    同一来源中内容未变化的分块主键保持不变，因此无需重新编码；
+    来源参与哈希，避免不同文件中的相同段落互相覆盖
+    """
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+
+def batched(iterable, size):
+    """将可迭代对象按 size 切分为列表，只在内存中保留一个批次"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+@dataclass
+class IngestStats:
+    """一次同步的统计信息"""
+    added: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    seconds: float = 0.0
+
+    def __add__(self, other):
+        return IngestStats(
+            self.added + other.added,
+            self.unchanged + other.unchanged,
+            self.deleted + other.deleted,
+            self.seconds + other.seconds,
+        )
+
+
+class IncrementalIngestor:
+    """
+    基于内容哈希的增量入库管道
+
+    每个分块以 chunk_id 作为 Milvus 主键，本地 SQLite 清单记录每个来源当前包含的分块。
+    重新入库时只对新增或修改的分块调用 encode_documents 并 upsert，
+    已删除分块的向量会从 Milvus 中删除，未变化的分块不做任何计算。
+    分块、编码和写入均按批次流式进行，内存占用与语料规模无关。
+    collection 被删除后，清单中该 collection 的记录随之失效，下次入库时全部重新写入。
+
+    参数:
+        milvus_client: pymilvus.MilvusClient 实例
+        embedding_fn: 提供 encode_documents(list[str]) 的嵌入函数，例如 DefaultEmbeddingFunction
+        collection_name (str): collection 名称
+        manifest_path (str): 本地清单文件路径
+        batch_size (int): 每批编码和写入的分块数量
+        chunker (callable): 分块函数，接收按行迭代的文本(例如打开的文件对象)，
+            返回字符串或带 text 属性的分块(例如 rag_chunker.Chunk)
+    """
+
+    def __init__(self, milvus_client, embedding_fn, collection_name, manifest_path,
+                 batch_size=64, chunker=split_markdown):
+        self.milvus_client = milvus_client
+        self.embedding_fn = embedding_fn
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.chunker = chunker
+        self.manifest = sqlite3.connect(manifest_path)
+        self.manifest.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " collection TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " source TEXT NOT NULL,"
+            " generation TEXT NOT NULL,"
+            " PRIMARY KEY (collection, id))"
+        )
+        self.manifest.execute(
+            "CREATE INDEX IF NOT EXISTS chunks_source ON chunks (collection, source, generation)"
+        )
+        self.manifest.commit()
+
+    def close(self):
+        self.manifest.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def ensure_collection(self, dimension):
+        """collection 不存在时创建，主键为字符串类型的内容哈希"""
+        if self.milvus_client.has_collection(self.collection_name):
+            return
+        self.milvus_client.create_collection(
+            collection_name=self.collection_name,
+            dimension=dimension,
+            id_type="string",
+            max_length=ID_MAX_LENGTH,
+            metric_type="IP",  # 内积距离，与教程保持一致
+            consistency_level="Strong",
+        )
+
+    def sources(self):
+        """返回清单中已入库的全部来源"""
+        rows = self.manifest.execute(
+            "SELECT DISTINCT source FROM chunks WHERE collection = ?", (self.collection_name,)
+        )
+        return [source for (source,) in rows]
+
+    def ingest_chunks(self, source, chunks):
+        """
+        将某个来源的全部分块与清单比对并增量写入 Milvus
+
+        参数:
+            source (str): 来源标识，通常为文件路径
+            chunks (Iterable[str | Chunk]): 该来源当前的全部分块，可以是生成器
+
+        返回:
+            IngestStats: 本次新增、未变化和删除的分块数量
+        """
+        start = time.perf_counter()
+        stats = IngestStats()
+        self._reset_if_dropped()
+        # 本次同步的代号，凡是未被打上该代号的旧分块即为已删除的分块
+        generation = uuid.uuid4().hex
+
+        for batch in batched(chunks, self.batch_size):
+            # 同一批次内的重复分块只保留一份
+            texts = [getattr(chunk, "text", chunk) for chunk in batch]
+            pending = {chunk_id(source, text): text for text in texts}
+            existing = self._mark_existing(list(pending), generation)
+            stats.unchanged += len(existing)
+            new_chunks = {cid: text for cid, text in pending.items() if cid not in existing}
+            if new_chunks:
+                self._upsert(source, new_chunks, generation)
+                stats.added += len(new_chunks)
+
+        stats.deleted = self._delete_stale(source, generation)
+        self.manifest.commit()
+        stats.seconds = time.perf_counter() - start
+        return stats
+
+    def ingest_file(self, path, source=None, encoding="utf-8"):
+        """流式读取文件，分块后增量入库"""
+        with open(path, "r", encoding=encoding) as file:
+            return self.ingest_chunks(source or path, self.chunker(file))
+
+    def remove_source(self, source):
+        """删除某个来源的全部分块"""
+        self._reset_if_dropped()
+        deleted = self._delete_stale(source, generation=None)
+        self.manifest.commit()
+        return deleted
+
+    def sync(self, paths):
+        """
+        同步一组文件: 增量入库每个文件，并删除清单中已不在 paths 里的来源
+
+        返回:
+            IngestStats: 所有文件的统计信息之和
+        """
+        start = time.perf_counter()
+        total = IngestStats()
+        paths = [os.fspath(path) for path in paths]
+        for path in paths:
+            total += self.ingest_file(path)
+        for source in set(self.sources()) - set(paths):
+            total.deleted += self.remove_source(source)
+        total.seconds = time.perf_counter() - start
+        return total
+
+    def _reset_if_dropped(self):
+        """collection 不存在时(例如被 drop_collection 删除)清空清单，避免把分块误判为未变化"""
+        if not self.milvus_client.has_collection(self.collection_name):
+            self.manifest.execute("DELETE FROM chunks WHERE collection = ?", (self.collection_name,))
+
+    def _mark_existing(self, ids, generation):
+        """将已在清单中的分块打上本次同步的代号，并返回这些分块的主键集合"""
+        placeholders = ",".join("?" * len(ids))
+        rows = self.manifest.execute(
+            f"SELECT id FROM chunks WHERE collection = ? AND id IN ({placeholders})",
+            (self.collection_name, *ids),
+        )
+        existing = {cid for (cid,) in rows}
+        if existing:
+            self.manifest.executemany(
+                "UPDATE chunks SET generation = ? WHERE collection = ? AND id = ?",
+                [(generation, self.collection_name, cid) for cid in existing],
+            )
+        return existing
+
+    def _upsert(self, source, new_chunks, generation):
+        ids = list(new_chunks)
+        texts = list(new_chunks.values())
+        vectors = self.embedding_fn.encode_documents(texts)
+        self.ensure_collection(len(vectors[0]))
+        self.milvus_client.upsert(
+            collection_name=self.collection_name,
+            data=[
+                {"id": cid, "vector": vector, "text": text, "source": source}
+                for cid, text, vector in zip(ids, texts, vectors)
+            ],
+        )
+        self.manifest.executemany(
+            "INSERT OR REPLACE INTO chunks (collection, id, source, generation) VALUES (?, ?, ?, ?)",
+            [(self.collection_name, cid, source, generation) for cid in ids],
+        )
+
+    def _delete_stale(self, source, generation):
+        """删除某个来源中代号不等于 generation 的分块，generation 为 None 时删除全部"""
+        cursor = self.manifest.execute(
+            "SELECT id FROM chunks WHERE collection = ? AND source = ? AND generation IS NOT ?",
+            (self.collection_name, source, generation),
+        )
+        deleted = 0
+        while batch := [cid for (cid,) in cursor.fetchmany(self.batch_size)]:
+            self.milvus_client.delete(collection_name=self.collection_name, ids=batch)
+            deleted += len(batch)
+        self.manifest.execute(
+            "DELETE FROM chunks WHERE collection = ? AND source = ? AND generation IS NOT ?",
+            (self.collection_name, source, generation),
+        )
+        return deleted
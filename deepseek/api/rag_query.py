@@ -0,0 +1,258 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from rate_limiter import RateLimiter
+
+SYSTEM_PROMPT = """
+Human: 你是一个 AI 助手。你能够从提供的上下文段落片段中找到问题的答案。
+"""
+
+USER_PROMPT_TEMPLATE = """
+请使用以下用 <context> 标签括起来的信息片段来回答用 <question> 标签括起来的问题。
+<context>
+{context}
+</context>
+<question>
+{question}
+</question>
+"""
+
+
+def normalize_question(question):
+    """精确匹配缓存的键: 去掉首尾空白并合并连续空白"""
+    return " ".join(question.split())
+
+
+class AnswerCache:
+    """
+    问答缓存，先按规范化后的问题精确匹配，再按问题向量的相似度匹配
+
+    参数:
+        similarity_threshold (float): 相似度匹配的阈值(内积)，None 表示只做精确匹配
+        max_entries (int): 最大缓存条目数，超出后淘汰最久未使用的条目
+    """
+
+    def __init__(self, similarity_threshold=0.95, max_entries=10_000):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # 规范化问题 -> (问题向量, RagAnswer)，顺序即 LRU 顺序
+        # (问题列表, 向量矩阵) 同时构建、同时失效，第 i 行始终对应第 i 个问题；
+        # 命中时 move_to_end 只调整 _entries 的 LRU 顺序，不影响这里的行号
+        self._index = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_exact(self, question):
+        key = normalize_question(question)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][1]
+        return None
+
+    def get_similar(self, vectors):
+        """
+        为每个问题向量查找相似度最高的缓存问题
+
+        返回:
+            list[RagAnswer | None]: 相似度达到阈值时返回缓存的回答，否则为 None
+        """
+        if self.similarity_threshold is None or not vectors:
+            return [None] * len(vectors)
+        with self._lock:
+            if not self._entries:
+                return [None] * len(vectors)
+            if self._index is None:
+                keys = list(self._entries)
+                self._index = (keys, np.stack([self._entries[key][0] for key in keys]))
+            keys, matrix = self._index
+            scores = np.asarray(vectors, dtype=np.float32) @ matrix.T
+            results = []
+            for row in scores:
+                best = int(np.argmax(row))
+                if row[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(keys[best])
+                    results.append(self._entries[keys[best]][1])
+                else:
+                    results.append(None)
+            return results
+
+    def put(self, question, vector, answer):
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = (np.asarray(vector, dtype=np.float32), answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._index = None
+
+
+@dataclass
+class RagAnswer:
+    """一个问题的回答"""
+    question: str
+    answer: str
+    contexts: list = field(default_factory=list)
+    cached: str = None  # "exact" / "similar" 表示命中缓存，None 表示调用了 LLM
+    seconds: float = 0.0
+    error: str = None  # LLM 调用失败时的错误信息，此时 answer 为 None
+
+
+class RagQueryService:
+    """
+    批量、并发的 RAG 问答服务
+
+    一批问题只做一次 encode_queries 和一次 milvus_client.search，
+    检索结果按文本去重后拼接为上下文，LLM 调用在线程池中并发执行并受限流器约束。
+    精确匹配或相似问题命中缓存时直接返回缓存的回答，不再调用 LLM。
+
+    参数:
+        milvus_client: pymilvus.MilvusClient 实例
+        embedding_fn: 提供 encode_queries 的嵌入函数
+        llm_client: OpenAI 兼容的客户端，例如 OpenAI(base_url="https://api.deepseek.com/v1")
+        collection_name (str): collection 名称
+        model (str): 模型名称
+        limit (int): 每个问题检索的分块数量
+        max_concurrency (int): 同时进行的 LLM 请求数量上限
+        requests_per_second (float): LLM 请求速率上限，None 表示不限速
+        burst (int): 限速时允许的最大突发请求数，与 max_concurrency 相互独立
+        answer_cache (AnswerCache): 问答缓存，None 表示不缓存
+    """
+
+    def __init__(self, milvus_client, embedding_fn, llm_client, collection_name,
+                 model="deepseek-chat", limit=3, max_concurrency=8, requests_per_second=None,
+                 burst=1, answer_cache=None):
+        self.milvus_client = milvus_client
+        self.embedding_fn = embedding_fn
+        self.llm_client = llm_client
+        self.collection_name = collection_name
+        self.model = model
+        self.limit = limit
+        self.answer_cache = answer_cache
+        self.rate_limiter = RateLimiter(requests_per_second, burst=burst) if requests_per_second else None
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def answer(self, question):
+        return self.answer_batch([question])[0]
+
+    def answer_batch(self, questions):
+        """
+        回答一批问题
+
+        参数:
+            questions (list[str]): 问题列表
+
+        返回:
+            list[RagAnswer]: 与 questions 顺序一致的回答；单个问题的 LLM 调用失败时，
+                该问题的 error 记录错误信息，不影响其他问题，也不写入缓存
+        """
+        start = time.perf_counter()
+        results = [None] * len(questions)
+        cache = self.answer_cache
+
+        # 1. 精确匹配缓存；同一批次中重复的问题只处理一次
+        pending = {}
+        for i, question in enumerate(questions):
+            cached = cache.get_exact(question) if cache is not None else None
+            if cached is not None:
+                results[i] = self._from_cache(question, cached, "exact", start)
+            else:
+                pending.setdefault(normalize_question(question), []).append(i)
+        if not pending:
+            return results
+
+        # 2. 一次性编码全部未命中的问题，并按相似度匹配缓存
+        unique_questions = [questions[indexes[0]] for indexes in pending.values()]
+        vectors = self.embedding_fn.encode_queries(unique_questions)
+        similar = cache.get_similar(vectors) if cache is not None else [None] * len(vectors)
+        to_ask = []
+        for question, vector, cached in zip(unique_questions, vectors, similar):
+            indexes = pending[normalize_question(question)]
+            if cached is not None:
+                for i in indexes:
+                    results[i] = self._from_cache(questions[i], cached, "similar", start)
+            else:
+                to_ask.append((question, vector, indexes))
+        if not to_ask:
+            return results
+
+        # 3. 一次向量检索覆盖全部问题
+        contexts = self.retrieve([vector for _, vector, _ in to_ask])
+
+        # 4. 并发调用 LLM
+        futures = [
+            self._executor.submit(self._complete, question, context)
+            for (question, _, _), context in zip(to_ask, contexts)
+        ]
+        for (question, vector, indexes), context, future in zip(to_ask, contexts, futures):
+            try:
+                answer = RagAnswer(question, future.result(), context, None, time.perf_counter() - start)
+            except Exception as e:
+                answer = RagAnswer(question, None, context, None, time.perf_counter() - start,
+                                   f"错误：调用模型失败: {e}")
+            else:
+                if cache is not None:
+                    cache.put(question, vector, answer)
+            for i in indexes:
+                results[i] = answer if questions[i] == question else RagAnswer(
+                    questions[i], answer.answer, context, None, answer.seconds, answer.error
+                )
+        return results
+
+    def retrieve(self, vectors):
+        """
+        对一批问题向量做一次检索，返回每个问题去重后的上下文文本列表
+        """
+        search_res = self.milvus_client.search(
+            collection_name=self.collection_name,
+            data=vectors,
+            limit=self.limit,
+            search_params={"metric_type": "IP", "params": {}},  # 内积距离
+            output_fields=["text"],
+        )
+        contexts = []
+        for hits in search_res:
+            seen = set()
+            lines = []
+            for hit in hits:
+                text = hit["entity"]["text"]
+                if text.strip() not in seen:
+                    seen.add(text.strip())
+                    lines.append(text)
+            contexts.append(lines)
+        return contexts
+
+    def build_messages(self, question, context):
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": USER_PROMPT_TEMPLATE.format(context="\n".join(context), question=question)},
+        ]
+
+    def _complete(self, question, context):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        response = self.llm_client.chat.completions.create(
+            model=self.model,
+            messages=self.build_messages(question, context),
+        )
+        return response.choices[0].message.content
+
+    @staticmethod
+    def _from_cache(question, cached, kind, start):
+        return RagAnswer(question, cached.answer, cached.contexts, kind, time.perf_counter() - start)
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    令牌桶: 以 rate 的速度补充令牌，最多积攒 burst 个
+
+    只负责计数，不做等待和加锁，由 RateLimiter / AsyncRateLimiter 在各自的锁内调用
+
+    参数:
+        rate (float): 每秒允许的请求数
+        burst (int): 允许的最大突发请求数，与并发数无关
+    """
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0 or burst < 1:
+            raise ValueError("错误：rate 必须大于 0，burst 必须至少为 1")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def take(self):
+        """尝试取出一个令牌，成功返回 0，否则返回还需等待的秒数"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class RateLimiter(TokenBucket):
+    """线程安全的令牌桶限流器"""
+
+    def __init__(self, rate, burst=1):
+        super().__init__(rate, burst)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self._lock:
+                wait = self.take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class AsyncRateLimiter(TokenBucket):
+    """asyncio 令牌桶限流器，所有并发任务共享"""
+
+    def __init__(self, rate, burst=1):
+        super().__init__(rate, burst)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """获取一个令牌，令牌不足时让出事件循环等待"""
+        async with self._lock:
+            while wait := self.take():
+                await asyncio.sleep(wait)
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from embedding_cache import CachedEmbeddingFunction
+
+
+class CountingEmbedding:
+    """记录每次调用所编码文本的嵌入函数，查询与文档的向量不同"""
+
+    model_name = "counting-model"
+    dim = 4
+
+    def __init__(self):
+        self.calls = []
+
+    def encode_queries(self, texts):
+        self.calls.append(("query", list(texts)))
+        return [np.full(self.dim, len(text), dtype=np.float64) for text in texts]
+
+    def encode_documents(self, texts):
+        self.calls.append(("document", list(texts)))
+        return [np.full(self.dim, -len(text), dtype=np.float64) for text in texts]
+
+
+class TestCachedEmbeddingFunction(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "embeddings.db")
+        self.model = CountingEmbedding()
+        self.cache = CachedEmbeddingFunction(self.model, self.path)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_only_misses_are_encoded(self):
+        """只有未命中的文本会交给模型，且同一批次内去重"""
+        self.cache.encode_queries(["This is a test"])
+        vectors = self.cache.encode_queries(["This is a test", "That is a test", "That is a test"])
+        self.assertEqual(self.model.calls, [
+            ("query", ["This is a test"]),
+            ("query", ["That is a test"]),
+        ])
+        self.assertEqual(len(vectors), 3)
+        np.testing.assert_array_equal(vectors[1], vectors[2])
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 3)
+
+    def test_vectors_are_float32(self):
+        """缓存命中和未命中返回的向量均为 float32，数值一致"""
+        first = self.cache.encode_documents(["文本"])[0]
+        second = self.cache.encode_documents(["文本"])[0]
+        self.assertEqual(first.dtype, np.float32)
+        self.assertEqual(second.dtype, np.float32)
+        np.testing.assert_array_equal(first, second)
+
+    def test_vectors_are_writable_copies(self):
+        """返回的向量可以原地修改，且不影响缓存和同批次的其他结果"""
+        self.cache.encode_documents(["文本"])
+        first, second = self.cache.encode_documents(["文本", "文本"])
+        self.assertTrue(first.flags.writeable)
+        first /= 2
+        np.testing.assert_array_equal(second, self.cache.encode_documents(["文本"])[0])
+        self.assertFalse(np.array_equal(first, second))
+
+    def test_queries_and_documents_are_cached_separately(self):
+        """查询和文档的向量分别缓存"""
+        query = self.cache.encode_queries(["相同文本"])[0]
+        document = self.cache.encode_documents(["相同文本"])[0]
+        self.assertFalse(np.array_equal(query, document))
+        self.assertEqual(len(self.model.calls), 2)
+
+    def test_cache_persists_across_instances(self):
+        """缓存写入磁盘，新实例可以直接命中"""
+        self.cache.encode_documents(["持久化"])
+        self.cache.close()
+        self.cache = CachedEmbeddingFunction(self.model, self.path)
+        self.model.calls.clear()
+        self.cache.encode_documents(["持久化"])
+        self.assertEqual(self.model.calls, [])
+        self.assertEqual(self.cache.stats()["hit_rate"], 1.0)
+
+    def test_model_id_is_part_of_key(self):
+        """不同模型标识之间互不命中"""
+        self.cache.encode_documents(["文本"])
+        other = CachedEmbeddingFunction(self.model, self.path, model_id="other-model")
+        try:
+            other.encode_documents(["文本"])
+        finally:
+            other.close()
+        self.assertEqual(len(self.model.calls), 2)
+
+    def test_lru_eviction(self):
+        """超过容量时淘汰最近最少使用的条目"""
+        self.cache.close()
+        self.cache = CachedEmbeddingFunction(self.model, self.path, max_entries=2)
+        self.cache.encode_documents(["a"])
+        self.cache.encode_documents(["b"])
+        self.cache.encode_documents(["a"])  # a 成为最近使用的条目
+        self.cache.encode_documents(["c"])  # 淘汰 b
+        self.model.calls.clear()
+
+        self.cache.encode_documents(["a", "c"])
+        self.assertEqual(self.model.calls, [])
+        self.cache.encode_documents(["b"])
+        self.assertEqual(self.model.calls, [("document", ["b"])])
+        stats = self.cache.stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["evictions"], 2)
+
+    def test_attributes_are_forwarded(self):
+        """dim 等属性转发给底层嵌入函数"""
+        self.assertEqual(self.cache.dim, 4)
+        self.assertEqual(self.cache.model_name, "counting-model")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,257 @@
+import math
+import os
+import re
+import tempfile
+import unittest
+from collections import Counter
+
+import numpy as np
+
+from hybrid_search import KNOWLEDGE_FILES, HybridIndex, tokenize
+
+
+class KeywordEmbedding:
+    """按关键词出现次数生成归一化向量的嵌入函数，并记录被编码的文档"""
+
+    keywords = ["退货", "过敏", "雪茄", "保湿", "物流"]
+    dim = len(keywords) + 1
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode_documents(self, texts):
+        self.encoded.extend(texts)
+        return self.encode_queries(texts)
+
+    def encode_queries(self, texts):
+        vectors = []
+        for text in texts:
+            vector = np.array([text.count(word) for word in self.keywords] + [0.1], dtype=np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors
+
+
+def split_paragraphs(lines):
+    """按空行分块，便于在测试中精确控制分块内容"""
+    return [paragraph for paragraph in "".join(lines).split("\n\n") if paragraph.strip()]
+
+
+DOCS = {
+    "售后.md": ["七天无理由退货，退货运费由买家承担。", "收到商品后过敏，请停止使用并联系客服退货。", "物流一般三天送达。"],
+    "雪茄.md": ["古巴雪茄需要在保湿盒中保存。", "雪茄的湿度保持在百分之七十左右。"],
+}
+
+
+def reference_bm25(documents, query, k1=1.5, b=0.75):
+    """逐文档计算 BM25，作为索引实现的对照"""
+    terms = [Counter(tokenize(text)) for text in documents]
+    average = sum(sum(t.values()) for t in terms) / len(terms)
+    scores = []
+    for counter in terms:
+        length = sum(counter.values())
+        score = 0.0
+        for term, weight in Counter(tokenize(query)).items():
+            df = sum(term in other for other in terms)
+            if not df or term not in counter:
+                continue
+            idf = math.log(1 + (len(terms) - df + 0.5) / (df + 0.5))
+            tf = counter[term]
+            score += weight * idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average))
+        scores.append(score)
+    return scores
+
+
+class TestTokenize(unittest.TestCase):
+    def test_unigrams_and_bigrams(self):
+        self.assertEqual(tokenize("的退货"), ["退", "货", "的退", "退货"])
+        self.assertEqual(tokenize("ＳＰＦ50+ 防晒 XYNHJ-30A V2.3"),
+                         ["spf50", "防", "晒", "防晒", "xynhj-30a", "v2.3"])
+        self.assertEqual(tokenize("！？"), [])
+
+
+class TestHybridIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.tmpdir.name, "index")
+        self.paths = {}
+        for name, paragraphs in DOCS.items():
+            self.write(name, paragraphs)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, paragraphs):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("\n\n".join(paragraphs))
+        self.paths[name] = path
+
+    def open(self, **kwargs):
+        kwargs.setdefault("chunker", split_paragraphs)
+        return HybridIndex(self.index_path, **kwargs)
+
+    def test_bm25_matches_reference(self):
+        index = self.open()
+        index.sync(self.paths.values())
+        documents = [text for paragraphs in DOCS.values() for text in paragraphs]
+        for query in ("退货运费", "雪茄保湿", "过敏怎么办"):
+            with self.subTest(query=query):
+                expected = reference_bm25(documents, query)
+                hits = index.search(query, limit=10, mode="bm25")
+                self.assertEqual([hit.text for hit in hits],
+                                 sorted((d for d, s in zip(documents, expected) if s > 0),
+                                        key=lambda d: -expected[documents.index(d)]))
+                for hit in hits:
+                    self.assertAlmostEqual(hit.score, expected[documents.index(hit.text)], places=4)
+        self.assertIsInstance(index.segments[0].postings, np.memmap)
+
+    def test_incremental_sync(self):
+        """只编码新增或修改的分块，删除的分块不再出现在结果中"""
+        embedding = KeywordEmbedding()
+        index = self.open(embedding_fn=embedding)
+        stats = index.sync(self.paths.values())
+        self.assertEqual((stats.added, stats.unchanged, stats.deleted), (5, 0, 0))
+        self.assertEqual(len(embedding.encoded), 5)
+
+        stats = index.sync(self.paths.values())
+        self.assertEqual((stats.added, stats.unchanged, stats.deleted), (0, 5, 0))
+        self.assertEqual(len(index.segments), 1)
+
+        self.write("售后.md", ["七天无理由退货，退货运费由卖家承担。", "物流一般三天送达。"])
+        stats = index.sync(self.paths.values())
+        self.assertEqual((stats.added, stats.unchanged, stats.deleted), (1, 3, 2))
+        self.assertEqual(embedding.encoded[5:], ["七天无理由退货，退货运费由卖家承担。"])
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.stats()["deleted"], 2)
+        texts = [hit.text for hit in index.search("退货 过敏", limit=10)]
+        self.assertIn("七天无理由退货，退货运费由卖家承担。", texts)
+        self.assertFalse(any("买家" in text or "过敏" in text for text in texts))
+
+        # 重新打开索引得到相同的结果
+        reopened = self.open(embedding_fn=embedding)
+        self.assertEqual([hit.id for hit in reopened.search("退货 过敏", limit=10)],
+                         [hit.id for hit in index.search("退货 过敏", limit=10)])
+
+        stats = index.sync([self.paths["售后.md"]])
+        self.assertEqual(stats.deleted, 2)
+        self.assertEqual(index.sources(), [self.paths["售后.md"]])
+        self.assertEqual(index.search("雪茄", mode="bm25"), [])
+
+    def test_merge(self):
+        index = self.open(max_segments=2)
+        for i, name in enumerate(["a.md", "b.md", "c.md"]):
+            self.write(name, [f"第{i}篇 退货说明"])
+            index.update({name: [f"第{i}篇 退货说明"]})
+        # 第三个段触发合并
+        self.assertEqual(len(index.segments), 1)
+        index.update({"a.md": []})
+        before = [(hit.id, round(hit.score, 4)) for hit in index.search("退货", limit=10, mode="bm25")]
+        self.assertEqual(len(before), 2)
+        index.merge()
+        after = index.search("退货", limit=10, mode="bm25")
+        self.assertEqual([hit.id for hit in after], [hit_id for hit_id, _ in before])
+        self.assertEqual(index.stats()["deleted"], 0)
+        segment_dirs = [name for name in os.listdir(self.index_path) if name.startswith("segment-")]
+        self.assertEqual(segment_dirs, [index.segments[0].name])
+
+    def test_scoring_uses_one_snapshot(self):
+        """查询期间发生写入时，BM25 仍使用查询开始时的段列表、文档数和平均长度计算分数"""
+        index = self.open()
+        index.sync(self.paths.values())
+        expected = [(hit.id, hit.score) for hit in index.search("退货", limit=10, mode="bm25")]
+        snapshot = index._snapshot
+        # 模拟并发写入: 删除全部来源后新快照的文档数和平均长度都为 0
+        index.update({path: [] for path in self.paths.values()})
+        self.assertEqual(len(index), 0)
+        results = index._bm25(snapshot, "退货", 10)
+        self.assertTrue(all(math.isfinite(score) for _, score in results))
+        self.assertEqual([(index._hit(snapshot.segments, key, score).id, score) for key, score in results], expected)
+
+    def test_reciprocal_rank_fusion(self):
+        index = self.open(embedding_fn=KeywordEmbedding(), rrf_k=60)
+        index.sync(self.paths.values())
+        query = "过敏了怎么退货"
+        bm25 = [hit.id for hit in index.search(query, limit=10, mode="bm25")]
+        dense = [hit.id for hit in index.search(query, limit=10, mode="dense")]
+        hits = index.search(query, limit=3)
+        for hit in hits:
+            expected = 0.0
+            if hit.id in bm25:
+                self.assertEqual(hit.bm25_rank, bm25.index(hit.id) + 1)
+                expected += 1 / (60 + hit.bm25_rank)
+            if hit.id in dense:
+                self.assertEqual(hit.dense_rank, dense.index(hit.id) + 1)
+                expected += 1 / (60 + hit.dense_rank)
+            self.assertAlmostEqual(hit.score, expected)
+        self.assertEqual(hits[0].text, "收到商品后过敏，请停止使用并联系客服退货。")
+        self.assertEqual([hit.score for hit in hits], sorted((hit.score for hit in hits), reverse=True))
+
+    def test_dimension_mismatch(self):
+        index = self.open(embedding_fn=KeywordEmbedding())
+        index.sync(self.paths.values())
+        other = KeywordEmbedding()
+        other.keywords = other.keywords[:2]
+        self.write("新.md", ["新的退货说明"])
+        with self.assertRaises(ValueError):
+            self.open(embedding_fn=other).sync(self.paths.values())
+        with self.assertRaises(ValueError):
+            self.open().search("退货", mode="dense")
+
+    def test_orphan_segment(self):
+        """段已写入但清单未提交时中断，重新打开后可以继续更新"""
+        index = self.open()
+        index.sync(self.paths.values())
+        orphan = os.path.join(self.index_path, "segment-000001")
+        os.makedirs(orphan)
+        with open(os.path.join(orphan, "docs.json"), "w", encoding="utf-8") as file:
+            file.write("[]")
+        os.makedirs(os.path.join(self.index_path, "segment-000002.tmp"))
+        index = self.open()
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(orphan.replace("000001", "000002.tmp")))
+        self.write("新.md", ["新的退货说明"])
+        stats = index.sync(self.paths.values())
+        self.assertEqual(stats.added, 1)
+        self.assertEqual(len(self.open()), 6)
+
+    def test_vectors_all_or_none(self):
+        """有向量的索引不能写入没有向量的段，反之亦然"""
+        self.open(embedding_fn=KeywordEmbedding()).sync(self.paths.values())
+        self.write("新.md", ["新的退货说明"])
+        with self.assertRaises(ValueError):
+            self.open().sync(self.paths.values())
+        self.open(embedding_fn=KeywordEmbedding()).sync(self.paths.values())
+
+    def test_renamed_heading(self):
+        """正文不变、章节标题改名后，检索结果带有新的标题"""
+        index = self.open(chunker=None)
+        self.write("售后.md", ["# 售后政策", "## 退货", "七天无理由退货。"])
+        index.sync([self.paths["售后.md"]])
+        self.write("售后.md", ["# 售后政策", "## 退换货", "七天无理由退货。"])
+        stats = index.sync([self.paths["售后.md"]])
+        self.assertEqual((stats.added, stats.deleted), (1, 1))
+        hits = index.search("退换货", mode="bm25")
+        self.assertEqual(hits[0].headings, ["售后政策", "退换货"])
+        self.assertEqual(len(index), 1)
+
+
+class TestKnowledgeBase(unittest.TestCase):
+    def test_cigar_questions(self):
+        """雪茄知识中的问题用 BM25 检索，答案所在的分块排在前 3 位"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index = HybridIndex(tmpdir)
+            stats = index.sync(KNOWLEDGE_FILES)
+            self.assertEqual(len(index.sources()), 4)
+            self.assertEqual(stats.added, len(index))
+            with open(KNOWLEDGE_FILES[-1], "r", encoding="utf-8") as file:
+                pairs = re.findall(r"问：(.+?)\s*\n\s*答：(.+?)\s*\n", file.read())
+            self.assertGreater(len(pairs), 50)
+            found = sum(
+                any(answer in hit.text for hit in index.search(question, limit=3))
+                for question, answer in pairs
+            )
+            self.assertGreater(found / len(pairs), 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from llm_cache import AsyncCachedChatClient, CachedChatClient, ReplayMissError, ResponseCache, request_key
+from mock_chat_server import MockChatServer
+
+try:
+    from openai import AsyncOpenAI, OpenAI
+except ImportError:
+    OpenAI = None
+
+MESSAGES = [
+    {"role": "system", "content": "你是一个 AI 助手"},
+    {"role": "user", "content": "你好，DeepSeek"},
+]
+
+
+class TestRequestKey(unittest.TestCase):
+    def test_key_ignores_dict_order_and_transport_options(self):
+        reordered = [{"content": m["content"], "role": m["role"]} for m in MESSAGES]
+        key = request_key({"model": "deepseek-chat", "messages": MESSAGES})
+        self.assertEqual(key, request_key({"messages": reordered, "model": "deepseek-chat", "timeout": 30}))
+        self.assertNotEqual(key, request_key({"model": "deepseek-chat", "messages": MESSAGES, "temperature": 0}))
+        self.assertNotEqual(key, request_key({"model": "deepseek-chat", "messages": MESSAGES, "stream": True}))
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_ttl_and_eviction(self):
+        cache = ResponseCache(":memory:", ttl=0.05, max_entries=2)
+        for key in "abc":
+            cache.put(key, "deepseek-chat", {"key": key}, 0.1)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), ({"key": "c"}, 0.1))
+        time.sleep(0.1)
+        self.assertEqual(cache.get("c", ignore_ttl=True)[0], {"key": "c"})
+        self.assertIsNone(cache.get("c"))
+        self.assertEqual(len(cache), 1)
+        cache.close()
+
+    def test_lru_order(self):
+        """最近读取过的条目不会被淘汰"""
+        cache = ResponseCache(":memory:", max_entries=2)
+        cache.put("a", None, 1, 0.0)
+        cache.put("b", None, 2, 0.0)
+        cache.get("a")
+        cache.put("c", None, 3, 0.0)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        cache.close()
+
+
+@unittest.skipIf(OpenAI is None, "需要安装 openai")
+class TestCachedChatClient(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "llm_cache.db")
+        self.server = MockChatServer(latency=0.05).start()
+        self.openai = OpenAI(api_key="test", base_url=self.server.base_url)
+
+    def tearDown(self):
+        self.openai.close()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def make_client(self, **kwargs):
+        client = CachedChatClient(self.openai, self.path, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_second_call_is_served_from_cache(self):
+        client = self.make_client()
+        first = client.chat.completions.create(model="deepseek-chat", messages=MESSAGES)
+        second = client.chat.completions.create(model="deepseek-chat", messages=MESSAGES)
+        self.assertEqual(first.choices[0].message.content, second.choices[0].message.content)
+        self.assertEqual(second.usage.prompt_tokens, first.usage.prompt_tokens)
+        self.assertEqual(len(self.server.requests), 1)
+
+        miss, hit = client.calls
+        self.assertFalse(miss.cached)
+        self.assertTrue(hit.cached)
+        self.assertGreater(miss.prompt_tokens, 0)
+        self.assertLess(hit.seconds, miss.seconds)
+        self.assertAlmostEqual(hit.saved_seconds, miss.seconds)
+        stats = client.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_streaming_capture_and_replay(self):
+        """流式响应原样转发并录制，命中缓存时按录制的片段重放"""
+        client = self.make_client()
+        kwargs = dict(model="deepseek-chat", messages=MESSAGES, stream=True, stream_options={"include_usage": True})
+
+        def collect():
+            return "".join(
+                chunk.choices[0].delta.content or ""
+                for chunk in client.chat.completions.create(**kwargs) if chunk.choices
+            )
+
+        live = collect()
+        replayed = collect()
+        self.assertEqual(live, "mock answer: 你好，DeepSeek")
+        self.assertEqual(replayed, live)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertIsNotNone(client.calls[0].first_token_seconds)
+        self.assertGreater(client.calls[1].completion_tokens, 0)
+
+    def test_interrupted_stream_is_not_cached(self):
+        client = self.make_client()
+        stream = client.chat.completions.create(model="deepseek-chat", messages=MESSAGES, stream=True)
+        next(iter(stream))
+        stream.close()
+        self.assertEqual(len(client.cache), 0)
+        self.assertEqual(client.calls, [])
+
+    def test_replay_mode_is_offline(self):
+        """录制后的结果可以在没有模型服务的情况下回放，未录制的请求抛出 ReplayMissError"""
+        recorder = self.make_client(mode="record")
+        recorder.chat.completions.create(model="deepseek-chat", messages=MESSAGES)
+        recorder.chat.completions.create(model="deepseek-chat", messages=MESSAGES)
+        self.assertEqual(len(self.server.requests), 2)
+
+        replay = CachedChatClient(None, self.path, mode="replay", ttl=0)
+        self.addCleanup(replay.close)
+        response = replay.chat.completions.create(model="deepseek-chat", messages=MESSAGES)
+        self.assertEqual(response.choices[0].message.content, "mock answer: 你好，DeepSeek")
+        with self.assertRaises(ReplayMissError):
+            replay.chat.completions.create(model="deepseek-reasoner", messages=MESSAGES)
+        self.assertIsNone(replay._client)
+
+    def test_off_mode_only_reports(self):
+        client = self.make_client(mode="off")
+        client.chat.completions.create(model="deepseek-chat", messages=MESSAGES)
+        client.chat.completions.create(model="deepseek-chat", messages=MESSAGES)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(client.stats()["entries"], 0)
+        self.assertEqual(client.stats()["calls"], 2)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            CachedChatClient(self.openai, ":memory:", mode="readonly")
+
+
+@unittest.skipIf(OpenAI is None, "需要安装 openai")
+class TestAsyncCachedChatClient(unittest.TestCase):
+    def test_async_stream_and_completion(self):
+        async def main():
+            with MockChatServer() as server:
+                openai = AsyncOpenAI(api_key="test", base_url=server.base_url)
+                client = AsyncCachedChatClient(openai, ":memory:")
+                contents = []
+                for _ in range(2):
+                    stream = await client.chat.completions.create(model="deepseek-chat", messages=MESSAGES, stream=True)
+                    contents.append("".join([chunk.choices[0].delta.content or "" async for chunk in stream
+                                             if chunk.choices]))
+                    response = await client.chat.completions.create(model="deepseek-chat", messages=MESSAGES)
+                    contents.append(response.choices[0].message.content)
+                await openai.close()
+                client.close()
+                return contents, len(server.requests), client.calls
+
+        contents, requests, calls = asyncio.run(main())
+        self.assertEqual(len(set(contents)), 1)
+        self.assertEqual(requests, 2)
+        self.assertEqual([call.cached for call in calls], [False, False, True, True])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+from rag_chunker import Chunk, MarkdownChunker, count_tokens
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestCountTokens(unittest.TestCase):
+    def test_mixed_text(self):
+        """汉字逐字计数，英文单词和数字整体计数，标点单独计数"""
+        self.assertEqual(count_tokens("民法典 Milvus 2.4。"), 3 + 1 + 3 + 1)
+        self.assertEqual(count_tokens(""), 0)
+
+
+class TestMarkdownChunker(unittest.TestCase):
+    def test_headings_start_new_chunks(self):
+        """标题开启新的分块，并记录标题路径"""
+        text = "# 总则\n\n第一段。\n\n## 第一章\n\n第二段。\n"
+        chunks = list(MarkdownChunker(target_tokens=50, max_tokens=100, overlap_tokens=0).chunk_text(text))
+        self.assertEqual([chunk.text for chunk in chunks], ["# 总则\n\n第一段。", "## 第一章\n\n第二段。"])
+        self.assertEqual(chunks[0].headings, ("总则",))
+        self.assertEqual(chunks[1].headings, ("总则", "第一章"))
+
+    def test_heading_only_sections_are_dropped(self):
+        """没有正文的标题不会单独成为分块"""
+        text = "## 民法典\n\n### 物权编\n\n#### 第一章\n\n正文。\n"
+        chunks = list(MarkdownChunker(target_tokens=50, max_tokens=100, overlap_tokens=0).chunk_text(text))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0].text, "#### 第一章\n\n正文。")
+        self.assertEqual(chunks[0].headings, ("民法典", "物权编", "第一章"))
+
+    def test_chunks_respect_max_tokens(self):
+        """分块不超过 max_tokens，长段落按句子切分"""
+        paragraph = "这是一个句子。" * 100
+        chunker = MarkdownChunker(target_tokens=40, max_tokens=60, overlap_tokens=10)
+        chunks = list(chunker.chunk_text(f"# 标题\n\n{paragraph}\n"))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(chunk.tokens, 60)
+            self.assertEqual(chunk.tokens, count_tokens(chunk.text))
+
+    def test_overlong_sentence_is_hard_split(self):
+        """没有标点的超长句子按长度硬切分"""
+        chunks = list(MarkdownChunker(target_tokens=20, max_tokens=30, overlap_tokens=0).chunk_text("字" * 100))
+        self.assertEqual("".join(chunk.text for chunk in chunks), "字" * 100)
+        self.assertTrue(all(chunk.tokens <= 30 for chunk in chunks))
+
+    def test_overlong_paragraph_keeps_word_boundaries(self):
+        """超长的英文段落分段处理和硬切分时不粘连、不切断单词"""
+        text = ("word " * 20 + "\n") * 200
+        chunks = list(MarkdownChunker(target_tokens=50, max_tokens=60, overlap_tokens=0).chunk_text(text))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertEqual(set(chunk.text.split()), {"word"})
+            self.assertLessEqual(chunk.tokens, 60)
+        self.assertEqual(sum(len(chunk.text.split()) for chunk in chunks), 4_000)
+
+    def test_hard_split_uses_token_counter(self):
+        """自定义计数函数的 token 数多于字符数时，硬切分的每段仍不超过 max_tokens"""
+        def counter(text):
+            return 2 * len(text.strip())
+
+        chunker = MarkdownChunker(target_tokens=50, max_tokens=60, overlap_tokens=0, token_counter=counter)
+        chunks = list(chunker.chunk_text("字" * 500))
+        self.assertEqual("".join(chunk.text for chunk in chunks), "字" * 500)
+        self.assertTrue(all(counter(chunk.text) <= 60 for chunk in chunks))
+
+    def test_overlap_between_chunks(self):
+        """相邻分块之间保留重叠的段落"""
+        text = "\n\n".join(f"第{i}段内容。" for i in range(10))
+        chunks = list(MarkdownChunker(target_tokens=15, max_tokens=30, overlap_tokens=7).chunk_text(text))
+        for previous, current in zip(chunks, chunks[1:]):
+            self.assertEqual(previous.text.split("\n\n")[-1], current.text.split("\n\n")[0])
+
+    def test_offsets_point_into_source(self):
+        """偏移量为源文件中的字节位置，可以切回原文"""
+        path = os.path.join(HERE, "mfd.md")
+        with open(path, "rb") as file:
+            raw = file.read()
+        chunks = list(MarkdownChunker(target_tokens=200, max_tokens=300, overlap_tokens=30).chunk_file(path))
+        self.assertGreater(len(chunks), 30)
+        for chunk in chunks:
+            original = raw[chunk.start:chunk.end].decode("utf-8")
+            self.assertTrue(original.startswith(chunk.text[:20]))
+            self.assertTrue(original.endswith(chunk.text[-20:]))
+            self.assertEqual(chunk.source, path)
+
+    def test_code_fences_are_not_split_on_headings(self):
+        """代码块中的 # 注释不会被识别为标题"""
+        text = "# 示例\n\n```python\n# 注释\n\nprint(1)\n```\n"
+        chunks = list(MarkdownChunker(target_tokens=50, max_tokens=100, overlap_tokens=0).chunk_text(text))
+        self.assertEqual(len(chunks), 1)
+        self.assertIn("# 注释\n\nprint(1)", chunks[0].text)
+
+    def test_plain_text_mode_ignores_headings(self):
+        """纯文本模式下 # 开头的行视为普通段落"""
+        chunker = MarkdownChunker(target_tokens=50, max_tokens=100, overlap_tokens=0, markdown=False)
+        chunks = list(chunker.chunk_text("# 不是标题\n正文。\n"))
+        self.assertEqual(chunks[0].headings, ())
+
+    def test_streaming_memory_is_bounded(self):
+        """处理大文件时内存占用与文件大小无关"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "large.md")
+            with open(path, "w", encoding="utf-8") as file:
+                for i in range(2_000):
+                    file.write(f"## 第{i}节\n\n" + "这是一个用于测试的句子。" * 40 + "\n\n")
+            size = os.path.getsize(path)
+
+            tracemalloc.start()
+            count = sum(1 for _ in MarkdownChunker().chunk_file(path))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        self.assertGreaterEqual(count, 2_000)
+        self.assertLess(peak, size / 10)
+
+    def test_invalid_budgets(self):
+        with self.assertRaises(ValueError):
+            MarkdownChunker(target_tokens=100, max_tokens=50)
+        with self.assertRaises(ValueError):
+            MarkdownChunker(target_tokens=100, max_tokens=200, overlap_tokens=100)
+
+    def test_chunk_metadata(self):
+        chunk = Chunk("正文", "a.md", 0, 6, ("标题",), 2)
+        self.assertEqual(chunk.metadata(), {
+            "source": "a.md", "start": 0, "end": 6, "headings": ["标题"], "tokens": 2,
+        })
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from rag_chunker import MarkdownChunker
+from rag_ingest import IncrementalIngestor, chunk_id, split_markdown
+
+try:
+    from pymilvus import MilvusClient
+except ImportError:
+    MilvusClient = None
+
+
+class HashEmbedding:
+    """根据文本哈希生成确定性向量的嵌入函数，并记录被编码的文本"""
+
+    dim = 8
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode_documents(self, texts):
+        self.encoded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def encode_queries(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [byte / 255 for byte in digest[:self.dim]]
+
+
+class TestSplitMarkdown(unittest.TestCase):
+    def test_drops_blank_chunks(self):
+        """空白分块应被丢弃"""
+        self.assertEqual(list(split_markdown("# 标题一\n内容\n# 标题二\n")), ["标题一\n内容\n", "标题二\n"])
+
+    def test_streaming_matches_full_split(self):
+        """逐行切分与教程中整体 split("# ") 的结果相同，且不会一次读入全部行"""
+        text = "前言\n# 一\n内容 # 行内\n## 二\n\n### 三\n结尾"
+        expected = [chunk for chunk in text.split("# ") if chunk.strip()]
+        self.assertEqual(list(split_markdown(text)), expected)
+        self.assertEqual(list(split_markdown(iter(text.splitlines(keepends=True)))), expected)
+
+        consumed = []
+
+        def lines():
+            for i in range(1000):
+                consumed.append(i)
+                yield f"# 第{i}节\n"
+
+        chunks = split_markdown(lines())
+        self.assertEqual(next(chunks), "第0节\n")
+        self.assertLessEqual(len(consumed), 2)
+
+    def test_chunk_id_depends_on_source(self):
+        """相同内容在不同来源中的主键应不同"""
+        self.assertNotEqual(chunk_id("a.md", "内容"), chunk_id("b.md", "内容"))
+        self.assertEqual(chunk_id("a.md", "内容"), chunk_id("a.md", "内容"))
+
+
+@unittest.skipIf(MilvusClient is None, "需要安装 pymilvus 和 Milvus Lite")
+class TestIncrementalIngestor(unittest.TestCase):
+    collection_name = "test_rag_ingest"
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.milvus_client = MilvusClient(os.path.join(self.tmpdir.name, "milvus.db"))
+        self.embedding = HashEmbedding()
+        self.ingestor = IncrementalIngestor(
+            self.milvus_client,
+            self.embedding,
+            self.collection_name,
+            os.path.join(self.tmpdir.name, "manifest.db"),
+            batch_size=2,
+        )
+        self.doc_path = os.path.join(self.tmpdir.name, "doc.md")
+
+    def tearDown(self):
+        self.ingestor.close()
+        self.milvus_client.close()
+        self.tmpdir.cleanup()
+
+    def write_doc(self, *sections):
+        with open(self.doc_path, "w", encoding="utf-8") as file:
+            file.write("".join(f"# {section}\n" for section in sections))
+
+    def stored_texts(self):
+        rows = self.milvus_client.query(
+            self.collection_name, filter='id != ""', output_fields=["text"], limit=100
+        )
+        return sorted(row["text"] for row in rows)
+
+    def test_first_ingest_adds_all_chunks(self):
+        """首次入库应编码并写入全部分块"""
+        self.write_doc("第一条", "第二条", "第三条")
+        stats = self.ingestor.ingest_file(self.doc_path)
+        self.assertEqual((stats.added, stats.unchanged, stats.deleted), (3, 0, 0))
+        self.assertEqual(self.stored_texts(), ["第一条\n", "第三条\n", "第二条\n"])
+
+    def test_reingest_unchanged_corpus_embeds_nothing(self):
+        """语料未变化时重新入库不应调用嵌入模型"""
+        self.write_doc("第一条", "第二条", "第三条")
+        self.ingestor.ingest_file(self.doc_path)
+        self.embedding.encoded.clear()
+
+        stats = self.ingestor.ingest_file(self.doc_path)
+        self.assertEqual((stats.added, stats.unchanged, stats.deleted), (0, 3, 0))
+        self.assertEqual(self.embedding.encoded, [])
+
+    def test_changed_and_removed_chunks(self):
+        """只编码修改过的分块，并删除已移除分块的向量"""
+        self.write_doc("第一条", "第二条", "第三条")
+        self.ingestor.ingest_file(self.doc_path)
+        self.embedding.encoded.clear()
+
+        self.write_doc("第一条", "第二条(修订)")
+        stats = self.ingestor.ingest_file(self.doc_path)
+        self.assertEqual((stats.added, stats.unchanged, stats.deleted), (1, 1, 2))
+        self.assertEqual(self.embedding.encoded, ["第二条(修订)\n"])
+        self.assertEqual(self.stored_texts(), ["第一条\n", "第二条(修订)\n"])
+
+    def test_duplicate_chunks_are_stored_once(self):
+        """同一来源中的重复分块只存储一份"""
+        self.write_doc("重复", "重复", "重复")
+        stats = self.ingestor.ingest_file(self.doc_path)
+        self.assertEqual(stats.added, 1)
+        self.assertEqual(self.stored_texts(), ["重复\n"])
+
+    def test_sync_removes_missing_sources(self):
+        """sync 应删除不再存在的来源"""
+        other_path = os.path.join(self.tmpdir.name, "other.md")
+        with open(other_path, "w", encoding="utf-8") as file:
+            file.write("# 其他文档\n")
+        self.write_doc("第一条")
+        self.ingestor.sync([self.doc_path, other_path])
+        self.assertEqual(sorted(self.ingestor.sources()), sorted([self.doc_path, other_path]))
+
+        stats = self.ingestor.sync([self.doc_path])
+        self.assertEqual((stats.added, stats.unchanged, stats.deleted), (0, 1, 1))
+        self.assertEqual(self.ingestor.sources(), [self.doc_path])
+        self.assertEqual(self.stored_texts(), ["第一条\n"])
+
+    def test_dropped_collection_is_reingested(self):
+        """collection 被删除后，清单不再把分块报告为未变化"""
+        self.write_doc("第一条", "第二条")
+        self.ingestor.ingest_file(self.doc_path)
+        self.milvus_client.drop_collection(self.collection_name)
+
+        stats = self.ingestor.ingest_file(self.doc_path)
+        self.assertEqual((stats.added, stats.unchanged, stats.deleted), (2, 0, 0))
+        self.assertEqual(self.stored_texts(), ["第一条\n", "第二条\n"])
+
+        self.milvus_client.drop_collection(self.collection_name)
+        self.assertEqual(self.ingestor.remove_source(self.doc_path), 0)
+        self.assertEqual(self.ingestor.sources(), [])
+
+    def test_streaming_chunker(self):
+        """使用 MarkdownChunker 流式分块入库"""
+        self.ingestor.chunker = MarkdownChunker(target_tokens=20, max_tokens=40, overlap_tokens=0)
+        self.write_doc("第一节\n\n第一段。", "第二节\n\n第二段。")
+        stats = self.ingestor.ingest_file(self.doc_path)
+        self.assertEqual(stats.added, 2)
+        self.assertEqual(self.stored_texts(), ["# 第一节\n\n第一段。", "# 第二节\n\n第二段。"])
+
+    def test_search_returns_ingested_text(self):
+        """入库后的向量可以被检索到"""
+        self.write_doc("第一条", "第二条")
+        self.ingestor.ingest_file(self.doc_path)
+        res = self.milvus_client.search(
+            self.collection_name,
+            data=self.embedding.encode_queries(["第二条\n"]),
+            limit=1,
+            output_fields=["text"],
+        )
+        self.assertEqual(res[0][0]["entity"]["text"], "第二条\n")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
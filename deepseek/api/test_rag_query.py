@@ -0,0 +1,189 @@
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from mock_chat_server import MockChatServer
+from rag_query import AnswerCache, RagAnswer, RagQueryService, RateLimiter
+
+try:
+    from openai import OpenAI
+    from pymilvus import MilvusClient
+except ImportError:
+    OpenAI = MilvusClient = None
+
+DOCUMENTS = [
+    "借款合同: 借款人应当按照约定的期限返还借款。",
+    "转账记录和聊天记录可以作为民间借贷的证据。",
+    "消费者权益保护: 经营者提供的商品与描述不符的，消费者可以要求退货。",
+    "网络购物: 消费者有权自收到商品之日起七日内退货。",
+]
+
+
+class KeywordEmbedding:
+    """按关键词生成归一化向量的嵌入函数，相同关键词组合的文本向量相同"""
+
+    keywords = ["借", "证据", "记录", "商品", "退货", "消费者"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode_queries(self, texts):
+        self.calls += 1
+        return self.encode_documents(texts)
+
+    def encode_documents(self, texts):
+        vectors = []
+        for text in texts:
+            vector = np.array([text.count(word) for word in self.keywords] + [0.1], dtype=np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_limits_rate(self):
+        """超过突发上限后，请求按设定速率放行"""
+        limiter = RateLimiter(rate=50, burst=1)
+        start = time.perf_counter()
+        for _ in range(6):
+            limiter.acquire()
+        self.assertGreaterEqual(time.perf_counter() - start, 5 / 50 * 0.9)
+
+
+class TestAnswerCache(unittest.TestCase):
+    def test_exact_and_similar_matches(self):
+        cache = AnswerCache(similarity_threshold=0.9, max_entries=2)
+        answer = RagAnswer("问题", "回答")
+        cache.put("  问题 ", np.array([1.0, 0.0]), answer)
+        self.assertIs(cache.get_exact("问题"), answer)
+        self.assertEqual(cache.get_similar([np.array([0.99, 0.1]), np.array([0.0, 1.0])]), [answer, None])
+
+    def test_hits_do_not_shift_rows(self):
+        """命中后 LRU 顺序改变，之后的相似度匹配仍返回对应问题的回答"""
+        cache = AnswerCache(similarity_threshold=0.9)
+        a, b = RagAnswer("A", "回答 A"), RagAnswer("B", "回答 B")
+        cache.put("A", np.array([1.0, 0.0]), a)
+        cache.put("B", np.array([0.0, 1.0]), b)
+        self.assertIs(cache.get_similar([np.array([1.0, 0.0])])[0], a)
+        self.assertIs(cache.get_similar([np.array([1.0, 0.0])])[0], a)
+        self.assertIs(cache.get_exact("A"), a)
+        self.assertEqual(cache.get_similar([np.array([0.0, 1.0]), np.array([1.0, 0.0])]), [b, a])
+
+    def test_eviction(self):
+        cache = AnswerCache(max_entries=1)
+        cache.put("a", np.array([1.0]), RagAnswer("a", "1"))
+        cache.put("b", np.array([1.0]), RagAnswer("b", "2"))
+        self.assertIsNone(cache.get_exact("a"))
+        self.assertEqual(len(cache), 1)
+
+
+@unittest.skipIf(MilvusClient is None, "需要安装 openai、pymilvus 和 Milvus Lite")
+class TestRagQueryService(unittest.TestCase):
+    collection_name = "test_rag_query"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.milvus_client = MilvusClient(os.path.join(cls.tmpdir.name, "milvus.db"))
+        embedding = KeywordEmbedding()
+        cls.milvus_client.create_collection(
+            collection_name=cls.collection_name,
+            dimension=len(KeywordEmbedding.keywords) + 1,
+            metric_type="IP",
+            consistency_level="Strong",
+        )
+        vectors = embedding.encode_documents(DOCUMENTS)
+        cls.milvus_client.insert(
+            collection_name=cls.collection_name,
+            data=[{"id": i, "vector": vectors[i], "text": text} for i, text in enumerate(DOCUMENTS)],
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.milvus_client.close()
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        self.server = MockChatServer(latency=0.2).start()
+        self.embedding = KeywordEmbedding()
+        self.service = RagQueryService(
+            self.milvus_client,
+            self.embedding,
+            OpenAI(api_key="test", base_url=self.server.base_url),
+            self.collection_name,
+            limit=2,
+            max_concurrency=4,
+            answer_cache=AnswerCache(similarity_threshold=0.99),
+        )
+
+    def tearDown(self):
+        self.service.close()
+        self.server.stop()
+
+    def test_batch_uses_single_embedding_call_and_concurrent_llm_calls(self):
+        """一批问题只编码一次，LLM 请求并发执行"""
+        questions = [
+            "借钱不还，有转账记录能要回吗？",
+            "商品与描述不符，如何退货？",
+            "借款到期不还怎么办？",
+            "消费者收到商品后能退货吗？",
+        ]
+        start = time.perf_counter()
+        answers = self.service.answer_batch(questions)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(self.embedding.calls, 1)
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertLess(elapsed, 0.2 * 4 * 0.75)
+        self.assertEqual([answer.question for answer in answers], questions)
+        self.assertTrue(all(answer.answer.startswith("mock answer:") for answer in answers))
+        self.assertTrue(all(answer.cached is None for answer in answers))
+
+    def test_retrieved_context_is_in_prompt(self):
+        """检索到的分块被写入提示词"""
+        answer = self.service.answer("借钱不还，有转账记录能要回吗？")
+        self.assertIn("转账记录和聊天记录可以作为民间借贷的证据。", answer.contexts)
+        prompt = self.server.requests[0]["messages"][1]["content"]
+        for context in answer.contexts:
+            self.assertIn(context, prompt)
+
+    def test_repeated_questions_skip_llm(self):
+        """重复的问题命中精确缓存，相似的问题命中相似度缓存"""
+        self.service.answer("商品与描述不符，如何退货？")
+        self.assertEqual(len(self.server.requests), 1)
+
+        exact, similar = self.service.answer_batch([" 商品与描述不符，如何退货？", "商品与描述不符，怎样退货？"])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(exact.cached, "exact")
+        self.assertEqual(similar.cached, "similar")
+
+    def test_duplicates_within_batch_are_asked_once(self):
+        """同一批次中的重复问题只调用一次 LLM"""
+        answers = self.service.answer_batch(["借款到期不还怎么办？", "借款到期不还怎么办？ "])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(answers[0].answer, answers[1].answer)
+
+    def test_failed_question_does_not_sink_batch(self):
+        """单个问题的 LLM 调用失败时，其他问题的回答照常返回并写入缓存"""
+        create = self.service.llm_client.chat.completions.create
+
+        def flaky_create(**kwargs):
+            if "商品" in kwargs["messages"][-1]["content"]:
+                raise ConnectionError("连接被重置")
+            return create(**kwargs)
+
+        self.service.llm_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=flaky_create)))
+        answers = self.service.answer_batch(["借款到期不还怎么办？", "商品与描述不符，如何退货？"])
+        self.assertIsNotNone(answers[0].answer)
+        self.assertIsNone(answers[0].error)
+        self.assertIsNone(answers[1].answer)
+        self.assertIn("连接被重置", answers[1].error)
+        self.assertEqual(len(self.service.answer_cache), 1)
+        self.assertEqual(self.service.answer_batch(["借款到期不还怎么办？"])[0].cached, "exact")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
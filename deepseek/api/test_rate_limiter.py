@@ -0,0 +1,45 @@
+import asyncio
+import time
+import unittest
+
+from rate_limiter import AsyncRateLimiter, RateLimiter, TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_rate(self):
+        """初始可以连续取出 burst 个令牌，之后需要按速率等待"""
+        bucket = TokenBucket(rate=10, burst=3)
+        self.assertEqual([bucket.take() for _ in range(3)], [0.0, 0.0, 0.0])
+        wait = bucket.take()
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 1 / 10)
+
+    def test_invalid_arguments(self):
+        for rate, burst in ((0, 1), (1, 0)):
+            with self.subTest(rate=rate, burst=burst), self.assertRaises(ValueError):
+                TokenBucket(rate, burst)
+
+
+class TestRateLimiters(unittest.TestCase):
+    def test_sync_and_async_share_behaviour(self):
+        """burst 个请求立即放行，其余请求按设定速率放行"""
+        limiter = RateLimiter(rate=50, burst=3)
+        start = time.perf_counter()
+        for _ in range(3):
+            limiter.acquire()
+        self.assertLess(time.perf_counter() - start, 1 / 50)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertGreaterEqual(time.perf_counter() - start, 3 / 50 * 0.9)
+
+        async def main():
+            limiter = AsyncRateLimiter(rate=50, burst=3)
+            start = time.perf_counter()
+            await asyncio.gather(*(limiter.acquire() for _ in range(6)))
+            return time.perf_counter() - start
+
+        self.assertGreaterEqual(asyncio.run(main()), 3 / 50 * 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
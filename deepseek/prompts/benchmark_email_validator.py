@@ -0,0 +1,190 @@
+import random
+import string
+import time
+
+from email_validator import is_valid_email
+
+# 用户名和域名允许的字符集，与 EMAIL_PATTERN 保持一致
+LOCAL_CHARS = string.ascii_letters + string.digits + "._%+-"
+DOMAIN_CHARS = string.ascii_letters + string.digits + "-"
+TLDS = ["com", "org", "net", "cn", "co.uk", "io", "edu"]
+
+
+def realistic_corpus(count, seed=0):
+    """
+    生成接近真实分布的电子邮件地址语料(大部分有效，少量常见笔误)
+
+    参数:
+        count (int): 生成的地址数量
+        seed (int): 随机种子，保证每次运行语料一致
+
+    返回:
+        list[str]: 电子邮件地址列表
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        local = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12)))
+        if rng.random() < 0.3:
+            local += rng.choice(".+_-") + "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 6)))
+        domain = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+        email = f"{local}@{domain}.{rng.choice(TLDS)}"
+        # 约 10% 的地址带有常见错误: 缺少@、连续的点、尾部空格
+        typo = rng.random()
+        if typo < 0.03:
+            email = email.replace("@", "")
+        elif typo < 0.06:
+            email = email.replace(".", "..", 1)
+        elif typo < 0.1:
+            email += " "
+        corpus.append(email)
+    return corpus
+
+
+def adversarial_inputs(length):
+    """
+    构造长度约为 length 的病态输入，专门针对正则回溯的薄弱点
+
+    参数:
+        length (int): 输入的目标长度
+
+    返回:
+        dict[str, str]: 输入名称到输入字符串的映射
+    """
+    half = max(length // 2, 1)
+    return {
+        # 超长用户名，且缺少@，迫使用户名部分完整回溯
+        "long_local_no_at": "a" * length,
+        # 超长用户名 + 合法域名
+        "long_local": "a" * length + "@example.com",
+        # 域名由大量的点和连字符组成，且结尾非法
+        "dots_and_hyphens": "user@" + ".-" * half + "!",
+        # 大量单字符标签，最后的顶级域名非法
+        "many_labels_bad_tld": "user@" + "a." * half + "1",
+        # 超长单个标签，缺少顶级域名
+        "long_label_no_tld": "user@" + "a-" * half,
+        # 长字母串后跟非法字符，压测顶级域名 {2,} 的回溯
+        "long_tld_bad_tail": "user@example." + "a" * length + "1",
+        # 连续的点
+        "consecutive_dots": "user@" + "." * length + "com",
+    }
+
+
+def measure(validator, inputs, repeat=5):
+    """
+    测量 validator 处理每个输入的最短耗时(秒)
+
+    取多次运行的最小值，以降低系统调度带来的噪声
+
+    参数:
+        validator (callable): 校验函数，例如 is_valid_email
+        inputs (dict[str, str]): 输入名称到输入字符串的映射
+        repeat (int): 每个输入的重复次数
+
+    返回:
+        dict[str, float]: 输入名称到最短耗时的映射
+    """
+    timings = {}
+    for name, text in inputs.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            validator(text)
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+    return timings
+
+
+def throughput(validator, corpus, repeat=3):
+    """
+    计算 validator 在语料上的吞吐量(地址/秒)，取多次运行中的最好成绩
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for email in corpus:
+            validator(email)
+        best = min(best, time.perf_counter() - start)
+    return len(corpus) / best if best > 0 else float("inf")
+
+
+def scaling_curve(validator, lengths, repeat=5):
+    """
+    计算每类病态输入在不同长度下的耗时曲线
+
+    返回:
+        dict[str, list[tuple[int, float]]]: 输入名称到 (长度, 耗时) 列表的映射
+    """
+    curves = {}
+    for length in lengths:
+        for name, seconds in measure(validator, adversarial_inputs(length), repeat).items():
+            curves.setdefault(name, []).append((length, seconds))
+    return curves
+
+
+def growth_ratios(curve):
+    """
+    计算耗时曲线首尾两点的增长比，返回 (耗时增长倍数, 长度增长倍数)
+
+    线性算法的耗时增长倍数应与长度增长倍数同阶，
+    二次方算法的耗时增长倍数约为长度增长倍数的平方
+    """
+    (small_len, small_time), (large_len, large_time) = curve[0], curve[-1]
+    # 以计时器分辨率为下限，避免极小耗时导致的除零和噪声放大
+    small_time = max(small_time, 1e-7)
+    return large_time / small_time, large_len / small_len
+
+
+def find_superlinear(validator, lengths=(2_000, 32_000), tolerance=4.0, repeat=5):
+    """
+    找出耗时增长明显快于线性的病态输入
+
+    参数:
+        validator (callable): 校验函数
+        lengths (tuple[int, int]): 用于比较的最小和最大输入长度
+        tolerance (float): 允许的耗时增长倍数相对于长度增长倍数的放大系数
+        repeat (int): 每个输入的重复次数
+
+    返回:
+        dict[str, float]: 超线性输入名称到耗时增长倍数的映射，为空表示全部线性
+    """
+    offenders = {}
+    for name, curve in scaling_curve(validator, lengths, repeat).items():
+        time_ratio, length_ratio = growth_ratios(curve)
+        if time_ratio > length_ratio * tolerance:
+            offenders[name] = time_ratio
+    return offenders
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="is_valid_email 性能基准测试")
+    parser.add_argument("--count", type=int, default=100_000, help="真实语料的地址数量")
+    parser.add_argument("--max-length", type=int, default=64_000, help="病态输入的最大长度")
+    args = parser.parse_args()
+
+    corpus = realistic_corpus(args.count)
+    print(f"真实语料吞吐量: {throughput(is_valid_email, corpus):,.0f} 地址/秒")
+
+    lengths = []
+    length = 1_000
+    while length <= args.max_length:
+        lengths.append(length)
+        length *= 2
+
+    print("\n病态输入耗时曲线(微秒):")
+    curves = scaling_curve(is_valid_email, lengths)
+    print(f"{'输入':<22}" + "".join(f"{n:>10}" for n in lengths))
+    for name, curve in curves.items():
+        print(f"{name:<22}" + "".join(f"{seconds * 1e6:>10.1f}" for _, seconds in curve))
+
+    offenders = find_superlinear(is_valid_email, (lengths[0], lengths[-1]))
+    if offenders:
+        print(f"\n检测到超线性输入: {', '.join(offenders)}")
+    else:
+        print("\n所有病态输入的耗时均随长度线性增长")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,10 @@
 cat > email_validator.py << 'EOF'
 import re
 
+# 健壮的电子邮件正则表达式，模块加载时预编译一次
+# 域名标签字符集不含点，点只能作为标签分隔符出现，回溯位置唯一，匹配时间与输入长度呈线性关系
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}$')
+
 def is_valid_email(email_string):
     """
     验证给定的字符串是否为有效的电子邮件地址
@@ -20,7 +24,7 @@ def is_valid_email(email_string):
     正则表达式说明:
         这个正则表达式基于RFC 5322标准简化版本，覆盖大多数常见电子邮件格式：
         - 用户名部分允许: 字母、数字、. _ % + -
-        - 域名部分允许: 字母、数字、. -
+        - 域名部分允许: 字母、数字、. -，由点分隔的标签组成，标签不能为空(不允许连续的点)
         - 必须包含@符号
         - 顶级域名至少2个字符
         - 不支持国际化域名(IDN)中的非ASCII字符
@@ -29,11 +33,8 @@ def is_valid_email(email_string):
     if not isinstance(email_string, str):
         raise TypeError("输入必须是字符串类型，但收到 {}".format(type(email_string).__name__))
     
-    # 健壮的电子邮件正则表达式
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    
     # 使用fullmatch确保整个字符串匹配
-    return bool(re.fullmatch(pattern, email_string))
+    return bool(EMAIL_PATTERN.fullmatch(email_string))
 
 if __name__ == "__main__":
     # 简单命令行测试
@@ -0,0 +1,129 @@
+import random
+import re
+import string
+import unittest
+
+from email_validator import is_valid_email
+from benchmark_email_validator import (
+    DOMAIN_CHARS,
+    LOCAL_CHARS,
+    adversarial_inputs,
+    find_superlinear,
+    growth_ratios,
+    measure,
+    realistic_corpus,
+    throughput,
+)
+
+# 模糊测试的字符表: 合法字符 + 常见非法字符，@和.的权重更高以便生成接近合法的输入
+FUZZ_ALPHABET = LOCAL_CHARS + " _!#@@@...."
+
+
+def tile(text, length):
+    """重复拼接 text，得到长度为 length 的输入"""
+    return (text * (length // len(text) + 1))[:length]
+
+
+def reference_is_valid(email):
+    """不使用正则表达式的参考实现，作为模糊测试的判定依据"""
+    if email.count("@") != 1:
+        return False
+    local, domain = email.split("@")
+    if not local or any(ch not in LOCAL_CHARS for ch in local):
+        return False
+    labels = domain.split(".")
+    if len(labels) < 2:
+        return False
+    if any(not label or any(ch not in DOMAIN_CHARS for ch in label) for label in labels):
+        return False
+    tld = labels[-1]
+    return len(tld) >= 2 and all(ch in string.ascii_letters for ch in tld)
+
+
+class TestEmailValidatorFuzz(unittest.TestCase):
+    def test_random_inputs_match_reference(self):
+        """随机输入的校验结果应与参考实现一致"""
+        rng = random.Random(2024)
+        for _ in range(5_000):
+            email = "".join(rng.choices(FUZZ_ALPHABET, k=rng.randint(0, 40)))
+            with self.subTest(email=email):
+                self.assertEqual(is_valid_email(email), reference_is_valid(email))
+
+    def test_mutated_valid_emails_match_reference(self):
+        """对有效地址做随机插入、删除、替换后，校验结果应与参考实现一致"""
+        rng = random.Random(7)
+        for email in realistic_corpus(1_000, seed=7):
+            chars = list(email)
+            for _ in range(rng.randint(1, 3)):
+                op = rng.random()
+                pos = rng.randint(0, len(chars))
+                if op < 0.4:
+                    chars.insert(pos, rng.choice(FUZZ_ALPHABET))
+                elif op < 0.7 and pos < len(chars):
+                    del chars[pos]
+                elif pos < len(chars):
+                    chars[pos] = rng.choice(FUZZ_ALPHABET)
+            mutated = "".join(chars)
+            with self.subTest(email=mutated):
+                self.assertEqual(is_valid_email(mutated), reference_is_valid(mutated))
+
+    def test_adversarial_inputs_are_invalid_or_valid_as_expected(self):
+        """病态输入的校验结果应与参考实现一致"""
+        for name, email in adversarial_inputs(500).items():
+            with self.subTest(input=name):
+                self.assertEqual(is_valid_email(email), reference_is_valid(email))
+
+
+class TestEmailValidatorPerformance(unittest.TestCase):
+    def test_worst_case_time_is_linear(self):
+        """病态输入的耗时应随长度线性增长，模式修改引入超线性回溯时测试失败"""
+        offenders = find_superlinear(is_valid_email)
+        self.assertEqual(offenders, {}, f"检测到超线性输入: {offenders}")
+
+    def test_worst_case_cost_is_bounded_by_linear_scan(self):
+        """
+        64K 字符的病态输入，耗时不超过同样长度的有效地址(一次线性扫描)的 50 倍
+
+        与同一台机器上的基准耗时相比，不依赖绝对时间；二次方回溯在该长度下会慢上千倍
+        """
+        baseline = measure(is_valid_email, {"valid": "a" * 64_000 + "@example.com"})["valid"]
+        for name, seconds in measure(is_valid_email, adversarial_inputs(64_000)).items():
+            with self.subTest(input=name):
+                self.assertLess(seconds, max(baseline, 1e-6) * 50)
+
+    def test_worst_fuzzed_inputs_scale_linearly(self):
+        """
+        最慢的模糊输入放大到 n 和 4n 个字符时，耗时增长应与长度增长同阶
+
+        模糊输入很短，先重复拼接到 n 个字符，按耗时挑出最慢的 5 个，
+        再与拼接到 4n 个字符时的耗时比较；手写的病态输入之外的回溯路径也能被发现。
+        线性时耗时约增长 4 倍，二次方回溯约增长 16 倍
+        """
+        rng = random.Random(2024)
+        seeds = {"".join(rng.choices(FUZZ_ALPHABET, k=rng.randint(1, 40))) for _ in range(2_000)}
+        n = 2_000
+        timings = measure(is_valid_email, {seed: tile(seed, n) for seed in seeds}, repeat=1)
+        for seed in sorted(timings, key=timings.get, reverse=True)[:5]:
+            curve = [(length, measure(is_valid_email, {seed: tile(seed, length)})[seed]) for length in (n, 4 * n)]
+            time_ratio, length_ratio = growth_ratios(curve)
+            with self.subTest(seed=seed):
+                self.assertLess(time_ratio, length_ratio * 3)
+
+    def test_guard_detects_quadratic_pattern(self):
+        """确保检测方法本身能识别出二次方回溯的正则表达式"""
+        quadratic = re.compile(r'[a-z.@-]*[a-z.@-]*!')
+
+        def slow_validator(email):
+            return bool(quadratic.fullmatch(email))
+
+        offenders = find_superlinear(slow_validator, lengths=(200, 1_600), repeat=3)
+        self.assertIn("long_local_no_at", offenders)
+
+    def test_realistic_throughput(self):
+        """真实语料上，正则校验的吞吐量应至少是逐字符检查的参考实现的 2 倍(通常约 6 倍)"""
+        corpus = realistic_corpus(20_000)
+        self.assertGreater(throughput(is_valid_email, corpus), throughput(reference_is_valid, corpus) * 2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,150 @@
+import json
+import math
+import re
+
+# 中日韩统一表意文字(含扩展 A 和兼容区)
+CJK_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+NON_SPACE_PATTERN = re.compile(r'\S')
+
+# 每条消息的角色、分隔符等固定开销
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text):
+    """
+    按 DeepSeek 文档给出的换算比例在本地估算 token 数量，不需要调用模型的分词器:
+    1 个中文字符约 0.6 个 token，1 个英文字符(含数字和符号)约 0.3 个 token，空白不计
+
+    需要与其他模块使用同一套计数时，通过 ConversationManager 的 token_counter 参数传入
+    """
+    if not text:
+        return 0
+    chinese = len(CJK_PATTERN.findall(text))
+    other = len(NON_SPACE_PATTERN.findall(text)) - chinese
+    return math.ceil(chinese * 0.6 + other * 0.3)
+
+
+def count_message_tokens(message, token_counter=count_tokens):
+    """统计一条消息的 token 数量，包括工具调用的名称和参数"""
+    tokens = MESSAGE_OVERHEAD + token_counter(message.get("content") or "")
+    for call in message.get("tool_calls") or []:
+        tokens += token_counter(call["function"]["name"]) + token_counter(call["function"]["arguments"])
+    return tokens
+
+
+def truncate_observation(text, max_tokens, token_counter=count_tokens):
+    """
+    将工具返回结果截断到约 max_tokens 个 token，并注明原始长度
+
+    近似计数下 token 数不超过字符数，因此先按字符截断再逐步缩短即可
+    """
+    total = token_counter(text)
+    if total <= max_tokens:
+        return text
+    kept = text[:max_tokens]
+    while kept and token_counter(kept) > max_tokens:
+        kept = kept[:len(kept) * 3 // 4]
+    return f"{kept}……[已截断，原始结果约 {total} tokens]"
+
+
+class ConversationManager:
+    """
+    多轮 Agent 对话的上下文管理器
+
+    - 稳定前缀: 系统提示词、工具定义和首条用户消息在整个会话中保持字节级不变，
+      且始终位于请求的最前面，使服务端的前缀缓存(例如 DeepSeek 的上下文硬盘缓存)可以命中
+    - 压缩: 对话超过 token_budget 时，把较早的工具返回结果截断或摘要，
+      最近的 keep_recent 条工具结果保持原样；压缩后的内容会被保留，之后的请求共享同一前缀
+    - 计数: 在本地近似统计 token 数量，并记录服务端返回的缓存命中 token 数
+
+    参数:
+        system_prompt (str): 系统提示词
+        tools_definition (list): 工具定义，内部保存一份规范化的副本
+        token_budget (int): 对话的 token 上限，None 表示不压缩
+        keep_recent (int): 不参与压缩的最近工具结果数量
+        max_observation_tokens (int): 被压缩的工具结果保留的 token 数
+        summarizer (callable): 自定义的压缩函数，接收工具结果文本，返回摘要；默认截断
+        token_counter (callable): token 计数函数，默认按 DeepSeek 的字符换算比例估算
+    """
+
+    def __init__(self, system_prompt, tools_definition=None, token_budget=None, keep_recent=3,
+                 max_observation_tokens=64, summarizer=None, token_counter=count_tokens):
+        self.system_prompt = system_prompt
+        # 按键排序后重新解析，保证每次请求序列化出的工具定义完全一致
+        self.tools_definition = (
+            json.loads(json.dumps(tools_definition, sort_keys=True, ensure_ascii=False))
+            if tools_definition else None
+        )
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.max_observation_tokens = max_observation_tokens
+        self.summarizer = summarizer
+        self.token_counter = token_counter
+        self._messages = [{"role": "system", "content": system_prompt}]
+        self._tokens = [count_message_tokens(self._messages[0], token_counter)]
+        self._compacted = set()  # 已压缩的消息下标
+        self.prompt_tokens = []  # 每次请求的本地估算 token 数
+        self.cache_hit_tokens = 0
+        self.cache_miss_tokens = 0
+
+    def add_user(self, content):
+        self._append({"role": "user", "content": content})
+
+    def add_assistant(self, message):
+        message = {key: value for key, value in message.items() if value or key == "content"}
+        message["role"] = "assistant"
+        self._append(message)
+
+    def add_tool_results(self, tool_messages):
+        for message in tool_messages:
+            self._append(dict(message))
+
+    def total_tokens(self):
+        return sum(self._tokens)
+
+    def messages(self):
+        """
+        返回下一次请求使用的消息列表，超过 token_budget 时先压缩较早的工具结果
+        """
+        if self.token_budget is not None and self.total_tokens() > self.token_budget:
+            self._compact()
+        self.prompt_tokens.append(self.total_tokens())
+        # 消息只会被整体替换而不会原地修改，浅拷贝即可
+        return list(self._messages)
+
+    def request_kwargs(self):
+        """返回 chat.completions.create 的 messages 参数，有工具定义时加上 tools 和 tool_choice"""
+        kwargs = {"messages": self.messages()}
+        if self.tools_definition:
+            kwargs["tools"] = self.tools_definition
+            kwargs["tool_choice"] = "auto"
+        return kwargs
+
+    def record_usage(self, usage):
+        """记录服务端返回的前缀缓存命中情况(DeepSeek 返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens)"""
+        if usage is None:
+            return
+        self.cache_hit_tokens += getattr(usage, "prompt_cache_hit_tokens", None) or 0
+        self.cache_miss_tokens += getattr(usage, "prompt_cache_miss_tokens", None) or 0
+
+    def _append(self, message):
+        self._messages.append(message)
+        self._tokens.append(count_message_tokens(message, self.token_counter))
+
+    def _compact(self):
+        tool_indexes = [i for i, message in enumerate(self._messages) if message["role"] == "tool"]
+        candidates = tool_indexes[:-self.keep_recent] if self.keep_recent else tool_indexes
+        # 从最早的工具结果开始压缩，直到总量回到预算以内
+        for i in candidates:
+            if self.total_tokens() <= self.token_budget:
+                break
+            if i in self._compacted:
+                continue
+            content = self._messages[i]["content"]
+            if self.summarizer is not None:
+                compacted = self.summarizer(content)
+            else:
+                compacted = truncate_observation(content, self.max_observation_tokens, self.token_counter)
+            self._messages[i] = {**self._messages[i], "content": compacted}
+            self._tokens[i] = count_message_tokens(self._messages[i], self.token_counter)
+            self._compacted.add(i)
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import time
+import uuid
+from types import SimpleNamespace
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数量，仅用于填充 usage 字段"""
+    return max(1, len(text or "") // 2)
+
+
+class MockAsyncClient:
+    """
+    进程内模拟的 AsyncOpenAI 客户端，用于离线运行和测试，不需要网络和 openai 包
+
+    只实现 client.chat.completions.create，支持普通响应和 stream=True 的流式响应，
+    返回对象的字段与 openai 的 ChatCompletion / ChatCompletionChunk 一致。
+
+    参数:
+        responder (callable): 接收请求体 dict，返回 assistant 消息 dict
+            (包含 content，可选 tool_calls)；抛出的异常原样传给调用方，模拟请求失败
+        latency (float): 每个请求的模拟延迟(秒)
+
+    示例:
+        client = MockAsyncClient(lambda body: {"content": "你好"})
+        response = await client.chat.completions.create(model="deepseek-chat", messages=[...])
+    """
+
+    def __init__(self, responder, latency=0.0):
+        self.responder = responder
+        self.latency = latency
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def close(self):
+        pass
+
+    async def _create(self, **kwargs):
+        # 与真实请求一样经过 JSON 序列化，记录的请求体不受调用方之后修改的影响
+        body = json.loads(json.dumps(kwargs, ensure_ascii=False))
+        self.requests.append(body)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = dict(self.responder(body))
+        content = message.get("content")
+        tool_calls = message.get("tool_calls") or []
+        prompt_tokens = sum(estimate_tokens(str(m.get("content"))) for m in body.get("messages", []))
+        completion_tokens = estimate_tokens(content)
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        )
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": body.get("model")}
+        if body.get("stream"):
+            return self._stream(base, content, tool_calls, finish_reason, usage)
+        calls = [
+            SimpleNamespace(id=call["id"], type="function", function=SimpleNamespace(**call["function"]))
+            for call in tool_calls
+        ]
+        choice = SimpleNamespace(
+            index=0,
+            message=SimpleNamespace(role="assistant", content=content, tool_calls=calls or None),
+            finish_reason=finish_reason,
+        )
+        return SimpleNamespace(**base, object="chat.completion", choices=[choice], usage=usage)
+
+    @staticmethod
+    async def _stream(base, content, tool_calls, finish_reason, usage):
+        """将完整响应拆分为 chat.completion.chunk 事件"""
+
+        def chunk(finish=None, **delta):
+            delta = SimpleNamespace(**{"content": None, "tool_calls": None, **delta})
+            choice = SimpleNamespace(index=0, delta=delta, finish_reason=finish)
+            return SimpleNamespace(**base, object="chat.completion.chunk", choices=[choice], usage=None)
+
+        yield chunk(role="assistant", content="")
+        # 每次发送若干字符，模拟逐 token 输出
+        for i in range(0, len(content or ""), 4):
+            yield chunk(content=content[i:i + 4])
+        for index, call in enumerate(tool_calls):
+            function = SimpleNamespace(**call["function"])
+            yield chunk(tool_calls=[SimpleNamespace(index=index, id=call["id"], type="function", function=function)])
+        yield chunk(finish_reason)
+        yield SimpleNamespace(**base, object="chat.completion.chunk", choices=[], usage=usage)
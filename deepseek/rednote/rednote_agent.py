@@ -0,0 +1,382 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+
+from conversation import ConversationManager, count_tokens
+from tool_registry import ToolRegistry
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = """
+你是一个资深的小红书爆款文案专家，擅长结合最新潮流和产品卖点，创作引人入胜、高互动、高转化的笔记文案。
+
+你的任务是根据用户提供的产品和需求，生成包含标题、正文、相关标签和表情符号的完整小红书笔记。
+
+请始终采用'Thought-Action-Observation'模式进行推理和行动。文案风格需活泼、真诚、富有感染力。当完成任务后，请以JSON格式直接输出最终文案，格式如下：
+```json
+{
+  "title": "小红书标题",
+  "body": "小红书正文",
+  "hashtags": ["#标签1", "#标签2", "#标签3", "#标签4", "#标签5"],
+  "emojis": ["✨", "🔥", "💖"]
+}
+```
+在生成文案前，请务必先思考并收集足够的信息。
+"""
+
+USER_PROMPT_TEMPLATE = "请为产品「{product_name}」生成一篇小红书爆款文案。要求：语气{tone_style}，包含标题、正文、至少5个相关标签和5个表情符号。请以完整的JSON格式输出，并确保JSON内容用markdown代码块包裹（例如：```json{{...}}```）。"
+
+TOOLS_DEFINITION = [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_web",
+            "description": "搜索互联网上的实时信息，用于获取最新新闻、流行趋势、用户评价、行业报告等。请确保搜索关键词精确，避免宽泛的查询。",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "要搜索的关键词或问题，例如'最新小红书美妆趋势'或'深海蓝藻保湿面膜 用户评价'"
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "query_product_database",
+            "description": "查询内部产品数据库，获取指定产品的详细卖点、成分、适用人群、使用方法等信息。",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "product_name": {
+                        "type": "string",
+                        "description": "要查询的产品名称，例如'深海蓝藻保湿面膜'"
+                    }
+                },
+                "required": ["product_name"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "generate_emoji",
+            "description": "根据提供的文本内容，生成一组适合小红书风格的表情符号。",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "context": {
+                        "type": "string",
+                        "description": "文案的关键内容或情感，例如'惊喜效果'、'补水保湿'"
+                    }
+                },
+                "required": ["context"]
+            }
+        }
+    }
+]
+
+
+# --- 模拟工具(异步版本) ---
+# 与 rednote.ipynb 中的模拟工具返回相同的结果，使用 asyncio.sleep 模拟延迟，便于并发执行
+
+async def mock_search_web(query: str) -> str:
+    """模拟网页搜索工具，返回预设的搜索结果。"""
+    await asyncio.sleep(1)  # 模拟网络延迟
+    if "小红书美妆趋势" in query:
+        return "近期小红书美妆流行'多巴胺穿搭'、'早C晚A'护肤理念、'伪素颜'妆容，热门关键词有#氛围感、#抗老、#屏障修复。"
+    elif "保湿面膜" in query:
+        return "小红书保湿面膜热门话题：沙漠干皮救星、熬夜急救面膜、水光肌养成。用户痛点：卡粉、泛红、紧绷感。"
+    elif "深海蓝藻保湿面膜" in query:
+        return "关于深海蓝藻保湿面膜的用户评价：普遍反馈补水效果好，吸收快，对敏感肌友好。有用户提到价格略高，但效果值得。"
+    else:
+        return f"未找到关于 '{query}' 的特定信息，但市场反馈通常关注产品成分、功效和用户体验。"
+
+
+async def mock_query_product_database(product_name: str) -> str:
+    """模拟查询产品数据库，返回预设的产品信息。"""
+    await asyncio.sleep(0.5)  # 模拟数据库查询延迟
+    if "深海蓝藻保湿面膜" in product_name:
+        return "深海蓝藻保湿面膜：核心成分为深海蓝藻提取物，富含多糖和氨基酸，能深层补水、修护肌肤屏障、舒缓敏感泛红。质地清爽不粘腻，适合所有肤质，尤其适合干燥、敏感肌。规格：25ml*5片。"
+    elif "美白精华" in product_name:
+        return "美白精华：核心成分是烟酰胺和VC衍生物，主要功效是提亮肤色、淡化痘印、改善暗沉。质地轻薄易吸收，适合需要均匀肤色的人群。"
+    else:
+        return f"产品数据库中未找到关于 '{product_name}' 的详细信息。"
+
+
+async def mock_generate_emoji(context: str) -> list:
+    """模拟生成表情符号，根据上下文提供常用表情。"""
+    await asyncio.sleep(0.2)  # 模拟生成延迟
+    if "补水" in context or "水润" in context or "保湿" in context:
+        return ["💦", "💧", "🌊", "✨"]
+    elif "惊喜" in context or "哇塞" in context or "爱了" in context:
+        return ["💖", "😍", "🤩", "💯"]
+    elif "熬夜" in context or "疲惫" in context:
+        return ["😭", "😮‍💨", "😴", "💡"]
+    elif "好物" in context or "推荐" in context:
+        return ["✅", "👍", "⭐", "🛍️"]
+    else:
+        return random.sample(["✨", "🔥", "💖", "💯", "🎉", "👍", "🤩", "💧", "🌿"], k=min(5, len(context.split())))
+
+
+MOCK_TOOLS = {
+    "search_web": mock_search_web,
+    "query_product_database": mock_query_product_database,
+    "generate_emoji": mock_generate_emoji,
+}
+
+
+def extract_note(content):
+    """
+    从模型输出中解析最终文案
+
+    优先解析 ```json 代码块，否则尝试把整个内容当作 JSON 解析
+
+    返回:
+        dict | None: 解析成功时返回文案字典，否则返回 None
+    """
+    match = re.search(r"```json\s*(\{.*\})\s*```", content, re.DOTALL)
+    try:
+        return json.loads(match.group(1) if match else content)
+    except json.JSONDecodeError:
+        return None
+
+
+def as_tool_registry(tools):
+    """
+    将 {工具名称: 函数} 的映射转换为 ToolRegistry，已经是 ToolRegistry 时原样返回
+
+    参数:
+        tools (dict | ToolRegistry): 工具，None 表示使用模拟工具 MOCK_TOOLS
+    """
+    if isinstance(tools, ToolRegistry):
+        return tools
+    return ToolRegistry.from_functions(MOCK_TOOLS if tools is None else tools)
+
+
+def _cache_key(tool_call):
+    """工具调用的缓存键: 参数按键排序，参数顺序不同的相同调用也能命中"""
+    arguments = tool_call["function"]["arguments"] or "{}"
+    try:
+        arguments = json.dumps(json.loads(arguments), sort_keys=True, ensure_ascii=False)
+    except json.JSONDecodeError:
+        pass
+    return tool_call["function"]["name"], arguments
+
+
+class RednoteAgent:
+    """
+    基于 asyncio 的小红书文案生成 Agent
+
+    与 rednote.ipynb 中的 generate_rednote 流程一致，但是:
+    - 同一轮模型输出中的全部 tool_calls 并发执行，一轮的耗时约等于最慢的工具
+    - 以流式方式接收模型输出，on_token 回调实时收到每个文本片段
+    - 同一会话内相同 (工具, 参数) 的调用结果被缓存，不会重复执行
+    - 每轮迭代的模型耗时、首字延迟和工具耗时记录在 timings 中并写入日志
+
+    参数:
+        client: openai.AsyncOpenAI 实例
+        tools (dict | ToolRegistry): 工具名称到函数的映射或工具注册表，函数可以是同步或异步的；
+            查找、参数检查、超时和错误处理都由 ToolRegistry.dispatch 完成，同步函数在其线程池中执行
+        model (str): 模型名称
+        max_iterations (int): 最大迭代次数，防止无限循环
+        stream (bool): 是否流式接收模型输出
+        on_token (callable): 流式输出时每收到一个文本片段调用一次
+        rate_limiter: 提供 async acquire() 的限流器，每次调用模型前等待，None 表示不限速
+        context_token_budget (int): 对话的 token 上限，超过后压缩较早的工具结果，None 表示不压缩
+        keep_recent_observations (int): 压缩时保持原样的最近工具结果数量
+        token_counter (callable): 对话 token 计数函数，默认按 DeepSeek 的字符换算比例估算
+    """
+
+    def __init__(self, client, tools=None, model="deepseek-chat", max_iterations=5,
+                 stream=True, on_token=None, tools_definition=TOOLS_DEFINITION,
+                 system_prompt=SYSTEM_PROMPT, rate_limiter=None, context_token_budget=None,
+                 keep_recent_observations=3, token_counter=count_tokens):
+        self.client = client
+        self.tools = as_tool_registry(tools)
+        self.model = model
+        self.max_iterations = max_iterations
+        self.stream = stream
+        self.on_token = on_token
+        self.tools_definition = tools_definition
+        self.system_prompt = system_prompt
+        self.rate_limiter = rate_limiter
+        self.context_token_budget = context_token_budget
+        self.keep_recent_observations = keep_recent_observations
+        self.token_counter = token_counter
+        self.conversation = None
+        self.timings = []
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0}
+
+    async def generate(self, product_name, tone_style="活泼甜美"):
+        """
+        生成一篇小红书文案
+
+        返回:
+            dict | None: 解析后的文案字典；达到最大迭代次数仍未生成时返回 None
+        """
+        # 系统提示词、工具定义和用户请求构成稳定前缀，较早的工具结果超出预算时被压缩
+        conversation = ConversationManager(
+            self.system_prompt,
+            self.tools_definition,
+            token_budget=self.context_token_budget,
+            keep_recent=self.keep_recent_observations,
+            token_counter=self.token_counter,
+        )
+        conversation.add_user(USER_PROMPT_TEMPLATE.format(product_name=product_name, tone_style=tone_style))
+        self.conversation = conversation
+        tool_cache = {}
+        self.timings = []
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0}
+
+        for iteration in range(1, self.max_iterations + 1):
+            start = time.perf_counter()
+            message, first_token = await self._complete(conversation)
+            model_seconds = time.perf_counter() - start
+
+            tool_seconds = 0.0
+            if message["tool_calls"]:
+                conversation.add_assistant(message)
+                tool_start = time.perf_counter()
+                conversation.add_tool_results(await self._run_tools(message["tool_calls"], tool_cache))
+                tool_seconds = time.perf_counter() - tool_start
+
+            self._record(iteration, model_seconds, first_token, tool_seconds, len(message["tool_calls"]))
+
+            if message["tool_calls"]:
+                continue
+            if message["content"]:
+                note = extract_note(message["content"])
+                if note is not None:
+                    return note
+                logger.info("第 %d 轮: 模型输出不是合法的 JSON 文案，继续对话", iteration)
+                conversation.add_assistant({"content": message["content"]})
+            else:
+                logger.warning("第 %d 轮: 模型没有返回内容或工具调用", iteration)
+                break
+
+        logger.warning("Agent 达到最大迭代次数或未能生成最终文案")
+        return None
+
+    async def _complete(self, conversation):
+        """
+        调用模型，返回 (assistant 消息 dict, 首字延迟秒数)
+        """
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        start = time.perf_counter()
+        kwargs = {"model": self.model, **conversation.request_kwargs()}
+        if not self.stream:
+            response = await self.client.chat.completions.create(**kwargs)
+            self._add_usage(response.usage)
+            message = response.choices[0].message
+            tool_calls = [
+                {"id": call.id, "type": "function",
+                 "function": {"name": call.function.name, "arguments": call.function.arguments}}
+                for call in message.tool_calls or []
+            ]
+            return self._message(message.content, tool_calls), time.perf_counter() - start
+
+        stream = await self.client.chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **kwargs
+        )
+        content = []
+        tool_calls = {}
+        first_token = None
+        async for chunk in stream:
+            if chunk.usage:
+                self._add_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                if self.on_token:
+                    self.on_token(delta.content)
+            # 工具调用的参数分多个片段到达，按 index 拼接
+            for call in delta.tool_calls or []:
+                entry = tool_calls.setdefault(
+                    call.index, {"id": "", "type": "function", "function": {"name": "", "arguments": ""}}
+                )
+                if call.id:
+                    entry["id"] = call.id
+                if call.function and call.function.name:
+                    entry["function"]["name"] += call.function.name
+                if call.function and call.function.arguments:
+                    entry["function"]["arguments"] += call.function.arguments
+        calls = [tool_calls[index] for index in sorted(tool_calls)]
+        return self._message("".join(content) or None, calls), first_token
+
+    async def _run_tools(self, tool_calls, tool_cache):
+        """
+        并发执行一轮中的全部工具调用，返回与 tool_calls 顺序一致的 tool 消息
+
+        实际执行交给 ToolRegistry.dispatch，这里只负责会话内的缓存:
+        相同 (工具, 参数) 的调用只执行一次；失败的结果不缓存，下一轮可以重试
+        """
+        keys = [_cache_key(call) for call in tool_calls]
+        pending = {}
+        for key, call in zip(keys, tool_calls):
+            if key in tool_cache or key in pending:
+                logger.info("工具 '%s' 命中缓存，参数：%s", *key)
+            else:
+                pending[key] = call
+
+        results = {}
+        for key, message in zip(pending, await self.tools.dispatch(list(pending.values()))):
+            results[key] = message["content"]
+            # ToolRegistry 以 "错误：" 开头的内容返回未知工具、参数错误、超时和异常
+            if not message["content"].startswith("错误："):
+                tool_cache[key] = message["content"]
+        return [
+            {"tool_call_id": call["id"], "role": "tool", "content": results.get(key, tool_cache.get(key))}
+            for key, call in zip(keys, tool_calls)
+        ]
+
+    def _record(self, iteration, model_seconds, first_token, tool_seconds, tool_count):
+        timing = {
+            "iteration": iteration,
+            "model_seconds": model_seconds,
+            "first_token_seconds": first_token,
+            "tool_seconds": tool_seconds,
+            "tool_calls": tool_count,
+            "prompt_tokens": self.conversation.prompt_tokens[-1],  # 本地估算的请求 token 数
+        }
+        self.timings.append(timing)
+        logger.info(
+            "第 %d 轮: 请求约 %d tokens，模型 %.2fs (首字 %s)，%d 个工具调用 %.2fs",
+            iteration, timing["prompt_tokens"], model_seconds,
+            "-" if first_token is None else f"{first_token:.2f}s",
+            tool_count, tool_seconds,
+        )
+
+    def _add_usage(self, usage):
+        if usage:
+            self.conversation.record_usage(usage)
+            self.usage["prompt_tokens"] += usage.prompt_tokens or 0
+            self.usage["completion_tokens"] += usage.completion_tokens or 0
+
+    @staticmethod
+    def _message(content, tool_calls):
+        # 只有带 tool_calls 的消息会原样加入对话历史，因此 tool_calls 可以为空列表
+        return {"role": "assistant", "content": content, "tool_calls": tool_calls}
+
+
+async def generate_rednote(client, product_name, tone_style="活泼甜美", max_iterations=5, **kwargs):
+    """
+    生成小红书文案，返回与 rednote.ipynb 中 generate_rednote 相同格式的 JSON 字符串
+    """
+    agent = RednoteAgent(client, max_iterations=max_iterations, **kwargs)
+    note = await agent.generate(product_name, tone_style)
+    if note is None:
+        return "未能成功生成文案。"
+    return json.dumps(note, ensure_ascii=False, indent=2)
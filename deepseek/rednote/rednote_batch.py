@@ -0,0 +1,308 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+
+from rednote_agent import RednoteAgent, as_tool_registry
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRateLimiter:
+    """
+    asyncio 令牌桶限流器，所有并发会话共享
+
+    令牌以 rate 的速度补充，最多积攒 burst 个，burst 与会话并发数相互独立。
+    与 deepseek/api/rate_limiter.py 中的同名类行为一致，需要和其他模块共享同一个限流器时，
+    通过 RednoteBatchRunner 的 rate_limiter 参数传入那个实例即可。
+
+    参数:
+        rate (float): 每秒允许的请求数
+        burst (int): 允许的最大突发请求数
+    """
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0 or burst < 1:
+            raise ValueError("错误：rate 必须大于 0，burst 必须至少为 1")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _take(self):
+        """尝试取出一个令牌，成功返回 0，否则返回还需等待的秒数"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self):
+        """获取一个令牌，令牌不足时让出事件循环等待"""
+        async with self._lock:
+            while wait := self._take():
+                await asyncio.sleep(wait)
+
+
+def load_products(path):
+    """
+    读取产品列表，支持 CSV(带表头) 和 JSONL 两种格式
+
+    每条记录必须包含 product_name，可选 tone_style 和 id
+
+    返回:
+        list[dict]: 产品记录列表
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        if path.endswith(".jsonl"):
+            products = [json.loads(line) for line in file if line.strip()]
+        else:
+            products = list(csv.DictReader(file))
+    for product in products:
+        if not product.get("product_name"):
+            raise ValueError(f"产品记录缺少 product_name: {product}")
+    return products
+
+
+def product_key(product):
+    """产品记录的唯一键，用于断点续跑时判断是否已经生成"""
+    return product.get("id") or f"{product['product_name']}|{product.get('tone_style') or ''}"
+
+
+def load_completed(output_path):
+    """
+    读取已有的输出文件，返回已成功生成的产品键集合
+
+    进程崩溃时最后一行可能只写了一半，无法解析的行直接忽略
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["key"])
+    return completed
+
+
+@dataclass
+class BatchReport:
+    """批量生成的统计信息"""
+    total: int = 0
+    skipped: int = 0  # 断点续跑时已完成而跳过的产品
+    succeeded: int = 0
+    failed: int = 0
+    over_budget: int = 0  # 因 token 预算耗尽而未执行的产品
+    tokens: int = 0
+    seconds: float = 0.0
+    errors: list = field(default_factory=list)
+
+    @property
+    def notes_per_minute(self):
+        return self.succeeded / self.seconds * 60 if self.seconds else 0.0
+
+    @property
+    def tokens_per_note(self):
+        return self.tokens / self.succeeded if self.succeeded else 0.0
+
+    @property
+    def failure_rate(self):
+        attempted = self.succeeded + self.failed
+        return self.failed / attempted if attempted else 0.0
+
+    def summary(self):
+        return (
+            f"共 {self.total} 个产品: 成功 {self.succeeded}，失败 {self.failed}，"
+            f"跳过(已完成) {self.skipped}，超出预算 {self.over_budget}\n"
+            f"耗时 {self.seconds:.1f} 秒，吞吐量 {self.notes_per_minute:.1f} 篇/分钟，"
+            f"平均 {self.tokens_per_note:.0f} tokens/篇，失败率 {self.failure_rate:.1%}"
+        )
+
+
+class RednoteBatchRunner:
+    """
+    小红书文案批量生成器
+
+    多个 Agent 会话并发执行，所有会话共享同一个请求速率限制和 token 预算。
+    每完成一个产品立即追加一行 JSONL 结果，重新运行时跳过已成功的产品，从中断处继续。
+
+    参数:
+        client: openai.AsyncOpenAI 实例，离线运行时可以传入 MockAsyncClient
+        output_path (str): JSONL 结果文件路径
+        concurrency (int): 同时运行的会话数量
+        requests_per_second (float): 所有会话合计的模型请求速率上限，None 表示不限速
+        burst (int): 限速时允许的最大突发请求数，与 concurrency 相互独立
+        rate_limiter: 外部传入的限流器(任何提供 async acquire() 的对象)，用于与其他任务共享限额，
+            传入后忽略 requests_per_second 和 burst
+        token_budget (int): 所有会话合计的 token 上限，耗尽后不再开始新的会话，None 表示不限制
+        agent_kwargs (dict): 传给 RednoteAgent 的其他参数，例如 tools、model、max_iterations
+    """
+
+    def __init__(self, client, output_path, concurrency=8, requests_per_second=None, burst=1,
+                 rate_limiter=None, token_budget=None, **agent_kwargs):
+        self.client = client
+        self.output_path = output_path
+        self.concurrency = concurrency
+        if rate_limiter is None and requests_per_second:
+            rate_limiter = AsyncRateLimiter(requests_per_second, burst=burst)
+        self.rate_limiter = rate_limiter
+        self.token_budget = token_budget
+        # 所有会话共用一个工具注册表，以及其中执行同步工具的线程池
+        agent_kwargs["tools"] = as_tool_registry(agent_kwargs.get("tools"))
+        self.agent_kwargs = agent_kwargs
+
+    async def run(self, products):
+        """
+        为全部产品生成文案
+
+        参数:
+            products (list[dict]): 产品记录，包含 product_name，可选 tone_style 和 id
+
+        返回:
+            BatchReport: 统计信息
+        """
+        start = time.perf_counter()
+        report = BatchReport(total=len(products))
+        completed = load_completed(self.output_path)
+        pending = [product for product in products if product_key(product) not in completed]
+        report.skipped = len(products) - len(pending)
+
+        queue = asyncio.Queue()
+        for product in pending:
+            queue.put_nowait(product)
+
+        with open(self.output_path, "a", encoding="utf-8") as output:
+            async def worker():
+                while not queue.empty():
+                    product = queue.get_nowait()
+                    if self.token_budget is not None and report.tokens >= self.token_budget:
+                        report.over_budget += 1
+                        continue
+                    record = await self._generate(product)
+                    report.tokens += record["tokens"]
+                    if record["status"] == "ok":
+                        report.succeeded += 1
+                    else:
+                        report.failed += 1
+                        report.errors.append(record["error"])
+                    # 每条结果立即写入磁盘，进程崩溃时已完成的结果不会丢失
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    output.flush()
+
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+        report.seconds = time.perf_counter() - start
+        return report
+
+    async def _generate(self, product):
+        agent = RednoteAgent(self.client, rate_limiter=self.rate_limiter, **self.agent_kwargs)
+        tone_style = product.get("tone_style") or "活泼甜美"
+        start = time.perf_counter()
+        record = {
+            "key": product_key(product),
+            "product_name": product["product_name"],
+            "tone_style": tone_style,
+        }
+        try:
+            note = await agent.generate(product["product_name"], tone_style)
+            if note is None:
+                record.update(status="error", error="未能生成文案")
+            else:
+                record.update(status="ok", note=note)
+        except Exception as e:
+            logger.warning("产品 %s 生成失败: %s", product["product_name"], e)
+            record.update(status="error", error=f"{type(e).__name__}: {e}")
+        record.update(
+            tokens=agent.usage["prompt_tokens"] + agent.usage["completion_tokens"],
+            prompt_tokens=agent.usage["prompt_tokens"],
+            completion_tokens=agent.usage["completion_tokens"],
+            iterations=len(agent.timings),
+            seconds=round(time.perf_counter() - start, 3),
+        )
+        return record
+
+
+def mock_rednote_responder(body):
+    """
+    离线运行时使用的模拟模型: 第一轮并发调用三个工具，第二轮输出 JSON 文案
+    """
+    messages = body["messages"]
+    user = next(message["content"] for message in messages if message["role"] == "user")
+    match = re.search(r"「(.+?)」", user)
+    product_name = match.group(1) if match else "产品"
+    if not any(message["role"] == "tool" for message in messages):
+        arguments = [
+            ("search_web", {"query": f"{product_name} 用户评价"}),
+            ("query_product_database", {"product_name": product_name}),
+            ("generate_emoji", {"context": "好物推荐"}),
+        ]
+        return {"content": None, "tool_calls": [
+            {"id": f"call_{i}", "type": "function",
+             "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)}}
+            for i, (name, args) in enumerate(arguments)
+        ]}
+    note = {
+        "title": f"{product_name}真的绝了！",
+        "body": f"最近入手了{product_name}，体验超出预期。",
+        "hashtags": [f"#{product_name}", "#好物推荐", "#种草", "#小红书爆款", "#测评"],
+        "emojis": ["✨", "🔥", "💖", "👍", "🛍️"],
+    }
+    return {"content": f"```json\n{json.dumps(note, ensure_ascii=False)}\n```"}
+
+
+async def _main(args):
+    products = load_products(args.products)
+    if args.mock:
+        from mock_async_client import MockAsyncClient
+
+        client = MockAsyncClient(mock_rednote_responder, latency=args.mock_latency)
+    else:
+        from openai import AsyncOpenAI
+
+        client = AsyncOpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), base_url=args.base_url)
+    try:
+        runner = RednoteBatchRunner(
+            client,
+            args.output,
+            concurrency=args.concurrency,
+            requests_per_second=args.rps,
+            burst=args.burst,
+            token_budget=args.token_budget,
+            model=args.model,
+            stream=False,
+        )
+        report = await runner.run(products)
+    finally:
+        await client.close()
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="小红书文案批量生成")
+    parser.add_argument("products", help="产品列表文件(.csv 或 .jsonl)，包含 product_name，可选 tone_style、id")
+    parser.add_argument("--output", default="rednotes.jsonl", help="结果文件，重新运行时从中断处继续")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时运行的会话数量")
+    parser.add_argument("--rps", type=float, default=None, help="每秒模型请求数上限")
+    parser.add_argument("--burst", type=int, default=1, help="限速时允许的最大突发请求数")
+    parser.add_argument("--token-budget", type=int, default=None, help="总 token 预算")
+    parser.add_argument("--model", default="deepseek-chat")
+    parser.add_argument("--base-url", default="https://api.deepseek.com/v1")
+    parser.add_argument("--mock", action="store_true", help="使用进程内模拟的 chat.completions 客户端离线运行")
+    parser.add_argument("--mock-latency", type=float, default=0.2, help="模拟服务每个请求的延迟(秒)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    asyncio.run(_main(args))
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import unittest
+from types import SimpleNamespace
+
+from conversation import ConversationManager, count_message_tokens, count_tokens, truncate_observation
+from mock_async_client import MockAsyncClient
+from rednote_agent import SYSTEM_PROMPT, TOOLS_DEFINITION, RednoteAgent
+
+LONG_OBSERVATION = "这是一段很长的搜索结果。" * 200
+
+
+def add_turn(conversation, index, observation=LONG_OBSERVATION):
+    call = {"id": f"call_{index}", "type": "function",
+            "function": {"name": "search_web", "arguments": json.dumps({"query": str(index)})}}
+    conversation.add_assistant({"content": None, "tool_calls": [call]})
+    conversation.add_tool_results([{"tool_call_id": call["id"], "role": "tool", "content": observation}])
+
+
+class TestTokenCounting(unittest.TestCase):
+    def test_count_tokens(self):
+        # 3 个汉字 * 0.6 + 9 个非空白字符 * 0.3 = 4.5，向上取整
+        self.assertEqual(count_tokens("小红书 note 2024!"), 5)
+        self.assertEqual(count_tokens("  \n"), 0)
+        self.assertEqual(count_tokens(None), 0)
+
+    def test_custom_token_counter(self):
+        """可以注入其他模块的计数函数，压缩和统计都使用它"""
+        counted = []
+
+        def counter(text):
+            counted.append(text)
+            return len(text)
+
+        conversation = ConversationManager(SYSTEM_PROMPT, None, token_budget=500, token_counter=counter)
+        conversation.add_user("请为产品生成文案")
+        conversation.messages()
+        self.assertIn("请为产品生成文案", counted)
+
+    def test_count_message_tokens_includes_tool_calls(self):
+        message = {"role": "assistant", "content": None, "tool_calls": [
+            {"function": {"name": "search_web", "arguments": '{"query": "面膜"}'}},
+        ]}
+        self.assertGreater(count_message_tokens(message), count_message_tokens({"content": None}))
+
+    def test_truncate_observation(self):
+        truncated = truncate_observation(LONG_OBSERVATION, 20)
+        self.assertIn("已截断", truncated)
+        self.assertLess(count_tokens(truncated), 40)
+        self.assertEqual(truncate_observation("短结果", 20), "短结果")
+
+
+class TestConversationManager(unittest.TestCase):
+    def test_prefix_is_stable_across_iterations(self):
+        """系统提示词、工具定义和首条用户消息在每次请求中保持不变且位于最前面"""
+        conversation = ConversationManager(SYSTEM_PROMPT, TOOLS_DEFINITION, token_budget=500, keep_recent=1)
+        conversation.add_user("请为产品生成文案")
+        first = conversation.request_kwargs()
+        for i in range(5):
+            add_turn(conversation, i)
+            kwargs = conversation.request_kwargs()
+            self.assertEqual(kwargs["messages"][:2], first["messages"][:2])
+            self.assertEqual(json.dumps(kwargs["tools"]), json.dumps(first["tools"]))
+
+    def test_tool_choice_only_with_tools(self):
+        """没有工具定义时不发送 tools 和 tool_choice"""
+        with_tools = ConversationManager(SYSTEM_PROMPT, TOOLS_DEFINITION).request_kwargs()
+        self.assertEqual(with_tools["tool_choice"], "auto")
+        for tools in (None, []):
+            with self.subTest(tools=tools):
+                kwargs = ConversationManager(SYSTEM_PROMPT, tools).request_kwargs()
+                self.assertNotIn("tools", kwargs)
+                self.assertNotIn("tool_choice", kwargs)
+
+    def test_compaction_bounds_prompt_size(self):
+        """超过预算后压缩较早的工具结果，最近的工具结果保持原样"""
+        conversation = ConversationManager(SYSTEM_PROMPT, TOOLS_DEFINITION, token_budget=2_500, keep_recent=1)
+        conversation.add_user("请为产品生成文案")
+        for i in range(8):
+            add_turn(conversation, i)
+            messages = conversation.messages()
+        self.assertLessEqual(conversation.prompt_tokens[-1], 2_500)
+        tool_messages = [m for m in messages if m["role"] == "tool"]
+        self.assertEqual(tool_messages[-1]["content"], LONG_OBSERVATION)
+        self.assertTrue(all("已截断" in m["content"] for m in tool_messages[:-1]))
+
+    def test_compacted_history_is_reused(self):
+        """压缩后的内容被保留，之后的请求共享同一个压缩后的前缀(只有刚移出 keep_recent 的结果会变化)"""
+        conversation = ConversationManager(SYSTEM_PROMPT, None, token_budget=4_000, keep_recent=1)
+        conversation.add_user("请为产品生成文案")
+        for i in range(4):
+            add_turn(conversation, i)
+        before = conversation.messages()
+        add_turn(conversation, 4, observation="短结果")
+        after = conversation.messages()
+        self.assertEqual(after[:len(before) - 1], before[:-1])
+
+    def test_without_budget_history_is_unchanged(self):
+        conversation = ConversationManager(SYSTEM_PROMPT)
+        conversation.add_user("请为产品生成文案")
+        for i in range(4):
+            add_turn(conversation, i)
+        self.assertTrue(all(m["content"] == LONG_OBSERVATION for m in conversation.messages() if m["role"] == "tool"))
+
+    def test_custom_summarizer(self):
+        conversation = ConversationManager(SYSTEM_PROMPT, token_budget=100, keep_recent=0,
+                                           summarizer=lambda text: "摘要")
+        conversation.add_user("请为产品生成文案")
+        add_turn(conversation, 0)
+        self.assertEqual(conversation.messages()[-1]["content"], "摘要")
+
+    def test_record_usage(self):
+        conversation = ConversationManager(SYSTEM_PROMPT)
+        conversation.record_usage(SimpleNamespace(prompt_cache_hit_tokens=100, prompt_cache_miss_tokens=20))
+        conversation.record_usage(SimpleNamespace())
+        self.assertEqual((conversation.cache_hit_tokens, conversation.cache_miss_tokens), (100, 20))
+
+
+class TestAgentCompaction(unittest.TestCase):
+    def run_agent(self, **kwargs):
+        def responder(body):
+            turns = sum(1 for message in body["messages"] if message["role"] == "assistant")
+            if turns < 5:
+                return {"content": None, "tool_calls": [{
+                    "id": f"call_{turns}", "type": "function",
+                    "function": {"name": "search_web", "arguments": json.dumps({"query": str(turns)})},
+                }]}
+            return {"content": '{"title": "标题", "body": "正文", "hashtags": [], "emojis": []}'}
+
+        async def search_web(query):
+            return LONG_OBSERVATION
+
+        async def main():
+            agent = RednoteAgent(MockAsyncClient(responder), tools={"search_web": search_web}, stream=False,
+                                 max_iterations=6, **kwargs)
+            note = await agent.generate("深海蓝藻保湿面膜")
+            return agent, note
+
+        return asyncio.run(main())
+
+    def test_prompt_size_stays_bounded(self):
+        """开启压缩后，后续迭代的请求大小不再随迭代次数线性增长"""
+        agent, note = self.run_agent()
+        compact_agent, compact_note = self.run_agent(context_token_budget=2_500, keep_recent_observations=1)
+        self.assertEqual(note, compact_note)
+
+        uncompacted = [timing["prompt_tokens"] for timing in agent.timings]
+        compacted = [timing["prompt_tokens"] for timing in compact_agent.timings]
+        self.assertGreater(uncompacted[-1], uncompacted[0] * 5)
+        self.assertLessEqual(max(compacted), 2_500)
+        self.assertLess(sum(compacted), sum(uncompacted) / 2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
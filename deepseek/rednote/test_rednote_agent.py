@@ -0,0 +1,205 @@
+import asyncio
+import json
+import time
+import unittest
+
+from mock_async_client import MockAsyncClient
+from rednote_agent import RednoteAgent, extract_note, generate_rednote
+from tool_registry import ToolRegistry
+
+NOTE = {
+    "title": "测试标题",
+    "body": "测试正文",
+    "hashtags": ["#a", "#b", "#c", "#d", "#e"],
+    "emojis": ["✨", "🔥"],
+}
+
+
+def tool_call(call_id, name, **arguments):
+    return {
+        "id": call_id,
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)},
+    }
+
+
+def scripted_responder(*turns):
+    """按顺序返回预设消息的应答函数，根据已有的 tool 消息数量判断当前轮次"""
+
+    def responder(body):
+        assistant_turns = sum(1 for message in body["messages"] if message["role"] == "assistant")
+        return turns[min(assistant_turns, len(turns) - 1)]
+
+    return responder
+
+
+FINAL_TURN = {"content": f"文案如下：\n```json\n{json.dumps(NOTE, ensure_ascii=False)}\n```"}
+
+
+def make_tools(calls):
+    """构造带延迟的工具，并记录每次实际执行"""
+
+    async def search_web(query):
+        calls.append(("search_web", query))
+        await asyncio.sleep(0.3)
+        return f"搜索结果: {query}"
+
+    async def query_product_database(product_name):
+        calls.append(("query_product_database", product_name))
+        await asyncio.sleep(0.2)
+        return f"产品信息: {product_name}"
+
+    def generate_emoji(context):
+        # 同步工具在线程池中执行
+        calls.append(("generate_emoji", context))
+        time.sleep(0.1)
+        return ["✨", "💦"]
+
+    return {
+        "search_web": search_web,
+        "query_product_database": query_product_database,
+        "generate_emoji": generate_emoji,
+    }
+
+
+class TestExtractNote(unittest.TestCase):
+    def test_json_block_and_plain_json(self):
+        self.assertEqual(extract_note(FINAL_TURN["content"]), NOTE)
+        self.assertEqual(extract_note(json.dumps(NOTE)), NOTE)
+        self.assertIsNone(extract_note("还在思考"))
+
+
+class TestRednoteAgent(unittest.TestCase):
+    def run_agent(self, responder, stream=True, **kwargs):
+        calls = []
+        tokens = []
+
+        async def main():
+            client = MockAsyncClient(responder)
+            agent = RednoteAgent(client, tools=make_tools(calls), stream=stream, on_token=tokens.append, **kwargs)
+            start = time.perf_counter()
+            note = await agent.generate("深海蓝藻保湿面膜")
+            return agent, note, time.perf_counter() - start, client.requests
+
+        agent, note, elapsed, requests = asyncio.run(main())
+        return agent, note, elapsed, requests, calls, tokens
+
+    def test_tool_calls_run_concurrently(self):
+        """同一轮的工具调用并发执行，耗时约等于最慢的工具"""
+        responder = scripted_responder(
+            {"content": None, "tool_calls": [
+                tool_call("call_1", "search_web", query="保湿面膜"),
+                tool_call("call_2", "query_product_database", product_name="深海蓝藻保湿面膜"),
+                tool_call("call_3", "generate_emoji", context="补水保湿"),
+            ]},
+            FINAL_TURN,
+        )
+        agent, note, elapsed, requests, calls, _ = self.run_agent(responder)
+
+        self.assertEqual(note, NOTE)
+        self.assertEqual(len(calls), 3)
+        self.assertLess(agent.timings[0]["tool_seconds"], 0.3 + 0.2)
+        self.assertLess(elapsed, 0.3 + 0.2 + 0.1)
+        # 工具结果按 tool_calls 的顺序追加到对话历史
+        tool_messages = [m for m in requests[1]["messages"] if m["role"] == "tool"]
+        self.assertEqual([m["tool_call_id"] for m in tool_messages], ["call_1", "call_2", "call_3"])
+        self.assertEqual(tool_messages[0]["content"], "搜索结果: 保湿面膜")
+
+    def test_tool_results_are_cached_within_session(self):
+        """同一会话内相同 (工具, 参数) 的调用只执行一次"""
+        responder = scripted_responder(
+            {"content": None, "tool_calls": [tool_call("call_1", "search_web", query="保湿面膜")]},
+            {"content": None, "tool_calls": [
+                tool_call("call_2", "search_web", query="保湿面膜"),
+                tool_call("call_3", "search_web", query="保湿面膜"),
+            ]},
+            FINAL_TURN,
+        )
+        agent, note, _, requests, calls, _ = self.run_agent(responder)
+        self.assertEqual(note, NOTE)
+        self.assertEqual(calls, [("search_web", "保湿面膜")])
+        self.assertEqual(len(agent.timings), 3)
+        tool_messages = [m for m in requests[2]["messages"] if m["role"] == "tool"]
+        self.assertEqual(len(tool_messages), 3)
+
+    def test_streams_tokens(self):
+        """流式输出时 on_token 收到完整的文本"""
+        agent, note, _, requests, _, tokens = self.run_agent(scripted_responder(FINAL_TURN))
+        self.assertEqual(note, NOTE)
+        self.assertGreater(len(tokens), 1)
+        self.assertEqual("".join(tokens), FINAL_TURN["content"])
+        self.assertTrue(requests[0]["stream"])
+        self.assertIsNotNone(agent.timings[0]["first_token_seconds"])
+        self.assertGreater(agent.usage["completion_tokens"], 0)
+
+    def test_non_streaming_mode(self):
+        responder = scripted_responder(
+            {"content": None, "tool_calls": [tool_call("call_1", "generate_emoji", context="惊喜")]},
+            FINAL_TURN,
+        )
+        _, note, _, requests, calls, tokens = self.run_agent(responder, stream=False)
+        self.assertEqual(note, NOTE)
+        self.assertEqual(calls, [("generate_emoji", "惊喜")])
+        self.assertEqual(tokens, [])
+        self.assertNotIn("stream", requests[0])
+
+    def test_unknown_tool_and_max_iterations(self):
+        """未知工具返回错误信息；达到最大迭代次数时返回 None"""
+        responder = scripted_responder(
+            {"content": None, "tool_calls": [tool_call("call_1", "unknown_tool")]},
+        )
+        agent, note, _, requests, _, _ = self.run_agent(responder, max_iterations=2)
+        self.assertIsNone(note)
+        self.assertEqual(len(agent.timings), 2)
+        tool_message = next(m for m in requests[1]["messages"] if m["role"] == "tool")
+        self.assertIn("未知的工具", tool_message["content"])
+
+    def test_tools_are_dispatched_through_registry(self):
+        """工具由 ToolRegistry 执行: 超时和异常作为错误信息返回，失败的调用不缓存，下一轮重新执行"""
+        attempts = []
+        registry = ToolRegistry()
+
+        @registry.tool
+        async def search_web(query: str) -> str:
+            """第一次调用失败的搜索工具"""
+            attempts.append(query)
+            if len(attempts) == 1:
+                raise RuntimeError("搜索服务不可用")
+            return f"搜索结果: {query}"
+
+        @registry.tool(timeout=0.05)
+        async def query_product_database(product_name: str) -> str:
+            """总是超时的查询工具"""
+            await asyncio.sleep(1)
+
+        responder = scripted_responder(
+            {"content": None, "tool_calls": [
+                tool_call("call_1", "search_web", query="保湿面膜"),
+                tool_call("call_2", "query_product_database", product_name="深海蓝藻保湿面膜"),
+            ]},
+            {"content": None, "tool_calls": [tool_call("call_3", "search_web", query="保湿面膜")]},
+            FINAL_TURN,
+        )
+
+        async def main():
+            client = MockAsyncClient(responder)
+            agent = RednoteAgent(client, tools=registry, stream=False)
+            return await agent.generate("深海蓝藻保湿面膜"), client.requests
+
+        note, requests = asyncio.run(main())
+        self.assertEqual(note, NOTE)
+        self.assertEqual(attempts, ["保湿面膜", "保湿面膜"])
+        contents = [m["content"] for m in requests[2]["messages"] if m["role"] == "tool"]
+        self.assertIn("搜索服务不可用", contents[0])
+        self.assertIn("超时", contents[1])
+        self.assertEqual(contents[2], "搜索结果: 保湿面膜")
+
+    def test_generate_rednote_returns_json_string(self):
+        async def main():
+            return await generate_rednote(MockAsyncClient(scripted_responder(FINAL_TURN)), "麻辣鸡腿")
+
+        self.assertEqual(json.loads(asyncio.run(main())), NOTE)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from mock_async_client import MockAsyncClient
+from rednote_batch import (
+    AsyncRateLimiter,
+    RednoteBatchRunner,
+    load_completed,
+    load_products,
+    mock_rednote_responder,
+    product_key,
+)
+
+
+async def instant_tool(**kwargs):
+    return f"结果: {kwargs}"
+
+
+FAST_TOOLS = {
+    "search_web": instant_tool,
+    "query_product_database": instant_tool,
+    "generate_emoji": instant_tool,
+}
+
+
+class TestLoading(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def test_load_csv_and_jsonl(self):
+        csv_path = self.write("products.csv", "product_name,tone_style\n麻辣鸡腿,活泼甜美\n草莓蛋糕,\n")
+        jsonl_path = self.write("products.jsonl", '{"id": "p1", "product_name": "红肠"}\n\n')
+        self.assertEqual([p["product_name"] for p in load_products(csv_path)], ["麻辣鸡腿", "草莓蛋糕"])
+        self.assertEqual(load_products(jsonl_path), [{"id": "p1", "product_name": "红肠"}])
+
+    def test_missing_product_name(self):
+        with self.assertRaises(ValueError):
+            load_products(self.write("bad.jsonl", '{"tone_style": "知性"}\n'))
+
+    def test_load_completed_ignores_partial_lines(self):
+        """只有成功的记录计为已完成，崩溃时写了一半的行被忽略"""
+        path = self.write("out.jsonl", "\n".join([
+            json.dumps({"key": "a", "status": "ok"}),
+            json.dumps({"key": "b", "status": "error"}),
+            '{"key": "c", "sta',
+        ]))
+        self.assertEqual(load_completed(path), {"a"})
+
+    def test_product_key(self):
+        self.assertEqual(product_key({"id": "p1", "product_name": "红肠"}), "p1")
+        self.assertEqual(product_key({"product_name": "红肠", "tone_style": "搞怪"}), "红肠|搞怪")
+
+
+class TestAsyncRateLimiter(unittest.TestCase):
+    def test_limits_rate(self):
+        async def main():
+            limiter = AsyncRateLimiter(rate=50, burst=1)
+            start = time.perf_counter()
+            await asyncio.gather(*(limiter.acquire() for _ in range(6)))
+            return time.perf_counter() - start
+
+        self.assertGreaterEqual(asyncio.run(main()), 5 / 50 * 0.9)
+
+
+class TestRednoteBatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmpdir.name, "rednotes.jsonl")
+        self.products = [{"product_name": f"产品{i}", "tone_style": "活泼甜美"} for i in range(12)]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_batch(self, products, responder=mock_rednote_responder, latency=0.05, **kwargs):
+        async def main():
+            client = MockAsyncClient(responder, latency=latency)
+            runner = RednoteBatchRunner(client, self.output, tools=FAST_TOOLS, stream=False, **kwargs)
+            report = await runner.run(products)
+            return report, len(client.requests)
+
+        return asyncio.run(main())
+
+    def read_output(self):
+        with open(self.output, "r", encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
+
+    def test_generates_all_products_concurrently(self):
+        """全部产品生成成功，并发执行的总耗时远小于串行耗时"""
+        report, requests = self.run_batch(self.products, concurrency=12)
+        self.assertEqual(report.succeeded, 12)
+        self.assertEqual(report.failure_rate, 0.0)
+        self.assertEqual(requests, 24)
+        # 串行执行需要 12 个产品 * 2 轮 * 0.05 秒
+        self.assertLess(report.seconds, 12 * 2 * 0.05 / 2)
+        self.assertGreater(report.notes_per_minute, 0)
+        self.assertGreater(report.tokens_per_note, 0)
+
+        records = self.read_output()
+        self.assertEqual(len(records), 12)
+        self.assertTrue(all(record["status"] == "ok" for record in records))
+        self.assertEqual(records[0]["iterations"], 2)
+        self.assertIn(records[0]["product_name"], records[0]["note"]["title"])
+
+    def test_resume_skips_completed_products(self):
+        """重新运行时跳过已成功的产品"""
+        self.run_batch(self.products[:5], concurrency=4)
+        report, requests = self.run_batch(self.products, concurrency=4)
+        self.assertEqual(report.skipped, 5)
+        self.assertEqual(report.succeeded, 7)
+        self.assertEqual(requests, 14)
+        self.assertEqual(len(self.read_output()), 12)
+
+    def test_failures_are_recorded_and_retried_on_resume(self):
+        """失败的产品记录错误信息，重新运行时重试"""
+        def flaky(body):
+            if "产品3" in body["messages"][1]["content"]:
+                raise RuntimeError("模拟服务故障")
+            return mock_rednote_responder(body)
+
+        report, _ = self.run_batch(self.products[:5], responder=flaky, concurrency=2)
+        self.assertEqual((report.succeeded, report.failed), (4, 1))
+        self.assertAlmostEqual(report.failure_rate, 0.2)
+
+        report, _ = self.run_batch(self.products[:5], concurrency=2)
+        self.assertEqual((report.skipped, report.succeeded, report.failed), (4, 1, 0))
+
+    def test_token_budget_stops_new_sessions(self):
+        """token 预算耗尽后不再开始新的会话"""
+        report, _ = self.run_batch(self.products, concurrency=1, token_budget=1)
+        self.assertEqual(report.succeeded, 1)
+        self.assertEqual(report.over_budget, 11)
+
+    def test_request_rate_limit(self):
+        """所有会话共享请求速率上限"""
+        report, requests = self.run_batch(self.products[:4], latency=0, concurrency=4, requests_per_second=20,
+                                         burst=4)
+        self.assertEqual(requests, 8)
+        # 令牌桶初始有 4 个令牌，其余 4 个请求按每秒 20 个放行
+        self.assertGreaterEqual(report.seconds, 4 / 20 * 0.9)
+
+    def test_shared_rate_limiter(self):
+        """传入的限流器被所有会话共享，每个模型请求获取一次"""
+        class CountingLimiter:
+            acquired = 0
+
+            async def acquire(self):
+                self.acquired += 1
+
+        limiter = CountingLimiter()
+        _, requests = self.run_batch(self.products[:3], latency=0, concurrency=3, rate_limiter=limiter,
+                                     requests_per_second=0.001)
+        self.assertEqual(limiter.acquired, requests)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,198 @@
+import asyncio
+import importlib.util
+import json
+import os
+import time
+import unittest
+from datetime import date
+from types import SimpleNamespace
+from typing import Literal, Optional
+
+from tool_registry import ToolRegistry, ToolValidationError, parse_docstring, register_weather_tools
+
+try:
+    from mcp.server.fastmcp import FastMCP
+except ImportError:
+    FastMCP = None
+
+registry = ToolRegistry(default_timeout=1.0)
+
+
+@registry.tool
+def get_weather(location: str, unit: Literal["celsius", "fahrenheit"] = "celsius") -> str:
+    """
+    查询城市的当前天气
+
+    参数:
+        location (str): 城市名称，例如 上海
+        unit: 温度单位
+    返回:
+        str: 天气描述
+    """
+    time.sleep(0.2)
+    return f"{location} 24℃" if unit == "celsius" else f"{location} 75℉"
+
+
+@registry.tool(timeout=0.1)
+async def slow_search(query: str, limit: Optional[int] = None):
+    """搜索网页(模拟超时)"""
+    await asyncio.sleep(1)
+    return query
+
+
+@registry.tool
+async def get_coordinates(city: str, scale: float = 1.0, tags: list[str] = ()) -> dict:
+    """查询城市坐标"""
+    await asyncio.sleep(0.2)
+    return {"city": city, "latitude": 31.2 * scale, "tags": tags}
+
+
+@registry.tool
+def broken(value: int):
+    """总是失败的工具"""
+    raise RuntimeError("服务不可用")
+
+
+def tool_call(call_id, name, **arguments):
+    return {"id": call_id, "type": "function",
+            "function": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)}}
+
+
+class TestSchemaGeneration(unittest.TestCase):
+    def test_definition_from_signature_and_docstring(self):
+        definition = registry.tools["get_weather"].definition
+        self.assertEqual(definition["function"]["description"], "查询城市的当前天气")
+        self.assertEqual(definition["function"]["parameters"], {
+            "type": "object",
+            "properties": {
+                "location": {"type": "string", "description": "城市名称，例如 上海"},
+                "unit": {"enum": ["celsius", "fahrenheit"], "description": "温度单位"},
+            },
+            "required": ["location"],
+        })
+
+    def test_container_and_optional_types(self):
+        properties = registry.tools["get_coordinates"].parameters["properties"]
+        self.assertEqual(properties["scale"], {"type": "number"})
+        self.assertEqual(properties["tags"], {"type": "array", "items": {"type": "string"}})
+        self.assertEqual(registry.tools["slow_search"].parameters["properties"]["limit"], {"type": "integer"})
+
+    def test_definitions_are_cached(self):
+        self.assertIs(registry.definitions(), registry.definitions())
+        self.assertEqual([d["function"]["name"] for d in registry.definitions()],
+                         ["get_weather", "slow_search", "get_coordinates", "broken"])
+
+    def test_duplicate_name(self):
+        with self.assertRaises(ValueError):
+            registry.register(get_weather)
+
+    def test_parse_docstring_without_sections(self):
+        self.assertEqual(parse_docstring("第一行\n第二行\n\n更多说明"), ("第一行 第二行", {}))
+
+
+class TestValidation(unittest.TestCase):
+    def test_validate(self):
+        tool = registry.tools["get_coordinates"]
+        self.assertEqual(tool.validate({"city": "上海", "scale": 2}), {"city": "上海", "scale": 2.0})
+        for arguments in ({}, {"city": 1}, {"city": "上海", "scale": True},
+                          {"city": "上海", "tags": ["a", 1]}, {"city": "上海", "x": 1}, []):
+            with self.subTest(arguments=arguments), self.assertRaises(ToolValidationError):
+                tool.validate(arguments)
+
+    def test_literal_and_optional(self):
+        with self.assertRaises(ToolValidationError):
+            registry.tools["get_weather"].validate({"location": "上海", "unit": "kelvin"})
+        self.assertEqual(registry.tools["slow_search"].validate({"query": "q", "limit": None}),
+                         {"query": "q", "limit": None})
+
+    def test_var_keyword_accepts_extra_arguments(self):
+        """带 **kwargs 的函数接受未声明的参数，已声明的参数仍然检查类型"""
+        def search(query: str, **options):
+            return query
+
+        tool = ToolRegistry.from_functions({"search": search}).tools["search"]
+        self.assertEqual(tool.validate({"query": "q", "limit": 3}), {"query": "q", "limit": 3})
+        with self.assertRaises(ToolValidationError):
+            tool.validate({"query": 1})
+
+
+class TestDispatch(unittest.TestCase):
+    def test_all_calls_run_concurrently(self):
+        """同一轮的全部工具调用并发执行，结果按 tool_calls 的顺序返回"""
+        calls = [
+            tool_call("call_1", "get_weather", location="上海"),
+            tool_call("call_2", "get_weather", location="北京", unit="fahrenheit"),
+            tool_call("call_3", "get_coordinates", city="上海"),
+        ]
+        start = time.perf_counter()
+        messages = registry.dispatch_sync(calls)
+        elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 0.2 * 3)
+        self.assertEqual([m["tool_call_id"] for m in messages], ["call_1", "call_2", "call_3"])
+        self.assertEqual(messages[0], {"role": "tool", "tool_call_id": "call_1", "content": "上海 24℃"})
+        self.assertEqual(messages[1]["content"], "北京 75℉")
+        self.assertEqual(json.loads(messages[2]["content"])["city"], "上海")
+
+    def test_errors_are_returned_to_model(self):
+        """未知工具、参数错误、超时和异常都作为 tool 消息返回"""
+        calls = [
+            tool_call("call_1", "unknown"),
+            tool_call("call_2", "get_weather"),
+            {"id": "call_3", "function": {"name": "get_weather", "arguments": "{location"}},
+            tool_call("call_4", "slow_search", query="q"),
+            tool_call("call_5", "broken", value=1),
+        ]
+        start = time.perf_counter()
+        contents = [m["content"] for m in registry.dispatch_sync(calls)]
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertIn("未知的工具", contents[0])
+        self.assertIn("缺少必填参数", contents[1])
+        self.assertIn("不是合法的 JSON", contents[2])
+        self.assertIn("超时", contents[3])
+        self.assertIn("服务不可用", contents[4])
+
+    def test_unserializable_results(self):
+        """无法直接转为 JSON 的返回值按字符串序列化，仍然失败时作为错误信息返回而不是抛出异常"""
+        results_registry = ToolRegistry()
+
+        @results_registry.tool
+        def get_date() -> dict:
+            """返回包含日期的字典"""
+            return {"date": date(2024, 5, 1)}
+
+        @results_registry.tool
+        def get_cycle() -> dict:
+            """返回循环引用的字典"""
+            cycle = {}
+            cycle["self"] = cycle
+            return cycle
+
+        messages = results_registry.dispatch_sync([tool_call("call_1", "get_date"), tool_call("call_2", "get_cycle")])
+        results_registry.close()
+        self.assertEqual(json.loads(messages[0]["content"]), {"date": "2024-05-01"})
+        self.assertIn("执行失败", messages[1]["content"])
+
+    def test_accepts_openai_tool_call_objects(self):
+        call = SimpleNamespace(id="call_1", function=SimpleNamespace(name="get_weather", arguments='{"location": "上海"}'))
+        self.assertEqual(registry.dispatch_sync([call])[0]["content"], "上海 24℃")
+
+
+@unittest.skipIf(FastMCP is None, "需要安装 mcp")
+class TestWeatherTools(unittest.TestCase):
+    def test_register_weather_tools(self):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "mcp", "weather", "weather.py")
+        spec = importlib.util.spec_from_file_location("weather", path)
+        weather = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(weather)
+
+        weather_registry = ToolRegistry()
+        register_weather_tools(weather_registry, weather)
+        forecast = weather_registry.tools["get_forecast"]
+        self.assertTrue(forecast.is_async)
+        self.assertEqual(forecast.parameters["required"], ["latitude", "longitude"])
+        self.assertEqual(forecast.parameters["properties"]["latitude"], {"type": "number", "description": "地点的纬度"})
+        self.assertEqual(weather_registry.tools["get_alerts"].parameters["properties"]["state"]["type"], "string")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,326 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import re
+import types
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Python 类型到 JSON Schema 类型的映射
+JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    dict: "object",
+}
+
+# 文档字符串中参数说明段落的标题
+PARAM_SECTIONS = ("参数:", "参数：", "Args:", "Arguments:", "Parameters:")
+# 参数说明行: "name: 描述" 或 "name (type): 描述"
+PARAM_LINE = re.compile(r"^\s*(\w+)\s*(?:\([^)]*\))?\s*[:：]\s*(.*)$")
+
+
+class ToolValidationError(ValueError):
+    """工具参数不符合函数签名"""
+
+
+def parse_docstring(doc):
+    """
+    从文档字符串中提取工具描述和参数说明
+
+    返回:
+        tuple: (描述, {参数名: 参数说明})
+    """
+    description = []
+    params = {}
+    section = "description"
+    for line in inspect.cleandoc(doc or "").splitlines():
+        stripped = line.strip()
+        if stripped in PARAM_SECTIONS:
+            section = "params"
+        elif stripped.endswith((":", "：")) and not line[:1].isspace():
+            # 其他段落标题(返回:、异常: 等)
+            section = None
+        elif section == "params":
+            match = PARAM_LINE.match(line)
+            if match:
+                params[match.group(1)] = match.group(2).strip()
+        elif section == "description":
+            if not stripped and description:
+                # 只取第一段作为描述
+                section = None
+            elif stripped:
+                description.append(stripped)
+    return " ".join(description), params
+
+
+def _compile(annotation, path):
+    """
+    根据类型注解生成 JSON Schema 和参数检查函数
+
+    检查函数在注册时生成，调用时直接执行，不再解析类型注解。
+    整数可以作为 float 参数；bool 不能作为 int/float 参数。
+    """
+    if annotation is inspect.Parameter.empty or annotation is typing.Any:
+        return {}, lambda value: value
+
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin is typing.Union or origin is types.UnionType:
+        options = [arg for arg in args if arg is not type(None)]
+        schema, check = _compile(options[0], path) if len(options) == 1 else ({}, lambda value: value)
+        if len(options) != len(args):
+            return schema, lambda value: None if value is None else check(value)
+        return schema, check
+
+    if origin is typing.Literal:
+        allowed = list(args)
+
+        def check_literal(value):
+            if value not in allowed:
+                raise ToolValidationError(f"{path} 必须是 {allowed} 之一，实际为 {value!r}")
+            return value
+
+        return {"enum": allowed}, check_literal
+
+    base = origin or annotation
+    if base not in JSON_TYPES:
+        return {}, lambda value: value
+    schema = {"type": JSON_TYPES[base]}
+    item_check = None
+    if base is list and args:
+        schema["items"], item_check = _compile(args[0], f"{path}[]")
+
+    accepted = (int, float) if base is float else base
+
+    def check(value):
+        if not isinstance(value, accepted) or (base is not bool and isinstance(value, bool)):
+            raise ToolValidationError(f"{path} 应为 {schema['type']}，实际为 {type(value).__name__}")
+        if base is float:
+            return float(value)
+        if item_check is not None:
+            return [item_check(item) for item in value]
+        return value
+
+    return schema, check
+
+
+class Tool:
+    """
+    已注册的工具: 函数、生成的 JSON Schema 和预编译的参数检查
+
+    参数:
+        fn (callable): 同步或异步函数
+        name (str): 工具名称，默认取函数名
+        description (str): 工具描述，默认取文档字符串的第一段
+        timeout (float): 单次调用的超时时间(秒)，None 表示不限制
+    """
+
+    def __init__(self, fn, name=None, description=None, timeout=None):
+        self.fn = fn
+        self.name = name or fn.__name__
+        self.timeout = timeout
+        self.is_async = inspect.iscoroutinefunction(fn)
+        doc_description, param_docs = parse_docstring(fn.__doc__)
+        self.description = description or doc_description
+
+        hints = typing.get_type_hints(fn)
+        properties = {}
+        self.required = []
+        self._checks = {}
+        self.accepts_extra = False  # 函数带 **kwargs 时接受未声明的参数
+        for param in inspect.signature(fn).parameters.values():
+            if param.kind == param.VAR_KEYWORD:
+                self.accepts_extra = True
+            if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+                continue
+            schema, check = _compile(hints.get(param.name, param.annotation), param.name)
+            if param.name in param_docs:
+                schema = {**schema, "description": param_docs[param.name]}
+            properties[param.name] = schema
+            self._checks[param.name] = check
+            if param.default is param.empty:
+                self.required.append(param.name)
+
+        self.parameters = {"type": "object", "properties": properties, "required": self.required}
+        self.definition = {
+            "type": "function",
+            "function": {"name": self.name, "description": self.description, "parameters": self.parameters},
+        }
+
+    def validate(self, arguments):
+        """
+        检查并转换参数
+
+        参数:
+            arguments (dict): 模型给出的参数
+
+        返回:
+            dict: 可以直接传给函数的关键字参数
+
+        异常:
+            ToolValidationError: 缺少必填参数、存在未知参数或参数类型不符
+        """
+        if not isinstance(arguments, dict):
+            raise ToolValidationError(f"参数应为 JSON 对象，实际为 {type(arguments).__name__}")
+        unknown = arguments.keys() - self._checks.keys()
+        if unknown and not self.accepts_extra:
+            raise ToolValidationError(f"未知的参数 {sorted(unknown)}")
+        missing = [name for name in self.required if name not in arguments]
+        if missing:
+            raise ToolValidationError(f"缺少必填参数 {missing}")
+        return {name: self._checks[name](value) if name in self._checks else value
+                for name, value in arguments.items()}
+
+
+class ToolRegistry:
+    """
+    Function Calling 工具注册表
+
+    注册时(通常在模块导入时)根据函数签名、类型注解和文档字符串生成 tools 定义，
+    并预编译参数检查；调用时并发执行一轮中的全部 tool_calls:
+    异步工具直接在事件循环中执行，同步工具在线程池中执行，每个工具有独立的超时时间。
+    参数错误、未知工具、超时和异常都会作为 tool 消息的内容返回给模型，而不是中断对话。
+
+    参数:
+        default_timeout (float): 未单独指定时的工具超时时间(秒)，None 表示不限制
+        max_workers (int): 执行同步工具的线程池大小
+
+    示例:
+        registry = ToolRegistry()
+
+        @registry.tool
+        def get_weather(location: str) -> str:
+            \"\"\"查询城市天气\"\"\"
+    """
+
+    def __init__(self, default_timeout=30.0, max_workers=8):
+        self.default_timeout = default_timeout
+        self.tools = {}
+        self._definitions = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+
+    @classmethod
+    def from_functions(cls, functions, **kwargs):
+        """
+        由 {工具名称: 函数} 的映射创建注册表
+
+        参数:
+            functions (dict): 工具名称到同步或异步函数的映射
+            kwargs (dict): 传给 ToolRegistry 构造函数的参数，例如 default_timeout
+        """
+        registry = cls(**kwargs)
+        for name, fn in functions.items():
+            registry.register(fn, name=name)
+        return registry
+
+    def tool(self, fn=None, *, name=None, description=None, timeout=None):
+        """注册工具的装饰器，可以直接使用 @registry.tool，也可以传入参数 @registry.tool(timeout=5)"""
+        if fn is None:
+            return functools.partial(self.tool, name=name, description=description, timeout=timeout)
+        self.register(fn, name=name, description=description, timeout=timeout)
+        return fn
+
+    def register(self, fn, name=None, description=None, timeout=None):
+        tool = Tool(fn, name=name, description=description,
+                    timeout=self.default_timeout if timeout is None else timeout)
+        if tool.name in self.tools:
+            raise ValueError(f"工具 '{tool.name}' 已经注册")
+        self.tools[tool.name] = tool
+        self._definitions = None
+        return tool
+
+    def definitions(self):
+        """返回 chat.completions.create 的 tools 参数，注册表不变时每次返回同一个列表"""
+        if self._definitions is None:
+            self._definitions = [tool.definition for tool in self.tools.values()]
+        return self._definitions
+
+    async def dispatch(self, tool_calls):
+        """
+        并发执行一轮中的全部工具调用
+
+        参数:
+            tool_calls (list): 模型返回的 message.tool_calls，支持 openai 对象或 dict
+
+        返回:
+            list[dict]: 与 tool_calls 顺序一致的 tool 消息，可以直接追加到 messages
+        """
+        calls = [_normalize_call(call) for call in tool_calls]
+        results = await asyncio.gather(*(self.call(name, arguments) for _, name, arguments in calls))
+        return [
+            {"role": "tool", "tool_call_id": call_id, "content": result}
+            for (call_id, _, _), result in zip(calls, results)
+        ]
+
+    def dispatch_sync(self, tool_calls):
+        """dispatch 的同步版本，用于没有运行事件循环的脚本；Jupyter 中请直接 await dispatch"""
+        return asyncio.run(self.dispatch(tool_calls))
+
+    async def call(self, name, arguments):
+        """
+        执行单个工具，返回字符串结果
+
+        参数:
+            name (str): 工具名称
+            arguments (str | dict): JSON 字符串或已解析的参数
+        """
+        tool = self.tools.get(name)
+        if tool is None:
+            return f"错误：未知的工具 '{name}'"
+        try:
+            args = json.loads(arguments or "{}") if isinstance(arguments, str) else arguments
+            kwargs = tool.validate(args)
+        except json.JSONDecodeError as e:
+            return f"错误：工具 '{name}' 的参数不是合法的 JSON: {e}"
+        except ToolValidationError as e:
+            return f"错误：工具 '{name}' 的参数不正确: {e}"
+
+        if tool.is_async:
+            coroutine = tool.fn(**kwargs)
+        else:
+            loop = asyncio.get_running_loop()
+            coroutine = loop.run_in_executor(self._executor, functools.partial(tool.fn, **kwargs))
+        try:
+            result = await asyncio.wait_for(coroutine, tool.timeout)
+            # 序列化也在 try 中: 返回值无法转为 JSON 时与执行失败一样作为错误信息返回
+            return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+        except asyncio.TimeoutError:
+            # 同步工具无法被强制中止，线程会在后台执行完毕，但结果会被丢弃
+            logger.warning("工具 '%s' 执行超时 (%.1fs)", name, tool.timeout)
+            return f"错误：工具 '{name}' 执行超时 ({tool.timeout} 秒)"
+        except Exception as e:
+            logger.warning("工具 '%s' 执行失败: %s", name, e)
+            return f"错误：工具 '{name}' 执行失败: {e}"
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def _normalize_call(call):
+    """返回 (id, 工具名称, 参数)，兼容 openai 的 ChatCompletionMessageToolCall 对象和 dict"""
+    if isinstance(call, dict):
+        return call["id"], call["function"]["name"], call["function"]["arguments"]
+    return call.id, call.function.name, call.function.arguments
+
+
+def register_weather_tools(registry, weather, timeout=60.0):
+    """
+    将 mcp/weather/weather.py 中的 get_forecast 和 get_alerts 注册为进程内工具
+
+    FastMCP 的 @mcp.tool() 装饰器返回原函数，因此无需启动 MCP 服务即可直接调用。
+    weather 模块由调用方导入后传入(例如在 mcp/weather 的项目环境中运行)，需要安装 mcp 和 httpx。
+
+    参数:
+        registry (ToolRegistry): 工具注册表
+        weather (module): 已导入的 weather 模块
+        timeout (float): 工具超时时间(秒)，NWS 接口需要两次请求，默认放宽到 60 秒
+    """
+    return [registry.register(fn, timeout=timeout) for fn in (weather.get_forecast, weather.get_alerts)]
@@ -0,0 +1,364 @@
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 与 qwen_1.5B_lora.ipynb 中的推理模板一致
+INFERENCE_PROMPT = """以下是一条描述任务的指令，并配有一个提供进一步上下文的输入。
+请撰写一份恰当的回复，以完成该请求。
+在回答之前，请仔细思考该问题，并构建一个分步的思考过程，以确保回应的逻辑严谨和内容准确。
+
+
+### Instruction:
+你是一位医学专家，在临床推理、诊断学和治疗规划方面拥有深厚的专业知识。
+请回答以下医学问题。
+
+### Question:
+{}
+
+### Response:
+<think>{}
+"""
+
+
+def resolve_device(device="auto"):
+    """auto 依次选择 cuda、mps、cpu；其他取值原样返回"""
+    if device != "auto":
+        return device
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def load_model(model_path, device="auto", dtype=None, base_model=None):
+    """
+    加载合并后的模型或 LoRA 适配器，只需加载一次
+
+    model_path 下存在 adapter_config.json 时视为 LoRA 适配器: 加载基座模型后合并权重，
+    推理时不再有额外的 LoRA 计算。训练时使用的 unsloth 4bit 基座依赖 CUDA，
+    在 CPU 上运行时可以用 base_model 指定非量化的基座，例如 deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B。
+
+    参数:
+        model_path (str): 合并后的模型目录或 LoRA 适配器目录
+        device (str): auto、cpu、cuda、cuda:1、mps 等
+        dtype: torch 数据类型，默认 CPU 使用 float32，GPU 使用 float16
+        base_model (str): LoRA 适配器的基座模型，默认读取 adapter_config.json
+
+    返回:
+        tuple: (model, tokenizer)
+    """
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    device = resolve_device(device)
+    if dtype is None:
+        dtype = torch.float32 if device == "cpu" else torch.float16
+
+    adapter_config = os.path.join(model_path, "adapter_config.json")
+    if os.path.exists(adapter_config):
+        from peft import PeftModel
+
+        if base_model is None:
+            with open(adapter_config, "r", encoding="utf-8") as file:
+                base_model = json.load(file)["base_model_name_or_path"]
+        model = AutoModelForCausalLM.from_pretrained(base_model, torch_dtype=dtype)
+        model = PeftModel.from_pretrained(model, model_path).merge_and_unload()
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=dtype)
+    model.to(device).eval()
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    # 仅解码器模型批量生成时需要在左侧填充，使每行的最后一个 token 对齐
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return model, tokenizer
+
+
+def kv_cache_bytes_per_token(config, dtype_bytes=2):
+    """根据模型配置估算每个 token 的 KV 缓存字节数: 2(K、V) * 层数 * KV 头数 * 头维度 * 字节数"""
+    heads = config.num_attention_heads
+    kv_heads = getattr(config, "num_key_value_heads", None) or heads
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // heads
+    return 2 * config.num_hidden_layers * kv_heads * head_dim * dtype_bytes
+
+
+def plan_batches(lengths, max_new_tokens, max_batch_size, max_batch_tokens=None):
+    """
+    按 prompt 长度分组
+
+    先按长度从长到短排序，相邻长度的 prompt 放在同一批，减少填充；
+    每批的 批大小 * (最长 prompt + max_new_tokens) 不超过 max_batch_tokens。
+    最长的批次最先执行，内存不足的问题会在开始时暴露。
+
+    参数:
+        lengths (list[int]): 每个 prompt 的 token 数
+        max_new_tokens (int): 每个 prompt 最多生成的 token 数
+        max_batch_size (int): 每批最多的 prompt 数
+        max_batch_tokens (int): 每批最多的 token 数，None 表示只按 max_batch_size 分组
+
+    返回:
+        list[list[int]]: 每批 prompt 的下标
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    batch = []
+    for index in order:
+        # 排序后批次中的第一个 prompt 最长
+        longest = lengths[batch[0]] if batch else lengths[index]
+        fits = max_batch_tokens is None or (len(batch) + 1) * (longest + max_new_tokens) <= max_batch_tokens
+        if batch and (len(batch) >= max_batch_size or not fits):
+            batches.append(batch)
+            batch = []
+        batch.append(index)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+# CUDA: "CUDA out of memory"；MPS: "MPS backend out of memory"；
+# CPU: "DefaultCPUAllocator: not enough memory" / "can't allocate memory"
+OUT_OF_MEMORY_MESSAGES = ("out of memory", "not enough memory", "can't allocate memory")
+
+
+def is_out_of_memory(error):
+    message = str(error).lower()
+    return type(error).__name__ == "OutOfMemoryError" or any(text in message for text in OUT_OF_MEMORY_MESSAGES)
+
+
+def load_questions(path):
+    """
+    读取问题列表: .jsonl 每行包含 Question(与数据集字段一致)或 question，可选 id；
+    其他格式每行一个问题。缺少 id 时使用行号。
+
+    异常:
+        ValueError: .jsonl 中某行没有问题字段
+    """
+    records = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file):
+            if not line.strip():
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                question = item.get("Question") or item.get("question")
+                if not isinstance(question, str) or not question.strip():
+                    raise ValueError(f"错误：{path} 第 {line_number + 1} 行缺少 Question/question 字段")
+                records.append({"id": str(item.get("id", line_number)), "question": question})
+            else:
+                records.append({"id": str(line_number), "question": line.strip()})
+    return records
+
+
+def load_completed(output_path):
+    """读取已有的输出文件，返回已完成的 id 集合；进程崩溃时写了一半的行被忽略"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                completed.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return completed
+
+
+@dataclass
+class InferenceReport:
+    """批量推理的统计信息"""
+    prompts: int = 0
+    skipped: int = 0  # 断点续跑时已完成而跳过的问题
+    batches: int = 0
+    prompt_tokens: int = 0
+    generated_tokens: int = 0
+    padding_tokens: int = 0  # 批次内左侧填充的 token 数
+    seconds: float = 0.0
+    latencies: list = field(default_factory=list)  # 每个问题所在批次的生成耗时
+
+    @property
+    def tokens_per_second(self):
+        return self.generated_tokens / self.seconds if self.seconds else 0.0
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)):
+        if not self.latencies:
+            return {f"p{p}": 0.0 for p in percentiles}
+        values = np.percentile(self.latencies, percentiles)
+        return {f"p{p}": float(value) for p, value in zip(percentiles, values)}
+
+    def summary(self):
+        latency = "，".join(f"{name} {value:.2f}s" for name, value in self.latency_percentiles().items())
+        return (
+            f"共 {self.prompts} 个问题(跳过已完成 {self.skipped})，{self.batches} 个批次，耗时 {self.seconds:.1f} 秒\n"
+            f"生成 {self.generated_tokens} tokens，{self.tokens_per_second:.1f} tokens/s，"
+            f"填充 {self.padding_tokens} tokens\n"
+            f"延迟: {latency}"
+        )
+
+
+class BatchInferenceRunner:
+    """
+    蒸馏模型的批量离线推理
+
+    prompt 按长度排序后分批，每批左侧填充后一次 generate；每完成一批立即把结果追加到 JSONL，
+    重新运行时跳过已完成的问题。指定 memory_limit 时根据 KV 缓存大小限制每批的 token 数，
+    生成时仍然内存不足则把该批拆成两半重试。
+
+    参数:
+        model: transformers 的 CausalLM 模型，通常由 load_model 加载
+        tokenizer: 对应的分词器，padding_side 应为 left
+        max_new_tokens (int): 每个问题最多生成的 token 数
+        max_batch_size (int): 每批最多的问题数
+        memory_limit (int): 每批 KV 缓存可用的字节数，None 表示只按 max_batch_size 分组
+        prompt_template (str): 推理模板，包含问题和思考过程两个占位符
+    """
+
+    def __init__(self, model, tokenizer, max_new_tokens=1024, max_batch_size=16, memory_limit=None,
+                 prompt_template=INFERENCE_PROMPT):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_new_tokens = max_new_tokens
+        self.max_batch_size = max_batch_size
+        self.prompt_template = prompt_template
+        self.max_batch_tokens = None
+        if memory_limit is not None:
+            dtype_bytes = next(model.parameters()).element_size()
+            self.max_batch_tokens = memory_limit // kv_cache_bytes_per_token(model.config, dtype_bytes)
+
+    def run(self, records, output_path):
+        """
+        为全部问题生成回答
+
+        参数:
+            records (list[dict]): 包含 id 和 question 的记录，例如 load_questions 的返回值
+            output_path (str): JSONL 结果文件路径
+
+        返回:
+            InferenceReport: 统计信息
+
+        异常:
+            ValueError: 某条记录的 question 不是非空字符串
+        """
+        for record in records:
+            question = record.get("question")
+            if not isinstance(question, str) or not question.strip():
+                raise ValueError(f"错误：记录 {record.get('id')} 缺少 question")
+        start = time.perf_counter()
+        completed = load_completed(output_path)
+        pending = [record for record in records if record["id"] not in completed]
+        report = InferenceReport(prompts=len(records), skipped=len(records) - len(pending))
+
+        prompts = [self.prompt_template.format(record["question"], "") for record in pending]
+        # 只分词一次得到长度，用于排序和分批
+        lengths = [len(ids) for ids in self.tokenizer(prompts)["input_ids"]]
+        batches = plan_batches(lengths, self.max_new_tokens, self.max_batch_size, self.max_batch_tokens)
+
+        with open(output_path, "a", encoding="utf-8") as output:
+            for batch in batches:
+                for index, result in self._generate_batch(batch, prompts, report):
+                    output.write(json.dumps({**pending[index], **result}, ensure_ascii=False) + "\n")
+                # 每批结果立即写入磁盘，进程中断时已完成的结果不会丢失
+                output.flush()
+                logger.info("已完成 %d 批，累计生成 %d tokens", report.batches, report.generated_tokens)
+
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def _generate_batch(self, batch, prompts, report):
+        """生成一批回答，内存不足时拆成两半递归重试；返回 [(下标, 结果)]"""
+        try:
+            return self._generate(batch, prompts, report)
+        except RuntimeError as e:
+            if not is_out_of_memory(e) or len(batch) == 1:
+                raise
+            logger.warning("批大小 %d 内存不足，拆分后重试", len(batch))
+            self._empty_cache()
+            middle = len(batch) // 2
+            return (self._generate_batch(batch[:middle], prompts, report)
+                    + self._generate_batch(batch[middle:], prompts, report))
+
+    def _generate(self, batch, prompts, report):
+        import torch
+
+        inputs = self.tokenizer([prompts[i] for i in batch], return_tensors="pt", padding=True)
+        inputs = inputs.to(self.model.device)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                input_ids=inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                max_new_tokens=self.max_new_tokens,
+                pad_token_id=self.tokenizer.pad_token_id,
+                use_cache=True,
+            )
+        seconds = time.perf_counter() - start
+
+        # 左侧填充后所有行的 prompt 长度相同，之后的部分即为生成内容
+        prompt_length = inputs["input_ids"].shape[1]
+        generated = outputs[:, prompt_length:].cpu()
+        prompt_tokens = inputs["attention_mask"].sum(dim=1).tolist()
+        new_tokens = (generated != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+        responses = self.tokenizer.batch_decode(generated, skip_special_tokens=True)
+
+        report.batches += 1
+        report.prompt_tokens += sum(prompt_tokens)
+        report.padding_tokens += prompt_length * len(batch) - sum(prompt_tokens)
+        report.generated_tokens += sum(new_tokens)
+        report.latencies.extend([seconds] * len(batch))
+        return [
+            (index, {
+                "response": response.strip(),
+                "prompt_tokens": prompt,
+                "generated_tokens": count,
+                "seconds": round(seconds, 3),
+            })
+            for index, response, prompt, count in zip(batch, responses, prompt_tokens, new_tokens)
+        ]
+
+    def _empty_cache(self):
+        import torch
+
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="蒸馏模型批量离线推理")
+    parser.add_argument("questions", help="问题文件: .jsonl(Question/question 字段，可选 id) 或每行一个问题的文本文件")
+    parser.add_argument("--model", default="qwen-1.5b_lora_model", help="合并后的模型目录或 LoRA 适配器目录")
+    parser.add_argument("--base-model", default=None, help="LoRA 适配器的基座模型，CPU 上请使用非量化模型")
+    parser.add_argument("--output", default="answers.jsonl", help="结果文件，重新运行时从中断处继续")
+    parser.add_argument("--device", default="auto", help="auto、cpu、cuda、mps")
+    parser.add_argument("--max-new-tokens", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=16, help="每批最多的问题数")
+    parser.add_argument("--memory-limit-gb", type=float, default=None, help="每批 KV 缓存可用的内存(GB)")
+    parser.add_argument("--threads", type=int, default=None, help="CPU 推理使用的线程数")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.threads:
+        import torch
+
+        torch.set_num_threads(args.threads)
+
+    model, tokenizer = load_model(args.model, device=args.device, base_model=args.base_model)
+    runner = BatchInferenceRunner(
+        model,
+        tokenizer,
+        max_new_tokens=args.max_new_tokens,
+        max_batch_size=args.batch_size,
+        memory_limit=int(args.memory_limit_gb * 1024 ** 3) if args.memory_limit_gb else None,
+    )
+    report = runner.run(load_questions(args.questions), args.output)
+    print(report.summary())
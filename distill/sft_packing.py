@@ -0,0 +1,384 @@
+import bisect
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pyarrow as pa
+
+# 与 qwen_1.5B_lora.ipynb 中的训练模板一致
+TRAIN_PROMPT = """以下是一条描述任务的指令，并配有一个提供进一步上下文的输入。
+请撰写一份恰当的回复，以完成该请求。
+在回答之前，请仔细思考该问题，并构建一个分步的思考过程，以确保回应的逻辑严谨和内容准确。
+
+
+### Instruction:
+你是一位医学专家，在临床推理、诊断学和治疗规划方面拥有深厚的专业知识。
+请回答以下医学问题。
+
+### Question:
+{}
+
+### Response:
+<think>
+{}
+</think>
+{}
+"""
+
+# 不参与 loss 计算的标签
+IGNORE_INDEX = -100
+
+TOKEN_SCHEMA = pa.schema([("input_ids", pa.list_(pa.int32()))])
+PACKED_SCHEMA = pa.schema([("input_ids", pa.list_(pa.int32())), ("seq_lengths", pa.list_(pa.int32()))])
+
+
+def format_example(example, template=TRAIN_PROMPT, eos_token=""):
+    """按训练模板格式化一条 medical-o1 样本，并在末尾添加 EOS Token"""
+    return template.format(example["Question"], example["Complex_CoT"], example["Response"]) + eos_token
+
+
+def tokenizer_fingerprint(tokenizer):
+    """分词器的指纹: 名称、类型、词表和特殊 token，词表变化时缓存失效"""
+    vocab = tokenizer.get_vocab() if hasattr(tokenizer, "get_vocab") else {}
+    digest = hashlib.sha256()
+    digest.update(json.dumps([
+        getattr(tokenizer, "name_or_path", ""),
+        type(tokenizer).__name__,
+        getattr(tokenizer, "eos_token", None),
+        getattr(tokenizer, "pad_token", None),
+    ], ensure_ascii=False).encode("utf-8"))
+    digest.update(json.dumps(sorted(vocab.items()), ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def cache_key(tokenizer, template, *extra):
+    """缓存键: 分词器指纹、模板和其他影响结果的参数(例如序列长度)的哈希"""
+    text = json.dumps([tokenizer_fingerprint(tokenizer), template, *extra], ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def dataset_fingerprint(examples):
+    """
+    数据集的指纹，数据集、子集、划分或样本内容变化时缓存失效
+
+    - datasets.Dataset 使用其 _fingerprint(随数据文件和每次 map/filter 变化)
+    - 流式的 IterableDataset 使用数据集名称、子集、划分和版本
+    - list / tuple 对全部样本的 Question、Complex_CoT、Response 计算哈希
+
+    返回:
+        str: 指纹；一次性迭代器等无法确定指纹时返回 None
+    """
+    fingerprint = getattr(examples, "_fingerprint", None)
+    if fingerprint:
+        return fingerprint
+    info = getattr(examples, "info", None)
+    if info is not None and getattr(info, "dataset_name", None):
+        return json.dumps([
+            info.dataset_name, info.config_name, str(getattr(examples, "split", None)), str(info.version),
+        ], ensure_ascii=False)
+    if isinstance(examples, (list, tuple)):
+        digest = hashlib.sha256()
+        for example in examples:
+            fields = [example["Question"], example["Complex_CoT"], example["Response"]]
+            digest.update(json.dumps(fields, ensure_ascii=False).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+    return None
+
+
+def load_shard(path):
+    """以内存映射方式读取 Arrow 文件，数据不会被复制到内存中"""
+    return pa.ipc.open_stream(pa.memory_map(path, "r")).read_all()
+
+
+def _write_shard(path, schema, batches):
+    """
+    以 Arrow IPC 流格式写入(datasets.Dataset.from_file 可以直接读取)
+
+    先写入临时文件再重命名，进程中断时不会留下不完整的缓存
+    """
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(pa.record_batch(batch, schema=schema))
+    os.replace(tmp_path, path)
+
+
+def tokenize_to_shard(examples, tokenizer, cache_dir, template=TRAIN_PROMPT, batch_size=1000, dataset_key=None):
+    """
+    格式化并分词全部样本，结果缓存为 Arrow 文件
+
+    examples 按批次流式处理，内存占用与数据集大小无关。
+    缓存键由分词器、模板和数据集指纹共同决定，三者都相同时直接返回已有文件。
+
+    参数:
+        examples (iterable[dict]): 包含 Question、Complex_CoT、Response 的样本，
+            例如 load_dataset(...) 或 load_dataset(..., streaming=True) 的返回值
+        tokenizer: transformers 分词器
+        cache_dir (str): 缓存目录
+        template (str): 训练模板
+        batch_size (int): 每次分词的样本数
+        dataset_key (str): 数据集的标识，例如 "medical-o1-reasoning-SFT/zh/train@<revision>"；
+            默认由 dataset_fingerprint 计算
+
+    返回:
+        str: Arrow 文件路径
+
+    异常:
+        ValueError: 无法确定数据集指纹且没有传入 dataset_key
+    """
+    dataset_key = dataset_key or dataset_fingerprint(examples)
+    if dataset_key is None:
+        raise ValueError("错误：无法确定数据集的指纹，请传入 dataset_key")
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"tokens-{cache_key(tokenizer, template, dataset_key)}.arrow")
+    if os.path.exists(path):
+        return path
+    eos_token = getattr(tokenizer, "eos_token", None) or ""
+
+    def batches():
+        texts = []
+        for example in examples:
+            texts.append(format_example(example, template, eos_token))
+            if len(texts) == batch_size:
+                yield {"input_ids": tokenizer(texts, add_special_tokens=False)["input_ids"]}
+                texts = []
+        if texts:
+            yield {"input_ids": tokenizer(texts, add_special_tokens=False)["input_ids"]}
+
+    _write_shard(path, TOKEN_SCHEMA, batches())
+    return path
+
+
+def pack(lengths, max_seq_length):
+    """
+    Best-Fit Decreasing 装箱: 样本按长度从长到短依次放入剩余空间最小且放得下的序列
+
+    超过 max_seq_length 的样本按 max_seq_length 计算(之后会被截断)。
+
+    参数:
+        lengths (list[int]): 每个样本的 token 数
+        max_seq_length (int): 每个序列的最大长度
+
+    返回:
+        list[list[int]]: 每个序列包含的样本下标
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    bins = []
+    remaining = []  # 按剩余空间排序的 (剩余空间, 序列下标)
+    for index in order:
+        length = min(lengths[index], max_seq_length)
+        position = bisect.bisect_left(remaining, (length, -1))
+        if position < len(remaining):
+            capacity, bin_index = remaining.pop(position)
+        else:
+            capacity, bin_index = max_seq_length, len(bins)
+            bins.append([])
+        bins[bin_index].append(index)
+        if capacity - length > 0:
+            bisect.insort(remaining, (capacity - length, bin_index))
+    return bins
+
+
+@dataclass
+class PackingStats:
+    """装箱前后的填充效率"""
+    samples: int = 0
+    sequences: int = 0
+    tokens: int = 0  # 截断后的有效 token 数
+    truncated: int = 0  # 超过 max_seq_length 被截断的样本数
+    max_seq_length: int = 0
+    unpacked_tokens: int = 0  # 不装箱时按批次内最长样本填充后的 token 数
+
+    @property
+    def packed_efficiency(self):
+        """装箱后有效 token 占全部 token 的比例"""
+        total = self.sequences * self.max_seq_length
+        return self.tokens / total if total else 0.0
+
+    @property
+    def unpacked_efficiency(self):
+        return self.tokens / self.unpacked_tokens if self.unpacked_tokens else 0.0
+
+    def summary(self):
+        return (
+            f"{self.samples} 个样本装入 {self.sequences} 个长度为 {self.max_seq_length} 的序列"
+            f"(截断 {self.truncated} 个)，有效 token {self.tokens}\n"
+            f"填充效率: 装箱 {self.packed_efficiency:.1%}，不装箱 {self.unpacked_efficiency:.1%}，"
+            f"每个 epoch 的计算量约为原来的 {self.sequences * self.max_seq_length / max(self.unpacked_tokens, 1):.1%}"
+        )
+
+
+def build_packed_shard(token_path, max_seq_length, cache_dir=None, batch_size=8, rows_per_batch=1000):
+    """
+    把分词后的样本装箱为定长序列，结果缓存在 token 文件旁边
+
+    参数:
+        token_path (str): tokenize_to_shard 返回的 Arrow 文件
+        max_seq_length (int): 序列长度
+        cache_dir (str): 缓存目录，默认与 token_path 相同
+        batch_size (int): 训练的批大小，用于估算不装箱时的填充量
+
+    返回:
+        tuple: (Arrow 文件路径, PackingStats)
+    """
+    cache_dir = cache_dir or os.path.dirname(token_path)
+    name = os.path.splitext(os.path.basename(token_path))[0].replace("tokens-", "packed-")
+    path = os.path.join(cache_dir, f"{name}-{max_seq_length}.arrow")
+
+    # 直接使用内存映射的 Arrow 偏移量和值数组(零拷贝)，不逐行转换为 Python 列表
+    chunks = load_shard(token_path).column("input_ids").chunks
+    offsets = [chunk.offsets.to_numpy() for chunk in chunks]
+    values = [chunk.values.to_numpy() for chunk in chunks]
+    chunk_starts = np.cumsum([0] + [len(chunk) for chunk in chunks])
+    lengths = np.concatenate([np.diff(o) for o in offsets] or [np.zeros(0, dtype=np.int32)])
+    clipped = np.minimum(lengths, max_seq_length)
+
+    def sample(index):
+        chunk = np.searchsorted(chunk_starts, index, side="right") - 1
+        start = offsets[chunk][index - chunk_starts[chunk]]
+        return values[chunk][start:start + clipped[index]]
+
+    if os.path.exists(path):
+        sequences = load_shard(path).num_rows
+    else:
+        bins = pack(lengths.tolist(), max_seq_length)
+        sequences = len(bins)
+
+        def batches():
+            for start in range(0, len(bins), rows_per_batch):
+                rows = {"input_ids": [], "seq_lengths": []}
+                for samples in bins[start:start + rows_per_batch]:
+                    rows["input_ids"].append(np.concatenate([sample(i) for i in samples]))
+                    rows["seq_lengths"].append([int(clipped[i]) for i in samples])
+                yield rows
+
+        _write_shard(path, PACKED_SCHEMA, batches())
+
+    unpacked = sum(
+        int(clipped[start:start + batch_size].max()) * len(clipped[start:start + batch_size])
+        for start in range(0, len(clipped), batch_size)
+    )
+    stats = PackingStats(
+        samples=len(lengths),
+        sequences=sequences,
+        tokens=int(clipped.sum()),
+        truncated=int((lengths > max_seq_length).sum()),
+        max_seq_length=max_seq_length,
+        unpacked_tokens=unpacked,
+    )
+    return path, stats
+
+
+def prepare_packed_dataset(examples, tokenizer, cache_dir, max_seq_length, template=TRAIN_PROMPT, batch_size=8,
+                           dataset_key=None):
+    """
+    格式化、分词并装箱，两个阶段的结果都会被缓存
+
+    返回:
+        tuple: (装箱后的 Arrow 文件路径, PackingStats)
+    """
+    token_path = tokenize_to_shard(examples, tokenizer, cache_dir, template, dataset_key=dataset_key)
+    return build_packed_shard(token_path, max_seq_length, batch_size=batch_size)
+
+
+def packed_features(input_ids, seq_lengths, max_seq_length, pad_token_id):
+    """
+    生成一个装箱序列的训练特征
+
+    - position_ids 在每个样本开头重新从 0 开始，flash_attention_2 据此区分样本边界
+    - labels 中每个样本的第一个 token 以及末尾的填充为 IGNORE_INDEX，
+      模型不会学习根据上一个样本预测下一个样本的开头
+
+    返回:
+        dict: input_ids、labels、position_ids 三个长度为 max_seq_length 的 numpy 数组
+    """
+    length = len(input_ids)
+    padded = np.full(max_seq_length, pad_token_id, dtype=np.int64)
+    padded[:length] = input_ids
+    labels = np.full(max_seq_length, IGNORE_INDEX, dtype=np.int64)
+    labels[:length] = input_ids
+    position_ids = np.zeros(max_seq_length, dtype=np.int64)
+    start = 0
+    for seq_length in seq_lengths:
+        position_ids[start:start + seq_length] = np.arange(seq_length)
+        labels[start] = IGNORE_INDEX
+        start += seq_length
+    return {"input_ids": padded, "labels": labels, "position_ids": position_ids}
+
+
+def block_causal_mask(seq_lengths, max_seq_length):
+    """
+    块对角的因果注意力掩码，每个 token 只能看到同一样本中位于它之前的 token
+
+    用于不支持按 position_ids 区分样本的注意力实现(eager、sdpa)；
+    掩码大小为 max_seq_length 的平方，flash_attention_2 下不需要
+
+    返回:
+        numpy.ndarray: (max_seq_length, max_seq_length) 的 bool 数组，True 表示可见
+    """
+    segments = np.full(max_seq_length, -1, dtype=np.int64)
+    start = 0
+    for index, seq_length in enumerate(seq_lengths):
+        segments[start:start + seq_length] = index
+        start += seq_length
+    same_segment = (segments[:, None] == segments[None, :]) & (segments[:, None] >= 0)
+    return same_segment & np.tri(max_seq_length, dtype=bool)
+
+
+class PackedCollator:
+    """
+    装箱序列的 data_collator，返回 input_ids、labels、position_ids 张量
+
+    参数:
+        max_seq_length (int): 序列长度
+        pad_token_id (int): 填充 token
+        block_mask (bool): 是否生成 4D 块对角注意力掩码；
+            使用 flash_attention_2 时保持 False，模型根据 position_ids 区分样本
+    """
+
+    def __init__(self, max_seq_length, pad_token_id, block_mask=False):
+        self.max_seq_length = max_seq_length
+        self.pad_token_id = pad_token_id
+        self.block_mask = block_mask
+
+    def __call__(self, rows):
+        import torch
+
+        features = [
+            packed_features(row["input_ids"], row["seq_lengths"], self.max_seq_length, self.pad_token_id)
+            for row in rows
+        ]
+        batch = {key: torch.from_numpy(np.stack([f[key] for f in features])) for key in features[0]}
+        if self.block_mask:
+            masks = np.stack([block_causal_mask(row["seq_lengths"], self.max_seq_length) for row in rows])
+            # transformers 的 4D 掩码: 可见位置为 0，不可见位置为最小值
+            mask = torch.from_numpy(masks[:, None]).to(torch.float32)
+            batch["attention_mask"] = (1.0 - mask) * torch.finfo(torch.float32).min
+        return batch
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from datasets import load_dataset
+    from transformers import AutoTokenizer
+
+    parser = argparse.ArgumentParser(description="SFT 数据集预处理与装箱")
+    parser.add_argument("--tokenizer", default="unsloth/DeepSeek-R1-Distill-Qwen-1.5B-unsloth-bnb-4bit")
+    parser.add_argument("--dataset", default="FreedomIntelligence/medical-o1-reasoning-SFT")
+    parser.add_argument("--subset", default="zh")
+    parser.add_argument("--cache-dir", default="sft_cache")
+    parser.add_argument("--max-seq-length", type=int, default=8192)
+    parser.add_argument("--batch-size", type=int, default=64, help="训练的批大小，用于估算不装箱时的填充量")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    dataset = load_dataset(args.dataset, args.subset, split="train", streaming=True)
+    path, stats = prepare_packed_dataset(dataset, tokenizer, args.cache_dir, args.max_seq_length,
+                                         batch_size=args.batch_size,
+                                         dataset_key=f"{args.dataset}/{args.subset}/train")
+    print(path)
+    print(stats.summary())
@@ -0,0 +1,206 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from batch_inference import (
+    BatchInferenceRunner,
+    InferenceReport,
+    is_out_of_memory,
+    kv_cache_bytes_per_token,
+    load_completed,
+    load_questions,
+    plan_batches,
+)
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+class TestPlanBatches(unittest.TestCase):
+    def test_sorted_by_length(self):
+        """长度相近的 prompt 分在同一批，最长的批次最先执行"""
+        lengths = [5, 50, 10, 45, 6, 48]
+        batches = plan_batches(lengths, max_new_tokens=10, max_batch_size=3)
+        self.assertEqual(batches, [[1, 5, 3], [2, 4, 0]])
+
+    def test_token_budget(self):
+        """每批的 批大小 * (最长 prompt + max_new_tokens) 不超过预算"""
+        lengths = [100, 90, 20, 20, 20, 20, 20]
+        batches = plan_batches(lengths, max_new_tokens=20, max_batch_size=8, max_batch_tokens=250)
+        for batch in batches:
+            self.assertLessEqual(len(batch) * (max(lengths[i] for i in batch) + 20), 250)
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(len(lengths))))
+        self.assertEqual([len(batch) for batch in batches], [2, 5])
+
+    def test_oversized_prompt_gets_own_batch(self):
+        self.assertEqual(plan_batches([1000, 10], 10, 8, max_batch_tokens=100), [[0], [1]])
+        self.assertEqual(plan_batches([], 10, 8), [])
+
+    def test_kv_cache_bytes(self):
+        # Qwen2-1.5B: 28 层，2 个 KV 头，头维度 128
+        config = SimpleNamespace(num_attention_heads=12, num_key_value_heads=2, hidden_size=1536, num_hidden_layers=28)
+        self.assertEqual(kv_cache_bytes_per_token(config, 2), 2 * 28 * 2 * 128 * 2)
+
+
+class TestFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def test_load_questions(self):
+        jsonl = self.write("q.jsonl", '{"Question": "问题一"}\n\n{"id": "q2", "question": "问题二"}\n')
+        self.assertEqual(load_questions(jsonl), [{"id": "0", "question": "问题一"}, {"id": "q2", "question": "问题二"}])
+        text = self.write("q.txt", "问题一\n\n问题二\n")
+        self.assertEqual([r["question"] for r in load_questions(text)], ["问题一", "问题二"])
+        missing = self.write("missing.jsonl", '{"Question": "问题一"}\n{"id": "q2", "answer": "答案"}\n')
+        with self.assertRaisesRegex(ValueError, "第 2 行"):
+            load_questions(missing)
+
+    def test_load_completed_ignores_partial_lines(self):
+        path = self.write("out.jsonl", '{"id": "a", "response": "x"}\n{"id": "b", "resp')
+        self.assertEqual(load_completed(path), {"a"})
+
+
+class TestOutOfMemory(unittest.TestCase):
+    def test_messages(self):
+        for message in (
+            "CUDA out of memory. Tried to allocate 2.00 GiB",
+            "MPS backend out of memory (MPS allocated: 17.00 GB, other allocations: 1.00 GB)",
+            "[enforce fail at alloc_cpu.cpp:114] data. DefaultCPUAllocator: not enough memory: "
+            "you tried to allocate 8589934592 bytes.",
+            "[enforce fail at alloc_cpu.cpp:83] err == 0. DefaultCPUAllocator: can't allocate memory: "
+            "you tried to allocate 8589934592 bytes. Error code 12 (Cannot allocate memory)",
+        ):
+            with self.subTest(message=message):
+                self.assertTrue(is_out_of_memory(RuntimeError(message)))
+        self.assertFalse(is_out_of_memory(RuntimeError("Expected all tensors to be on the same device")))
+
+
+class TestInferenceReport(unittest.TestCase):
+    def test_throughput_and_percentiles(self):
+        report = InferenceReport(generated_tokens=500, seconds=10.0, latencies=[1.0] * 9 + [10.0])
+        self.assertEqual(report.tokens_per_second, 50.0)
+        percentiles = report.latency_percentiles()
+        self.assertEqual(percentiles["p50"], 1.0)
+        self.assertGreater(percentiles["p99"], 9.0)
+        self.assertIn("tokens/s", report.summary())
+        self.assertEqual(InferenceReport().latency_percentiles()["p50"], 0.0)
+
+
+class CharTokenizer:
+    """按字符分词的简易分词器，0 为填充/结束符，左侧填充"""
+
+    pad_token_id = 0
+
+    def __call__(self, texts, return_tensors=None, padding=False):
+        ids = [[ord(char) for char in text] for text in texts]
+        if return_tensors is None:
+            return {"input_ids": ids}
+        width = max(len(row) for row in ids)
+        input_ids = torch.tensor([[0] * (width - len(row)) + row for row in ids])
+        attention_mask = torch.tensor([[0] * (width - len(row)) + [1] * len(row) for row in ids])
+        return _Encoding(input_ids=input_ids, attention_mask=attention_mask)
+
+    def batch_decode(self, rows, skip_special_tokens=True):
+        return ["".join(chr(token) for token in row.tolist() if token) for row in rows]
+
+
+class _Encoding(dict):
+    def to(self, device):
+        return self
+
+
+class EchoModel:
+    """回显 prompt 中字符数的模型，批大小超过 max_batch 时模拟内存不足"""
+
+    def __init__(self, max_batch=None, error="CUDA out of memory. Tried to allocate 2.00 GiB"):
+        self.max_batch = max_batch
+        self.error = error
+        self.batch_sizes = []
+        self.device = "cpu"
+
+    def generate(self, input_ids, attention_mask, max_new_tokens, pad_token_id, use_cache):
+        if self.max_batch is not None and len(input_ids) > self.max_batch:
+            raise RuntimeError(self.error)
+        self.batch_sizes.append(len(input_ids))
+        rows = []
+        for mask in attention_mask:
+            answer = [ord(char) for char in str(int(mask.sum()))][:max_new_tokens]
+            rows.append(answer + [pad_token_id] * (max_new_tokens - len(answer)))
+        return torch.cat([input_ids, torch.tensor(rows)], dim=1)
+
+
+@unittest.skipIf(torch is None, "需要安装 torch")
+class TestBatchInferenceRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmpdir.name, "answers.jsonl")
+        self.records = [{"id": str(i), "question": "问" * (i * 3 + 1)} for i in range(10)]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_records(self, model, records, **kwargs):
+        runner = BatchInferenceRunner(model, CharTokenizer(), max_new_tokens=4, prompt_template="{}{}", **kwargs)
+        return runner.run(records, self.output)
+
+    def read_output(self):
+        with open(self.output, "r", encoding="utf-8") as file:
+            return {record["id"]: record for record in map(json.loads, file)}
+
+    def test_batched_generation(self):
+        """结果只包含生成部分，不受批内填充的影响"""
+        model = EchoModel()
+        report = self.run_records(model, self.records, max_batch_size=4)
+        self.assertEqual(model.batch_sizes, [4, 4, 2])
+        results = self.read_output()
+        self.assertEqual(len(results), 10)
+        for i in range(10):
+            self.assertEqual(results[str(i)]["response"], str(i * 3 + 1))
+            self.assertEqual(results[str(i)]["prompt_tokens"], i * 3 + 1)
+        self.assertEqual(report.generated_tokens, sum(len(str(i * 3 + 1)) for i in range(10)))
+        self.assertEqual(report.prompt_tokens + report.padding_tokens, 4 * 28 + 4 * 16 + 2 * 4)
+        self.assertEqual(len(report.latencies), 10)
+
+    def test_resume(self):
+        self.run_records(EchoModel(), self.records[:6], max_batch_size=4)
+        model = EchoModel()
+        report = self.run_records(model, self.records, max_batch_size=4)
+        self.assertEqual(report.skipped, 6)
+        self.assertEqual(sum(model.batch_sizes), 4)
+        self.assertEqual(len(self.read_output()), 10)
+
+    def test_out_of_memory_splits_batch(self):
+        model = EchoModel(max_batch=2)
+        self.run_records(model, self.records, max_batch_size=8)
+        self.assertTrue(all(size <= 2 for size in model.batch_sizes))
+        self.assertEqual(sum(model.batch_sizes), 10)
+        self.assertEqual(len(self.read_output()), 10)
+
+    def test_cpu_out_of_memory_splits_batch(self):
+        model = EchoModel(max_batch=2, error="[enforce fail at alloc_cpu.cpp:114] data. "
+                                             "DefaultCPUAllocator: not enough memory: you tried to allocate 8 GB.")
+        self.run_records(model, self.records, max_batch_size=8)
+        self.assertEqual(sum(model.batch_sizes), 10)
+
+    def test_missing_question(self):
+        """缺少问题的记录直接报错，不会以 "None" 作为 prompt 生成"""
+        with self.assertRaises(ValueError):
+            self.run_records(EchoModel(), self.records + [{"id": "x", "question": None}])
+        self.assertFalse(os.path.exists(self.output))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
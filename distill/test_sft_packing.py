@@ -0,0 +1,186 @@
+import os
+import random
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from sft_packing import (
+    IGNORE_INDEX,
+    PackedCollator,
+    block_causal_mask,
+    build_packed_shard,
+    cache_key,
+    dataset_fingerprint,
+    load_shard,
+    pack,
+    packed_features,
+    prepare_packed_dataset,
+    tokenize_to_shard,
+)
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+class CharTokenizer:
+    """按字符分词的简易分词器，记录分词次数"""
+
+    name_or_path = "char"
+    eos_token = "\n"
+    pad_token = "\0"
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_vocab(self):
+        return {"a": 97}
+
+    def __call__(self, texts, add_special_tokens=True):
+        self.calls += 1
+        return {"input_ids": [[ord(char) for char in text] for text in texts]}
+
+
+def make_examples(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        {"Question": "问" * rng.randint(1, 20), "Complex_CoT": "想" * rng.randint(1, 200), "Response": "答" * rng.randint(1, 50)}
+        for _ in range(count)
+    ]
+
+
+TEMPLATE = "{}|{}|{}"
+
+
+class TestPack(unittest.TestCase):
+    def test_bins_respect_capacity(self):
+        rng = random.Random(1)
+        lengths = [rng.randint(1, 300) for _ in range(2000)]
+        bins = pack(lengths, 512)
+        self.assertEqual(sorted(i for b in bins for i in b), list(range(len(lengths))))
+        for b in bins:
+            self.assertLessEqual(sum(lengths[i] for i in b), 512)
+        # Best-Fit Decreasing 的序列数接近下界
+        self.assertLessEqual(len(bins), sum(lengths) / 512 * 1.05 + 1)
+
+    def test_long_samples_are_clipped(self):
+        self.assertEqual(pack([1000, 10, 5], 100), [[0], [1, 2]])
+        self.assertEqual(pack([], 100), [])
+
+
+class TestFeatures(unittest.TestCase):
+    def test_positions_and_labels_reset_at_boundaries(self):
+        features = packed_features([1, 2, 3, 4, 5], [2, 3], max_seq_length=7, pad_token_id=0)
+        np.testing.assert_array_equal(features["input_ids"], [1, 2, 3, 4, 5, 0, 0])
+        np.testing.assert_array_equal(features["position_ids"], [0, 1, 0, 1, 2, 0, 0])
+        np.testing.assert_array_equal(
+            features["labels"], [IGNORE_INDEX, 2, IGNORE_INDEX, 4, 5, IGNORE_INDEX, IGNORE_INDEX]
+        )
+
+    def test_block_causal_mask(self):
+        mask = block_causal_mask([2, 2], 5)
+        expected = np.array([
+            [1, 0, 0, 0, 0],
+            [1, 1, 0, 0, 0],
+            [0, 0, 1, 0, 0],
+            [0, 0, 1, 1, 0],
+            [0, 0, 0, 0, 0],
+        ], dtype=bool)
+        np.testing.assert_array_equal(mask, expected)
+
+
+class TestShards(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_tokenize_once(self):
+        """缓存键相同时不再分词，分词器、模板或样本变化时重新分词"""
+        tokenizer = CharTokenizer()
+        examples = make_examples(25)
+        path = tokenize_to_shard(examples, tokenizer, self.cache_dir, TEMPLATE, batch_size=10)
+        self.assertEqual(tokenizer.calls, 3)
+        self.assertEqual(tokenize_to_shard(list(examples), tokenizer, self.cache_dir, TEMPLATE, batch_size=10), path)
+        self.assertEqual(tokenizer.calls, 3)
+
+        # 样本不同(另一份数据集或修改过的样本)时生成新的分片
+        edited = make_examples(25)
+        edited[3] = dict(edited[3], Response="改")
+        for other in (make_examples(25, seed=1), make_examples(24), edited):
+            other_path = tokenize_to_shard(other, tokenizer, self.cache_dir, TEMPLATE, batch_size=10)
+            self.assertNotEqual(other_path, path)
+            self.assertEqual(load_shard(other_path).num_rows, len(other))
+
+        # 显式的 dataset_key；一次性迭代器无法计算指纹
+        keyed = tokenize_to_shard(iter(examples), tokenizer, self.cache_dir, TEMPLATE, dataset_key="medical/zh/train")
+        self.assertNotEqual(keyed, path)
+        with self.assertRaises(ValueError):
+            tokenize_to_shard(iter(examples), tokenizer, self.cache_dir, TEMPLATE)
+        self.assertEqual(dataset_fingerprint(SimpleNamespace(_fingerprint="abc")), "abc")
+
+        table = load_shard(path)
+        self.assertEqual(table.num_rows, 25)
+        first = "{}|{}|{}".format(examples[0]["Question"], examples[0]["Complex_CoT"], examples[0]["Response"]) + "\n"
+        self.assertEqual(table.column("input_ids")[0].as_py(), [ord(char) for char in first])
+
+        other = CharTokenizer()
+        other.eos_token = "</s>"
+        self.assertNotEqual(cache_key(tokenizer, TEMPLATE), cache_key(other, TEMPLATE))
+        self.assertNotEqual(cache_key(tokenizer, TEMPLATE), cache_key(tokenizer, TEMPLATE + "\n"))
+
+    def test_packed_shard_preserves_samples(self):
+        """装箱后的序列由完整的原始样本拼接而成，没有样本丢失或重复"""
+        examples = make_examples(300)
+        tokenizer = CharTokenizer()
+        token_path = tokenize_to_shard(examples, tokenizer, self.cache_dir, TEMPLATE, batch_size=64)
+        path, stats = build_packed_shard(token_path, 512, batch_size=8, rows_per_batch=7)
+
+        originals = sorted(tuple(row) for row in load_shard(token_path).column("input_ids").to_pylist())
+        pieces = []
+        for row in load_shard(path).to_pylist():
+            self.assertLessEqual(len(row["input_ids"]), 512)
+            self.assertEqual(sum(row["seq_lengths"]), len(row["input_ids"]))
+            start = 0
+            for length in row["seq_lengths"]:
+                pieces.append(tuple(row["input_ids"][start:start + length]))
+                start += length
+        self.assertEqual(sorted(pieces), originals)
+
+        self.assertEqual((stats.samples, stats.truncated), (300, 0))
+        self.assertEqual(stats.tokens, sum(map(len, originals)))
+        self.assertGreater(stats.packed_efficiency, 0.9)
+        self.assertGreater(stats.packed_efficiency, stats.unpacked_efficiency)
+        self.assertIn("填充效率", stats.summary())
+
+        # 再次调用直接使用缓存，统计信息一致
+        cached_path, cached_stats = build_packed_shard(token_path, 512, batch_size=8)
+        self.assertEqual((cached_path, cached_stats), (path, stats))
+
+    def test_prepare_truncates_long_samples(self):
+        path, stats = prepare_packed_dataset(make_examples(20), CharTokenizer(), self.cache_dir, 5, TEMPLATE)
+        self.assertEqual(stats.truncated, 20)
+        self.assertEqual(stats.sequences, 20)
+        self.assertTrue(all(len(row) == 5 for row in load_shard(path).column("input_ids").to_pylist()))
+        self.assertTrue(os.path.basename(path).startswith("packed-"))
+
+
+@unittest.skipIf(torch is None, "需要安装 torch")
+class TestPackedCollator(unittest.TestCase):
+    def test_collate(self):
+        rows = [{"input_ids": [1, 2, 3], "seq_lengths": [1, 2]}, {"input_ids": [4, 5], "seq_lengths": [2]}]
+        batch = PackedCollator(4, pad_token_id=0, block_mask=True)(rows)
+        self.assertEqual(batch["input_ids"].tolist(), [[1, 2, 3, 0], [4, 5, 0, 0]])
+        self.assertEqual(batch["position_ids"].tolist(), [[0, 0, 1, 0], [0, 1, 0, 0]])
+        self.assertEqual(tuple(batch["attention_mask"].shape), (2, 1, 4, 4))
+        self.assertEqual(batch["attention_mask"][0, 0, 2, 1].item(), 0.0)
+        self.assertLess(batch["attention_mask"][0, 0, 1, 0].item(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
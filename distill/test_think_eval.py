@@ -0,0 +1,157 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from think_eval import (
+    EvalReport,
+    ThinkResult,
+    ThinkStreamParser,
+    _ParserStreamer,
+    char_f1,
+    consume_stream,
+    evaluate,
+    normalize_answer,
+    rouge_l,
+)
+
+OUTPUT = "患者可能是颈椎病。\n需要检查颈椎</think>\n诊断：颈椎病，建议拍片。"
+
+
+def pieces_of(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestThinkStreamParser(unittest.TestCase):
+    def test_split_tags_across_pieces(self):
+        """无论片段如何切分，推理和答案的划分结果相同"""
+        for size in range(1, 12):
+            with self.subTest(size=size):
+                parser = ThinkStreamParser()
+                events = []
+                for piece in pieces_of(OUTPUT, size):
+                    events.extend(parser.feed(piece))
+                events.extend(parser.close())
+                self.assertEqual(parser.reasoning, "患者可能是颈椎病。\n需要检查颈椎")
+                self.assertEqual(parser.answer, "诊断：颈椎病，建议拍片。")
+                self.assertNotIn("<", "".join(text for _, text in events))
+                kinds = [kind for kind, _ in events]
+                self.assertEqual(kinds, sorted(kinds, key=lambda kind: kind == "answer"))
+
+    def test_token_counts(self):
+        parser = ThinkStreamParser()
+        for piece in ["想", "想", "</think>", "答", "案"]:
+            parser.feed(piece)
+        self.assertEqual((parser.reasoning_tokens, parser.answer_tokens), (3, 2))
+
+    def test_opening_tag_when_not_in_reasoning(self):
+        parser = ThinkStreamParser(in_reasoning=False)
+        for piece in pieces_of("<think>推理</think>答案", 3):
+            parser.feed(piece)
+        parser.close()
+        self.assertEqual((parser.reasoning, parser.answer), ("推理", "答案"))
+
+    def test_partial_tag_text_is_flushed(self):
+        parser = ThinkStreamParser(in_reasoning=False)
+        parser.feed("a < b <th")
+        parser.close()
+        self.assertEqual(parser.answer, "a < b <th")
+
+
+class TestConsumeStream(unittest.TestCase):
+    def test_stops_at_reasoning_budget(self):
+        """推理达到上限后停止读取，不再消耗后续片段"""
+        consumed = []
+
+        def stream():
+            for piece in ["推"] * 100 + ["</think>", "答案"]:
+                consumed.append(piece)
+                yield piece
+
+        events = []
+        result, _ = consume_stream(stream(), max_reasoning_tokens=10, on_event=lambda *e: events.append(e))
+        self.assertTrue(result.forced)
+        self.assertEqual(len(consumed), 10)
+        self.assertEqual(result.reasoning_tokens, 10)
+        self.assertEqual(result.answer, "")
+        self.assertEqual(len(events), 10)
+
+    def test_complete_stream(self):
+        result, _ = consume_stream(pieces_of(OUTPUT, 2), max_reasoning_tokens=100)
+        self.assertFalse(result.forced)
+        self.assertEqual(result.answer, "诊断：颈椎病，建议拍片。")
+        self.assertIsNotNone(result.answer_seconds)
+        self.assertEqual(result.tokens, len(pieces_of(OUTPUT, 2)))
+
+
+class CharTokenizer:
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(i) for i in ids)
+
+
+class TestParserStreamer(unittest.TestCase):
+    def test_skips_prompt_and_resets_between_phases(self):
+        parser = ThinkStreamParser()
+        timing = {"start": 0.0, "first_token": None, "answer": None}
+        streamer = _ParserStreamer(CharTokenizer(), parser, timing)
+        streamer.put(np.array([[ord(c) for c in "提示词<think>"]]))
+        for char in OUTPUT:
+            streamer.put(np.array([ord(char)]))
+        streamer.end()
+        self.assertEqual(parser.answer, "诊断：颈椎病，建议拍片。")
+        self.assertEqual(parser.reasoning_tokens + parser.answer_tokens, len(OUTPUT))
+        self.assertIsNotNone(timing["answer"])
+
+        streamer.put(np.array([[1, 2]]))
+        streamer.put(np.array([ord("好")]))
+        streamer.end()
+        self.assertEqual(parser.answer, "诊断：颈椎病，建议拍片。好")
+
+
+class TestScoring(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual(normalize_answer("答案：A， 是的！ OK."), "答案a是的ok")
+
+    def test_char_f1_and_rouge_l(self):
+        self.assertEqual(char_f1("颈椎病", "颈椎病。"), 1.0)
+        self.assertEqual(rouge_l("颈椎病", "颈椎病。"), 1.0)
+        self.assertEqual(char_f1("感冒", "颈椎病"), 0.0)
+        self.assertEqual(char_f1("", ""), 1.0)
+        # 字符相同但顺序不同: char F1 为 1，ROUGE-L 较低
+        self.assertEqual(char_f1("病椎颈", "颈椎病"), 1.0)
+        self.assertAlmostEqual(rouge_l("病椎颈", "颈椎病"), 1 / 3)
+
+
+class TestEvaluate(unittest.TestCase):
+    def test_evaluate_writes_records(self):
+        examples = [
+            {"Question": "头晕恶心", "Response": "颈椎病"},
+            {"Question": "发热咳嗽", "Response": "上呼吸道感染"},
+        ]
+
+        def generate(question):
+            return ThinkResult(reasoning="思考" * 5, answer="颈椎病", reasoning_tokens=10, answer_tokens=3,
+                               seconds=0.5, forced=question == "发热咳嗽")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "eval.jsonl")
+            report = evaluate(generate, examples, path)
+            with open(path, "r", encoding="utf-8") as file:
+                records = [json.loads(line) for line in file]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]["char_f1"], 1.0)
+        self.assertEqual(records[1]["char_f1"], 0.0)
+        self.assertEqual(report.mean("char_f1"), 0.5)
+        self.assertEqual(report.mean("forced"), 0.5)
+        self.assertEqual(report.mean("reasoning_tokens"), 10)
+        self.assertEqual(report.latency_percentiles()["p50"], 0.5)
+        summary = report.summary()
+        self.assertIn("平均推理 10 tokens", summary)
+        self.assertIn("答案 3 tokens", summary)
+        self.assertEqual(EvalReport().mean("char_f1"), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,441 @@
+import json
+import logging
+import re
+import time
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+
+from batch_inference import INFERENCE_PROMPT
+
+logger = logging.getLogger(__name__)
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+# 推理过程达到上限时追加的内容，强制模型结束思考并给出答案
+FORCE_ANSWER = "\n" + THINK_CLOSE + "\n"
+
+# 计算得分前去掉的空白和标点
+NORMALIZE_PATTERN = re.compile(r"[\s\u3000-\u303f\uff00-\uff0f\uff1a-\uff20\uff3b-\uff40\uff5b-\uff65!-/:-@\[-`{-~]+")
+
+
+def _partial_tag(text, tag):
+    """text 末尾可能是 tag 前缀的最长长度，这部分需要等待后续片段才能判断"""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class ThinkStreamParser:
+    """
+    流式区分 <think> 推理过程和最终答案
+
+    每收到一个文本片段调用一次 feed，标签可能被拆分在多个片段中，
+    无法确定的末尾部分会暂存到下一个片段。推理模板以 <think> 结尾时，生成内容一开始就处于推理阶段。
+
+    参数:
+        in_reasoning (bool): 初始是否处于推理阶段
+        max_reasoning_tokens (int): 推理 token 上限，达到后 over_budget 为 True，None 表示不限制
+    """
+
+    def __init__(self, in_reasoning=True, max_reasoning_tokens=None):
+        self.in_reasoning = in_reasoning
+        self.max_reasoning_tokens = max_reasoning_tokens
+        self.reasoning_tokens = 0
+        self.answer_tokens = 0
+        self._reasoning = []
+        self._answer = []
+        self._pending = ""
+
+    @property
+    def reasoning(self):
+        return "".join(self._reasoning).strip()
+
+    @property
+    def answer(self):
+        return "".join(self._answer).strip()
+
+    @property
+    def over_budget(self):
+        return (self.in_reasoning and self.max_reasoning_tokens is not None
+                and self.reasoning_tokens >= self.max_reasoning_tokens)
+
+    def feed(self, text, tokens=1):
+        """
+        处理一个文本片段
+
+        参数:
+            text (str): 新生成的文本
+            tokens (int): 该片段对应的 token 数
+
+        返回:
+            list[tuple]: ("reasoning" 或 "answer", 文本) 事件列表
+        """
+        if self.in_reasoning:
+            self.reasoning_tokens += tokens
+        else:
+            self.answer_tokens += tokens
+        text = self._pending + text
+        self._pending = ""
+        events = []
+        while text:
+            tag = THINK_CLOSE if self.in_reasoning else THINK_OPEN
+            index = text.find(tag)
+            if index >= 0:
+                self._emit(events, text[:index])
+                self.in_reasoning = not self.in_reasoning
+                text = text[index + len(tag):]
+                continue
+            keep = _partial_tag(text, tag)
+            self._emit(events, text[:len(text) - keep])
+            self._pending = text[len(text) - keep:]
+            break
+        return events
+
+    def close(self):
+        """生成结束，输出暂存的内容"""
+        events = []
+        self._emit(events, self._pending)
+        self._pending = ""
+        return events
+
+    def _emit(self, events, text):
+        if not text:
+            return
+        kind = "reasoning" if self.in_reasoning else "answer"
+        (self._reasoning if self.in_reasoning else self._answer).append(text)
+        events.append((kind, text))
+
+
+@dataclass
+class ThinkResult:
+    """一次生成的推理过程、答案、token 数和耗时"""
+    reasoning: str
+    answer: str
+    reasoning_tokens: int
+    answer_tokens: int
+    seconds: float
+    first_token_seconds: float = None
+    answer_seconds: float = None  # 开始输出答案的时间
+    forced: bool = False  # 推理达到上限后被强制结束
+
+    @property
+    def tokens(self):
+        return self.reasoning_tokens + self.answer_tokens
+
+
+def consume_stream(pieces, max_reasoning_tokens=None, in_reasoning=True, on_event=None):
+    """
+    读取逐 token 的文本片段，推理超过上限时停止读取
+
+    适用于任何流式接口，例如 DeepSeek API 的流式输出或 transformers 的 TextIteratorStreamer。
+
+    参数:
+        pieces (iterable[str]): 文本片段，每个片段计为一个 token
+        max_reasoning_tokens (int): 推理 token 上限
+        in_reasoning (bool): 初始是否处于推理阶段
+        on_event (callable): 接收 (类型, 文本) 的回调，用于实时显示
+
+    返回:
+        tuple: (ThinkResult, ThinkStreamParser)
+    """
+    parser = ThinkStreamParser(in_reasoning, max_reasoning_tokens)
+    start = time.perf_counter()
+    first_token = answer_seconds = None
+    for piece in pieces:
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        events = parser.feed(piece)
+        if answer_seconds is None and any(kind == "answer" for kind, _ in events):
+            answer_seconds = time.perf_counter() - start
+        for event in events:
+            if on_event:
+                on_event(*event)
+        if parser.over_budget:
+            break
+    for event in parser.close():
+        if on_event:
+            on_event(*event)
+    if hasattr(pieces, "close"):
+        pieces.close()
+    result = ThinkResult(
+        reasoning=parser.reasoning,
+        answer=parser.answer,
+        reasoning_tokens=parser.reasoning_tokens,
+        answer_tokens=parser.answer_tokens,
+        seconds=time.perf_counter() - start,
+        first_token_seconds=first_token,
+        answer_seconds=answer_seconds,
+        forced=parser.over_budget,
+    )
+    return result, parser
+
+
+class HFThinkGenerator:
+    """
+    transformers 模型的流式生成，推理达到上限时提前停止
+
+    第一阶段逐 token 解码并交给 ThinkStreamParser，推理 token 数达到上限时通过 StoppingCriteria 停止；
+    随后在已生成的推理过程后追加 </think>，第二阶段只生成答案(最多 max_answer_tokens 个 token)。
+
+    参数:
+        model: transformers 的 CausalLM 模型
+        tokenizer: 对应的分词器
+        max_reasoning_tokens (int): 推理 token 上限，None 表示不限制
+        max_new_tokens (int): 第一阶段最多生成的 token 数
+        max_answer_tokens (int): 强制结束推理后答案最多的 token 数
+        prompt_template (str): 推理模板，以 <think> 结尾
+        on_event (callable): 接收 (类型, 文本) 的回调，用于实时显示
+    """
+
+    def __init__(self, model, tokenizer, max_reasoning_tokens=None, max_new_tokens=1200, max_answer_tokens=512,
+                 prompt_template=INFERENCE_PROMPT, on_event=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_reasoning_tokens = max_reasoning_tokens
+        self.max_new_tokens = max_new_tokens
+        self.max_answer_tokens = max_answer_tokens
+        self.prompt_template = prompt_template
+        self.on_event = on_event
+
+    def __call__(self, question):
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
+        prompt = self.prompt_template.format(question, "")
+        parser = ThinkStreamParser(THINK_OPEN in prompt[-20:], self.max_reasoning_tokens)
+        timing = {"start": time.perf_counter(), "first_token": None, "answer": None}
+        streamer = _ParserStreamer(self.tokenizer, parser, timing, self.on_event)
+
+        class ReasoningBudget(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                return parser.over_budget
+
+        inputs = self.tokenizer([prompt], return_tensors="pt").to(self.model.device)
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=self.max_new_tokens,
+                streamer=streamer,
+                stopping_criteria=StoppingCriteriaList([ReasoningBudget()]),
+                use_cache=True,
+            )
+        # generate 结束时会调用 streamer.end()，暂存的内容已经输出
+        forced = parser.over_budget
+
+        if forced:
+            # 预算强制: 在推理过程后追加 </think>，只生成答案
+            generated = self.tokenizer.decode(outputs[0, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+            parser.feed(FORCE_ANSWER, tokens=0)
+            answer_inputs = self.tokenizer([prompt + generated + FORCE_ANSWER], return_tensors="pt").to(self.model.device)
+            with torch.inference_mode():
+                self.model.generate(**answer_inputs, max_new_tokens=self.max_answer_tokens, streamer=streamer,
+                                    use_cache=True)
+
+        return ThinkResult(
+            reasoning=parser.reasoning,
+            answer=parser.answer,
+            reasoning_tokens=parser.reasoning_tokens,
+            answer_tokens=parser.answer_tokens,
+            seconds=time.perf_counter() - timing["start"],
+            first_token_seconds=timing["first_token"],
+            answer_seconds=timing["answer"],
+            forced=forced,
+        )
+
+
+class _ParserStreamer:
+    """
+    transformers 的 streamer 接口(put/end): 增量解码新 token 并交给 ThinkStreamParser
+
+    第一次 put 收到的是 prompt，直接跳过；解码结果以不完整的 UTF-8 字符结尾时等待下一个 token
+    """
+
+    def __init__(self, tokenizer, parser, timing, on_event=None):
+        self.tokenizer = tokenizer
+        self.parser = parser
+        self.timing = timing
+        self.on_event = on_event
+        self._skip_prompt = True
+        self._ids = []
+        self._printed = 0
+        self._tokens = 0
+
+    def put(self, value):
+        if self._skip_prompt:
+            self._skip_prompt = False
+            return
+        if self.timing["first_token"] is None:
+            self.timing["first_token"] = time.perf_counter() - self.timing["start"]
+        ids = value.reshape(-1).tolist()
+        self._ids.extend(ids)
+        self._tokens += len(ids)
+        text = self.tokenizer.decode(self._ids, skip_special_tokens=True)
+        if text.endswith("�"):
+            return
+        self._dispatch(self.parser.feed(text[self._printed:], tokens=self._tokens))
+        self._printed = len(text)
+        self._tokens = 0
+        if text.endswith("\n"):
+            # 与 TextStreamer 相同，遇到换行后重新开始缓存，避免每步都解码全部 token
+            self._ids = []
+            self._printed = 0
+
+    def end(self):
+        text = self.tokenizer.decode(self._ids, skip_special_tokens=True)
+        events = self.parser.feed(text[self._printed:], tokens=self._tokens) if len(text) > self._printed else []
+        self._dispatch(events + self.parser.close())
+        # 第二阶段重新从 prompt 开始
+        self._skip_prompt = True
+        self._ids = []
+        self._printed = 0
+        self._tokens = 0
+
+    def _dispatch(self, events):
+        for kind, text in events:
+            if kind == "answer" and self.timing["answer"] is None:
+                self.timing["answer"] = time.perf_counter() - self.timing["start"]
+            if self.on_event:
+                self.on_event(kind, text)
+
+
+def normalize_answer(text):
+    """去掉空白和标点后比较"""
+    return NORMALIZE_PATTERN.sub("", text or "").lower()
+
+
+def char_f1(prediction, reference):
+    """字符级 F1: 中文答案没有天然的分词边界，按字符统计重合度"""
+    prediction, reference = normalize_answer(prediction), normalize_answer(reference)
+    if not prediction or not reference:
+        return float(prediction == reference)
+    counts = {}
+    for char in reference:
+        counts[char] = counts.get(char, 0) + 1
+    overlap = 0
+    for char in prediction:
+        if counts.get(char, 0) > 0:
+            counts[char] -= 1
+            overlap += 1
+    if overlap == 0:
+        return 0.0
+    precision, recall = overlap / len(prediction), overlap / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_l(prediction, reference):
+    """字符级 ROUGE-L F1，基于最长公共子序列"""
+    prediction, reference = normalize_answer(prediction), normalize_answer(reference)
+    if not prediction or not reference:
+        return float(prediction == reference)
+    previous = [0] * (len(reference) + 1)
+    for char in prediction:
+        current = [0]
+        for j, ref_char in enumerate(reference):
+            current.append(previous[j] + 1 if char == ref_char else max(previous[j + 1], current[j]))
+        previous = current
+    lcs = previous[-1]
+    if lcs == 0:
+        return 0.0
+    precision, recall = lcs / len(prediction), lcs / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+
+@dataclass
+class EvalReport:
+    """评估结果: 每条样本的记录和汇总指标"""
+    records: list = field(default_factory=list)
+    seconds: float = 0.0
+
+    def mean(self, key):
+        return float(np.mean([record[key] for record in self.records])) if self.records else 0.0
+
+    @property
+    def tokens_per_second(self):
+        tokens = sum(record["reasoning_tokens"] + record["answer_tokens"] for record in self.records)
+        return tokens / self.seconds if self.seconds else 0.0
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)):
+        if not self.records:
+            return {f"p{p}": 0.0 for p in percentiles}
+        values = np.percentile([record["seconds"] for record in self.records], percentiles)
+        return {f"p{p}": float(value) for p, value in zip(percentiles, values)}
+
+    def summary(self):
+        latency = "，".join(f"{name} {value:.2f}s" for name, value in self.latency_percentiles().items())
+        return (
+            f"{len(self.records)} 条样本: char F1 {self.mean('char_f1'):.3f}，ROUGE-L {self.mean('rouge_l'):.3f}\n"
+            f"平均推理 {self.mean('reasoning_tokens'):.0f} tokens，答案 {self.mean('answer_tokens'):.0f} tokens，"
+            f"强制结束推理 {self.mean('forced'):.1%}\n"
+            f"吞吐量 {self.tokens_per_second:.1f} tokens/s，延迟: {latency}"
+        )
+
+
+def evaluate(generate, examples, output_path=None):
+    """
+    逐条生成并与数据集的 Response 字段比较
+
+    参数:
+        generate (callable): 接收问题，返回 ThinkResult，例如 HFThinkGenerator
+        examples (iterable[dict]): 包含 Question 和 Response 的样本
+        output_path (str): 每条结果追加写入的 JSONL 文件，None 表示不写入
+
+    返回:
+        EvalReport: 评估结果
+    """
+    report = EvalReport()
+    start = time.perf_counter()
+    output = open(output_path, "a", encoding="utf-8") if output_path else None
+    try:
+        for example in examples:
+            result = generate(example["Question"])
+            record = {
+                "question": example["Question"],
+                "reference": example["Response"],
+                **asdict(result),
+                "char_f1": char_f1(result.answer, example["Response"]),
+                "rouge_l": rouge_l(result.answer, example["Response"]),
+            }
+            report.records.append(record)
+            logger.info(
+                "推理 %d tokens，答案 %d tokens，耗时 %.2fs，char F1 %.3f",
+                result.reasoning_tokens, result.answer_tokens, result.seconds, record["char_f1"],
+            )
+            if output:
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+    finally:
+        if output:
+            output.close()
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from datasets import load_dataset
+
+    from batch_inference import load_model
+
+    parser = argparse.ArgumentParser(description="蒸馏模型的推理长度与答案质量评估")
+    parser.add_argument("--model", default="qwen-1.5b_lora_model", help="合并后的模型目录或 LoRA 适配器目录")
+    parser.add_argument("--base-model", default=None, help="LoRA 适配器的基座模型")
+    parser.add_argument("--device", default="auto")
+    parser.add_argument("--limit", type=int, default=50, help="评估的样本数")
+    parser.add_argument("--caps", type=int, nargs="*", default=[0], help="推理 token 上限，0 表示不限制；可以指定多个值对比")
+    parser.add_argument("--max-new-tokens", type=int, default=1200)
+    parser.add_argument("--output", default=None, help="逐条结果的 JSONL 文件")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    model, tokenizer = load_model(args.model, device=args.device, base_model=args.base_model)
+    dataset = load_dataset("FreedomIntelligence/medical-o1-reasoning-SFT", "zh", split="train")
+    examples = list(dataset.select(range(args.limit)))
+    for cap in args.caps:
+        generator = HFThinkGenerator(model, tokenizer, max_reasoning_tokens=cap or None,
+                                     max_new_tokens=args.max_new_tokens)
+        report = evaluate(generator, examples, args.output)
+        print(f"==================== 推理上限 {cap or '不限制'} ====================")
+        print(report.summary())
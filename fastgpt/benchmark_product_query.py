@@ -0,0 +1,135 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+from product_query import TEMPLATES, WAREHOUSES, ConnectionPool, ProductQueryService, SqlTranslator, build_sqlite_database
+
+SAMPLE_PARAMS = {
+    "text": ["精华", "面膜", "眼霜", "洁颜", "防晒"],
+    "keyword": ["精华", "面膜", "眼霜", "洁颜", "防晒"],
+    "int": [200, 500, 1000, 2000],
+    "date": ["2025-12-31", "2026-06-30", "2027-01-01", "2028-12-31"],
+    "warehouse": list(WAREHOUSES),
+}
+INGREDIENTS = ["烟酰胺", "玻尿酸", "视黄醇", "胜肽", "神经酰胺"]
+
+
+def sample_params(template, rng):
+    params = {}
+    for name, kind in template.params.items():
+        params[name] = rng.choice(INGREDIENTS if name == "ingredient" else SAMPLE_PARAMS[kind])
+    return params
+
+
+def time_templates(service, repeat, seed=0):
+    """
+    每个模板用随机参数执行 repeat 次
+
+    返回:
+        dict: 模板名称 -> 每次查询的耗时(秒)列表
+    """
+    rng = random.Random(seed)
+    timings = {}
+    for name, template in TEMPLATES.items():
+        timings[name] = []
+        for _ in range(repeat):
+            params = sample_params(template, rng)
+            start = time.perf_counter()
+            service.execute(name, params)
+            timings[name].append(time.perf_counter() - start)
+    return timings
+
+
+def throughput(run_query, total, threads):
+    """并发执行 total 次查询，返回每秒查询数"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(run_query, range(total)))
+    return total / (time.perf_counter() - start)
+
+
+class SlowClient:
+    """模拟 DeepSeek 的客户端: 每次请求固定延迟后返回同一个翻译结果"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        content = json.dumps({"template": "warehouse_stock", "params": {"warehouse": "北京仓"}})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def bench_translation(questions, latency):
+    """用模拟延迟的客户端比较翻译缓存未命中和命中的耗时"""
+    translator = SqlTranslator(SlowClient(latency))
+    cold = [translator.translate(question).seconds for question in questions]
+    warm = [translator.translate(question).seconds for question in questions]
+    return cold, warm
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="产品查询服务的索引、连接池和翻译缓存基准测试")
+    parser.add_argument("--scale", type=int, default=500, help="种子数据的复制倍数")
+    parser.add_argument("--repeat", type=int, default=50, help="每个模板的查询次数")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=2000, help="吞吐量测试的查询总数")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="模拟 DeepSeek 请求的延迟(秒)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        services = {}
+        for label, indexes in (("无索引", False), ("有索引", True)):
+            path = os.path.join(tmpdir, f"{indexes}.db")
+            start = time.perf_counter()
+            counts = build_sqlite_database(path, scale=args.scale, indexes=indexes)
+            print(f"{label}: 载入 {counts} 用时 {time.perf_counter() - start:.2f}s")
+            services[label] = ProductQueryService(ConnectionPool.sqlite(path, size=args.threads), SqlTranslator(None))
+
+        print(f"\n{'模板':<22}{'无索引 p50':>12}{'有索引 p50':>12}{'加速':>8}")
+        results = {label: time_templates(service, args.repeat) for label, service in services.items()}
+        for name in TEMPLATES:
+            plain = np.percentile(results["无索引"][name], 50) * 1000
+            indexed = np.percentile(results["有索引"][name], 50) * 1000
+            print(f"{name:<22}{plain:>10.2f}ms{indexed:>10.2f}ms{plain / indexed:>7.1f}x")
+
+        service = services["有索引"]
+        rng = random.Random(1)
+        workload = [(name, sample_params(TEMPLATES[name], rng))
+                    for name in rng.choices(["low_stock", "expiring_batches", "product_ingredients"], k=args.queries)]
+        path = os.path.join(tmpdir, "True.db")
+
+        def pooled(i):
+            return service.execute(*workload[i])
+
+        def connect_per_query(i):
+            name, params = workload[i]
+            connection = sqlite3.connect(path)
+            try:
+                return connection.execute(TEMPLATES[name].sql, TEMPLATES[name].sql_params(params)).fetchall()
+            finally:
+                connection.close()
+
+        print(f"\n并发 {args.threads} 线程:")
+        print(f"  每次新建连接: {throughput(connect_per_query, args.queries, args.threads):.0f} 查询/秒")
+        print(f"  连接池:       {throughput(pooled, args.queries, args.threads):.0f} 查询/秒")
+        for service in services.values():
+            service.close()
+
+    cold, warm = bench_translation([f"北京仓库存 {i}" for i in range(20)], args.llm_latency)
+    print(f"\n翻译: 未命中缓存 p50 {np.percentile(cold, 50) * 1000:.1f}ms，"
+          f"命中缓存 p50 {np.percentile(warm, 50) * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,17 @@ CREATE TABLE ingredients (
     function TEXT
 );
 
+-- 创建索引: 库存和成分按 product_id 关联产品，库存常按过期日期和仓库过滤
+-- 仓库只有三个取值，单列索引要回表读取三分之一的库存行，比全表扫描还慢，
+-- 因此按仓库汇总使用包含 product_id 和 stock_quantity 的覆盖索引，
+-- 按仓库查低库存使用 (warehouse, stock_quantity)，直接按库存顺序取前 N 条
+-- product_query.py 从这里读取索引定义，在 SQLite 中单独创建
+CREATE INDEX IF NOT EXISTS idx_inventory_product_id ON inventory (product_id);
+CREATE INDEX IF NOT EXISTS idx_inventory_expiry_date ON inventory (expiry_date);
+CREATE INDEX IF NOT EXISTS idx_inventory_warehouse ON inventory (warehouse, product_id, stock_quantity);
+CREATE INDEX IF NOT EXISTS idx_inventory_warehouse_stock ON inventory (warehouse, stock_quantity);
+CREATE INDEX IF NOT EXISTS idx_ingredients_product_id ON ingredients (product_id);
+
 -- 插入100条产品数据
 INSERT INTO products (sku, name, category, version, net_weight, shelf_life, production_cost, retail_price, is_active, launch_date, tech_patent) VALUES
 ('XYNHJ-30A','焕颜精华液','精华','V2.3',30,24,58.20,350.00,true,'2024-03-15','ZL20231056789X'),
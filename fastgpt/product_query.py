@@ -0,0 +1,580 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_PATH = os.path.join(HERE, "create.sql")
+
+INDEX_PATTERN = re.compile(r"^CREATE INDEX[^;]*", re.MULTILINE | re.IGNORECASE)
+
+
+def schema_indexes(path=SCHEMA_PATH):
+    """读取 create.sql 中的 CREATE INDEX 语句，SQLite 与 PostgreSQL 共用同一份索引定义"""
+    with open(path, "r", encoding="utf-8") as file:
+        return tuple(statement.strip() for statement in INDEX_PATTERN.findall(file.read()))
+
+
+INDEXES = schema_indexes()
+
+WAREHOUSES = ("北京仓", "上海仓", "广州仓")
+
+
+class TranslationError(ValueError):
+    """模型返回的内容无法对应到合法的查询模板和参数"""
+
+
+def _check_text(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("需要非空字符串")
+    return value.strip()
+
+
+def _check_int(value):
+    if isinstance(value, bool):
+        raise ValueError("需要整数")
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        value = int(value)
+    if not isinstance(value, int):
+        raise ValueError("需要整数")
+    return value
+
+
+def _check_date(value):
+    try:
+        return date.fromisoformat(str(value).strip()).isoformat()
+    except ValueError:
+        raise ValueError("需要 YYYY-MM-DD 格式的日期") from None
+
+
+def escape_like(value):
+    """转义 LIKE 模式中的通配符，使关键词中的 %、_ 和 \\ 按字面匹配(配合 ESCAPE '\\')"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _check_warehouse(value):
+    value = _check_text(value)
+    if not value.endswith("仓"):
+        value += "仓"
+    if value not in WAREHOUSES:
+        raise ValueError(f"仓库必须是 {WAREHOUSES} 之一")
+    return value
+
+
+PARAM_TYPES = {
+    "text": _check_text,
+    "keyword": _check_text,  # 用于 LIKE 的子串，执行时转义通配符
+    "int": _check_int,
+    "date": _check_date,
+    "warehouse": _check_warehouse,
+}
+
+
+@dataclass(frozen=True)
+class QueryTemplate:
+    """
+    一条参数化的查询模板
+
+    参数:
+        name (str): 模板名称，模型只能在已登记的名称中选择
+        description (str): 给模型看的用途说明
+        sql (str): 使用 :name 命名占位符的 SQL，同时适用于 SQLite 和 PostgreSQL
+        params (dict): 参数名 -> 参数类型(PARAM_TYPES 的键)
+    """
+    name: str
+    description: str
+    sql: str
+    params: dict = field(default_factory=dict)
+
+    def bind(self, params):
+        """
+        校验并规范化模型给出的参数
+
+        异常:
+            TranslationError: 缺少参数、多余参数或参数类型不符
+        """
+        if not isinstance(params, dict):
+            raise TranslationError(f"错误：模板 {self.name} 的参数必须是对象")
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise TranslationError(f"错误：模板 {self.name} 不接受参数 {sorted(unknown)}")
+        bound = {}
+        for name, kind in self.params.items():
+            if name not in params:
+                raise TranslationError(f"错误：模板 {self.name} 缺少参数 {name}")
+            try:
+                bound[name] = PARAM_TYPES[kind](params[name])
+            except ValueError as e:
+                raise TranslationError(f"错误：参数 {name}={params[name]!r} 不合法，{e}") from None
+        return bound
+
+    def sql_params(self, params):
+        """校验参数并转换为绑定变量，keyword 类型的参数转义 LIKE 通配符"""
+        return {
+            name: escape_like(value) if self.params[name] == "keyword" else value
+            for name, value in self.bind(params).items()
+        }
+
+
+TEMPLATES = {template.name: template for template in (
+    QueryTemplate(
+        "product_search",
+        "按名称关键词查询产品的 SKU、品类、规格、价格和上市日期",
+        "SELECT sku, name, category, net_weight, retail_price, is_active, launch_date FROM products"
+        " WHERE name LIKE '%' || :keyword || '%' ESCAPE '\\' ORDER BY product_id LIMIT 50",
+        {"keyword": "keyword"},
+    ),
+    QueryTemplate(
+        "category_products",
+        "列出某个品类(精华/洁面/面膜/眼霜/防晒)在售的产品及价格",
+        "SELECT sku, name, net_weight, retail_price FROM products"
+        " WHERE category = :category AND is_active ORDER BY retail_price LIMIT 50",
+        {"category": "text"},
+    ),
+    QueryTemplate(
+        "product_stock",
+        "查询名称包含关键词的产品在各仓库的库存总量",
+        "SELECT p.name, i.warehouse, SUM(i.stock_quantity) AS stock FROM products p"
+        " JOIN inventory i ON i.product_id = p.product_id"
+        " WHERE p.name LIKE '%' || :keyword || '%' ESCAPE '\\'"
+        " GROUP BY p.name, i.warehouse ORDER BY p.name, i.warehouse",
+        {"keyword": "keyword"},
+    ),
+    QueryTemplate(
+        "warehouse_stock",
+        "统计某个仓库(北京仓/上海仓/广州仓)各品类的库存总量",
+        "SELECT p.category, SUM(i.stock_quantity) AS stock, COUNT(*) AS batches FROM inventory i"
+        " JOIN products p ON p.product_id = i.product_id"
+        " WHERE i.warehouse = :warehouse GROUP BY p.category ORDER BY stock DESC",
+        {"warehouse": "warehouse"},
+    ),
+    QueryTemplate(
+        "expiring_batches",
+        "列出在某个日期(含)之前过期的库存批次",
+        "SELECT i.batch_id, p.name, i.warehouse, i.expiry_date, i.stock_quantity FROM inventory i"
+        " JOIN products p ON p.product_id = i.product_id"
+        " WHERE i.expiry_date <= :before ORDER BY i.expiry_date LIMIT 100",
+        {"before": "date"},
+    ),
+    QueryTemplate(
+        "low_stock",
+        "列出某个仓库中库存数量低于阈值的批次",
+        "SELECT i.batch_id, p.name, i.stock_quantity FROM inventory i"
+        " JOIN products p ON p.product_id = i.product_id"
+        " WHERE i.warehouse = :warehouse AND i.stock_quantity < :threshold ORDER BY i.stock_quantity LIMIT 100",
+        {"warehouse": "warehouse", "threshold": "int"},
+    ),
+    QueryTemplate(
+        "product_ingredients",
+        "查询名称包含关键词的产品的成分、浓度、供应商和功效",
+        "SELECT p.name AS product, g.name, g.concentration, g.supplier, g.function FROM products p"
+        " JOIN ingredients g ON g.product_id = p.product_id"
+        " WHERE p.name LIKE '%' || :keyword || '%' ESCAPE '\\' ORDER BY p.product_id, g.ingredient_id LIMIT 100",
+        {"keyword": "keyword"},
+    ),
+    QueryTemplate(
+        "ingredient_products",
+        "查询含有某种成分的产品",
+        "SELECT p.sku, p.name, g.name AS ingredient, g.concentration FROM ingredients g"
+        " JOIN products p ON p.product_id = g.product_id"
+        " WHERE g.name LIKE '%' || :ingredient || '%' ESCAPE '\\' ORDER BY g.ingredient_id LIMIT 100",
+        {"ingredient": "keyword"},
+    ),
+)}
+
+
+def to_pyformat(sql):
+    """把 :name 占位符转换为 psycopg 使用的 %(name)s，同时转义 SQL 中的 %"""
+    sql = sql.replace("%", "%%")
+    return re.sub(r"(?<!:):([A-Za-z_]\w*)", r"%(\1)s", sql)
+
+
+def sqlite_schema(path=SCHEMA_PATH):
+    """
+    读取 PostgreSQL 的 create.sql 并转换为 SQLite 可以执行的脚本
+
+    SERIAL 主键转换为 INTEGER PRIMARY KEY(rowid 自增)，索引语句去掉，由 create_indexes 单独创建，
+    以便基准测试比较有无索引的差别。
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        script = file.read()
+    script = script.replace("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY")
+    return re.sub(r"^CREATE INDEX[^;]*;\s*$", "", script, flags=re.MULTILINE | re.IGNORECASE)
+
+
+def create_indexes(connection):
+    for statement in INDEXES:
+        connection.execute(statement)
+    connection.commit()
+
+
+def drop_indexes(connection):
+    for statement in INDEXES:
+        name = statement.split(" ON ")[0].split()[-1]
+        connection.execute(f"DROP INDEX IF EXISTS {name}")
+    connection.commit()
+
+
+def scale_seed(connection, factor):
+    """
+    把种子数据复制为 factor 倍，用于在本地模拟更大的数据量
+
+    第 k 份副本的 product_id 整体偏移 k * 原始产品数，SKU 和批次号加上 -k 后缀，
+    库存和成分按偏移后的 product_id 关联到对应的副本产品。
+    """
+    (base,) = connection.execute("SELECT MAX(product_id) FROM products").fetchone()
+    for k in range(1, factor):
+        offset = k * base
+        connection.execute(
+            "INSERT INTO products (product_id, sku, name, category, version, net_weight, shelf_life,"
+            " production_cost, retail_price, is_active, launch_date, tech_patent)"
+            " SELECT product_id + ?, sku || '-' || ?, name, category, version, net_weight, shelf_life,"
+            " production_cost, retail_price, is_active, launch_date, tech_patent"
+            " FROM products WHERE product_id <= ?",
+            (offset, k, base),
+        )
+        connection.execute(
+            "INSERT INTO inventory (batch_id, product_id, production_date, expiry_date, warehouse,"
+            " stock_quantity, quality_report_no)"
+            " SELECT batch_id || '-' || ?, product_id + ?, production_date, expiry_date, warehouse,"
+            " stock_quantity, quality_report_no FROM inventory WHERE product_id <= ?",
+            (k, offset, base),
+        )
+        connection.execute(
+            "INSERT INTO ingredients (product_id, name, concentration, supplier, function)"
+            " SELECT product_id + ?, name, concentration, supplier, function FROM ingredients WHERE product_id <= ?",
+            (offset, base),
+        )
+    connection.commit()
+
+
+def build_sqlite_database(path, scale=1, indexes=True, schema_path=SCHEMA_PATH):
+    """
+    在 SQLite 中创建 create.sql 的表结构并载入(可放大的)种子数据
+
+    参数:
+        path (str): 数据库文件路径，已存在时会被覆盖
+        scale (int): 种子数据的复制倍数
+        indexes (bool): 是否创建 INDEXES 中的索引
+
+    返回:
+        dict: 表名 -> 行数
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(sqlite_schema(schema_path))
+        if scale > 1:
+            scale_seed(connection, scale)
+        if indexes:
+            create_indexes(connection)
+        connection.execute("ANALYZE")
+        connection.commit()
+        return {
+            table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("products", "inventory", "ingredients")
+        }
+    finally:
+        connection.close()
+
+
+class ConnectionPool:
+    """
+    线程安全的数据库连接池
+
+    连接在第一次需要时创建，用完放回队列复用；池中连接全部被占用时阻塞等待，超时抛出 TimeoutError。
+
+    参数:
+        factory (callable): 无参数、返回 DB-API 连接的函数
+        size (int): 最大连接数
+        timeout (float): 获取连接的最长等待时间(秒)，None 表示一直等待
+        paramstyle (str): 驱动的占位符风格，sqlite3 为 "named"，psycopg2 为 "pyformat"
+    """
+
+    def __init__(self, factory, size=8, timeout=30.0, paramstyle="named"):
+        self.factory = factory
+        self.paramstyle = paramstyle
+        self.size = size
+        self.timeout = timeout
+        self.created = 0
+        self._idle = []  # 后进先出，优先复用最近用过的连接
+        # 归还连接、丢弃坏连接和创建失败都会释放名额，通过同一个条件变量唤醒等待者
+        self._available = threading.Condition()
+        self._closed = False
+
+    @classmethod
+    def sqlite(cls, path, size=8, timeout=30.0):
+        """创建只读使用的 SQLite 连接池"""
+        def connect():
+            connection = sqlite3.connect(path, check_same_thread=False)
+            connection.execute("PRAGMA query_only = ON")
+            return connection
+        return cls(connect, size=size, timeout=timeout)
+
+    @classmethod
+    def postgres(cls, dsn, size=8, timeout=30.0):
+        """创建 PostgreSQL 连接池，需要安装 psycopg2"""
+        import psycopg2
+
+        def connect():
+            connection = psycopg2.connect(dsn)
+            connection.set_session(readonly=True, autocommit=True)
+            return connection
+        return cls(connect, size=size, timeout=timeout, paramstyle="pyformat")
+
+    def _acquire(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("错误：连接池已关闭")
+                if self._idle:
+                    return self._idle.pop()
+                if self.created < self.size:
+                    self.created += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"错误：{self.timeout} 秒内没有空闲的数据库连接")
+                self._available.wait(remaining)
+        # 在锁外创建连接，避免慢连接阻塞其他线程归还和借用
+        try:
+            return self.factory()
+        except Exception:
+            self._discard(None)
+            raise
+
+    def _discard(self, connection):
+        """关闭连接并释放它占用的名额，唤醒一个等待者去创建新连接"""
+        if connection is not None:
+            connection.close()
+        with self._available:
+            self.created -= 1
+            self._available.notify()
+
+    def _release(self, connection):
+        with self._available:
+            if not self._closed:
+                self._idle.append(connection)
+                self._available.notify()
+                return
+        connection.close()
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，with 块结束后归还"""
+        connection = self._acquire()
+        try:
+            yield connection
+        except Exception:
+            # 出错的连接可能处于未知状态，直接丢弃
+            self._discard(connection)
+            raise
+        else:
+            self._release(connection)
+
+    def close(self):
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._available.notify_all()
+        for connection in idle:
+            connection.close()
+
+
+def normalize_question(question):
+    """翻译缓存的键: 全角转半角、统一大小写、合并空白并去掉结尾的标点"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    return " ".join(text.split()).rstrip("?？。.!！ ")
+
+
+SYSTEM_PROMPT = """
+你是一个护肤品公司的数据查询助手。数据库中有 products(产品)、inventory(库存批次)和 ingredients(成分)三张表。
+你不能编写 SQL，只能从下面的查询模板中选择最合适的一个，并从问题中提取参数。
+
+查询模板:
+{templates}
+
+今天的日期是 {today}。日期参数使用 YYYY-MM-DD 格式，仓库参数只能是 北京仓、上海仓、广州仓 之一。
+只输出 JSON 对象，格式为 {{"template": "模板名称", "params": {{"参数名": 参数值}}}}；
+如果没有合适的模板，输出 {{"template": null, "params": {{}}}}。
+"""
+
+
+@dataclass
+class Translation:
+    """问题翻译得到的模板和参数"""
+    template: str
+    params: dict
+    sql: str
+    cached: bool = False
+    seconds: float = 0.0
+
+
+class SqlTranslator:
+    """
+    通过 DeepSeek 模型把自然语言问题映射为参数化查询模板
+
+    模型只负责选择模板和提取参数，参数经过类型校验后作为绑定变量传给数据库，不会拼接进 SQL。
+    翻译结果按当天日期和规范化后的问题缓存在进程内(LRU)，同一天内相同的问题不再请求模型，
+    “下个月过期”之类的相对日期在日期变化后会重新翻译；
+    需要跨进程持久化时，可以把 llm_client 换成 deepseek/api/llm_cache.py 中的 CachedChatClient。
+
+    参数:
+        llm_client: OpenAI 兼容的客户端，例如 OpenAI(base_url="https://api.deepseek.com/v1")
+        model (str): 模型名称
+        templates (dict): 模板名称 -> QueryTemplate
+        max_entries (int): 翻译缓存的最大条目数
+        today (callable): 返回当天日期的函数，用于解析“下个月”之类的相对日期
+    """
+
+    def __init__(self, llm_client, model="deepseek-chat", templates=TEMPLATES, max_entries=10_000,
+                 today=date.today):
+        self.llm_client = llm_client
+        self.model = model
+        self.templates = templates
+        self.max_entries = max_entries
+        self.today = today
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()  # (日期, 规范化问题) -> (模板名称, 参数)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def build_messages(self, question, today=None):
+        lines = []
+        for template in self.templates.values():
+            params = ", ".join(f"{name}: {kind}" for name, kind in template.params.items())
+            lines.append(f"- {template.name}({params}): {template.description}")
+        system = SYSTEM_PROMPT.format(templates="\n".join(lines), today=(today or self.today()).isoformat())
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": question},
+        ]
+
+    def translate(self, question):
+        """
+        把问题翻译为模板和参数
+
+        返回:
+            Translation: 选中的模板、校验后的参数和 SQL
+
+        异常:
+            TranslationError: 模型没有选择合法的模板，或参数不合法
+        """
+        start = time.perf_counter()
+        today = self.today()
+        key = (today.isoformat(), normalize_question(question))
+        with self._lock:
+            found = self._cache.get(key)
+            if found is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+        if found is not None:
+            name, params = found
+            return Translation(name, dict(params), self.templates[name].sql, True, time.perf_counter() - start)
+
+        response = self.llm_client.chat.completions.create(
+            model=self.model,
+            messages=self.build_messages(question, today),
+            response_format={"type": "json_object"},
+            temperature=0,
+        )
+        name, params = self.parse(response.choices[0].message.content)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = (name, params)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return Translation(name, dict(params), self.templates[name].sql, False, time.perf_counter() - start)
+
+    def parse(self, content):
+        """解析并校验模型输出的 JSON，返回 (模板名称, 参数)"""
+        match = re.search(r"\{.*\}", content or "", re.DOTALL)
+        try:
+            data = json.loads(match.group(0) if match else content or "")
+        except json.JSONDecodeError:
+            raise TranslationError(f"错误：模型输出不是合法的 JSON: {content!r}") from None
+        name = data.get("template") if isinstance(data, dict) else None
+        if name is None:
+            raise TranslationError("错误：没有可以回答该问题的查询模板")
+        if name not in self.templates:
+            raise TranslationError(f"错误：未知的查询模板 {name!r}")
+        return name, self.templates[name].bind(data.get("params") or {})
+
+
+@dataclass
+class QueryResult:
+    """一个问题的查询结果"""
+    question: str
+    template: str
+    params: dict
+    columns: list
+    rows: list
+    cached: bool = False  # 翻译是否命中缓存
+    translate_seconds: float = 0.0
+    query_seconds: float = 0.0
+
+
+class ProductQueryService:
+    """
+    产品/库存/成分的自然语言查询服务
+
+    问题先经 SqlTranslator 映射为模板和参数，再从连接池借出连接执行参数化查询。
+
+    参数:
+        pool (ConnectionPool): 数据库连接池
+        translator (SqlTranslator): 问题到查询模板的翻译器
+    """
+
+    def __init__(self, pool, translator):
+        self.pool = pool
+        self.translator = translator
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def ask(self, question):
+        translation = self.translator.translate(question)
+        start = time.perf_counter()
+        columns, rows = self.execute(translation.template, translation.params)
+        return QueryResult(
+            question, translation.template, translation.params, columns, rows,
+            translation.cached, translation.seconds, time.perf_counter() - start,
+        )
+
+    def execute(self, name, params):
+        """
+        直接执行一个模板
+
+        返回:
+            tuple: (列名列表, 行列表)
+        """
+        template = self.translator.templates[name]
+        params = template.sql_params(params)
+        sql = to_pyformat(template.sql) if self.pool.paramstyle == "pyformat" else template.sql
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(sql, params)
+                columns = [column[0] for column in cursor.description]
+                return columns, cursor.fetchall()
+            finally:
+                cursor.close()
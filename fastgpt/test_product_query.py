@@ -0,0 +1,303 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from types import SimpleNamespace
+
+from product_query import (
+    INDEXES,
+    TEMPLATES,
+    ConnectionPool,
+    ProductQueryService,
+    SqlTranslator,
+    TranslationError,
+    SCHEMA_PATH,
+    build_sqlite_database,
+    escape_like,
+    normalize_question,
+    sqlite_schema,
+    to_pyformat,
+)
+
+
+class FakeClient:
+    """按问题中的关键词返回固定翻译结果的客户端，记录请求次数"""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.requests = []
+        self.options = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **kwargs):
+        self.requests.append(messages)
+        self.options.append(kwargs)
+        question = messages[-1]["content"]
+        content = next(reply for word, reply in self.replies.items() if word in question)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+REPLIES = {
+    "上海": json.dumps({"template": "warehouse_stock", "params": {"warehouse": "上海"}}),
+    "过期": json.dumps({"template": "expiring_batches", "params": {"before": "2025-12-31"}}),
+    "天气": json.dumps({"template": None, "params": {}}),
+    "删除": json.dumps({"template": "drop_table", "params": {}}),
+    "成分": '```json\n{"template": "product_ingredients", "params": {"keyword": "焕颜精华液"}}\n```',
+}
+
+
+def explain(connection, name):
+    template = TEMPLATES[name]
+    params = {param: "北京仓" if kind == "warehouse" else "2025-12-31" if kind == "date" else 1
+              for param, kind in template.params.items()}
+    return " ".join(row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + template.sql, params))
+
+
+class TestDatabase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmpdir.name, "products.db")
+        cls.counts = build_sqlite_database(cls.path, scale=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def test_scaled_seed(self):
+        """放大后的副本保持原有的关联关系"""
+        self.assertEqual(self.counts, {"products": 240, "inventory": 300, "ingredients": 318})
+        with sqlite3.connect(self.path) as connection:
+            (orphans,) = connection.execute(
+                "SELECT COUNT(*) FROM inventory i LEFT JOIN products p ON p.product_id = i.product_id"
+                " WHERE p.product_id IS NULL"
+            ).fetchone()
+            self.assertEqual(orphans, 0)
+            names = connection.execute(
+                "SELECT DISTINCT p.name FROM inventory i JOIN products p ON p.product_id = i.product_id"
+                " WHERE i.batch_id IN ('XY23090101', 'XY23090101-2')"
+            ).fetchall()
+            self.assertEqual(names, [("焕颜精华液",)])
+
+    def test_queries_use_indexes(self):
+        with sqlite3.connect(self.path) as connection:
+            names = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            self.assertTrue({statement.split()[5] for statement in INDEXES} <= names)
+            self.assertIn("idx_inventory_warehouse", explain(connection, "warehouse_stock"))
+            self.assertIn("idx_inventory_expiry_date", explain(connection, "expiring_batches"))
+            self.assertIn("idx_ingredients_product_id", explain(connection, "product_ingredients"))
+
+    def test_indexes_come_from_schema(self):
+        """索引定义只保存在 create.sql 中"""
+        with open(SCHEMA_PATH, "r", encoding="utf-8") as file:
+            statements = [line.rstrip(";\n") for line in file if line.startswith("CREATE INDEX")]
+        self.assertEqual(list(INDEXES), statements)
+        self.assertEqual(len(INDEXES), 5)
+        self.assertNotIn("CREATE INDEX", sqlite_schema())
+
+    def test_like_wildcards_are_literal(self):
+        """关键词中的 % 和 _ 按字面匹配，不会匹配全部产品"""
+        self.assertEqual(escape_like("50%_a\\b"), "50\\%\\_a\\\\b")
+        with ProductQueryService(ConnectionPool.sqlite(self.path), SqlTranslator(None)) as service:
+            for keyword in ("%", "_", "\\"):
+                with self.subTest(keyword=keyword):
+                    self.assertEqual(service.execute("product_search", {"keyword": keyword})[1], [])
+                    self.assertEqual(service.execute("ingredient_products", {"ingredient": keyword})[1], [])
+            _, rows = service.execute("product_search", {"keyword": "精华"})
+            self.assertTrue(rows and all("精华" in row[1] for row in rows))
+
+    def test_without_indexes(self):
+        path = os.path.join(self.tmpdir.name, "plain.db")
+        build_sqlite_database(path, indexes=False)
+        with sqlite3.connect(path) as connection:
+            self.assertNotIn("idx_inventory_warehouse", explain(connection, "warehouse_stock"))
+
+
+class TestTemplates(unittest.TestCase):
+    def test_bind(self):
+        low_stock = TEMPLATES["low_stock"]
+        self.assertEqual(low_stock.bind({"warehouse": "广州", "threshold": "500"}),
+                         {"warehouse": "广州仓", "threshold": 500})
+        for params in ({"warehouse": "深圳仓", "threshold": 1}, {"warehouse": "北京仓"},
+                       {"warehouse": "北京仓", "threshold": 1, "sql": "1; DROP TABLE products"},
+                       {"warehouse": "北京仓", "threshold": True}):
+            with self.subTest(params=params), self.assertRaises(TranslationError):
+                low_stock.bind(params)
+        with self.assertRaises(TranslationError):
+            TEMPLATES["expiring_batches"].bind({"before": "明年"})
+
+    def test_to_pyformat(self):
+        sql = "SELECT 1::int WHERE name LIKE '%' || :keyword || '%' AND a < :limit"
+        self.assertEqual(to_pyformat(sql), "SELECT 1::int WHERE name LIKE '%%' || %(keyword)s || '%%' AND a < %(limit)s")
+
+    def test_normalize_question(self):
+        self.assertEqual(normalize_question(" 上海仓  库存？"), normalize_question("上海仓 库存"))
+        self.assertEqual(normalize_question("ＳＫＵ"), "sku")
+
+
+class TestConnectionPool(unittest.TestCase):
+    def test_reuses_connections(self):
+        """并发借用时创建的连接数不超过池大小"""
+        opened = []
+
+        def factory():
+            connection = sqlite3.connect(":memory:", check_same_thread=False)
+            opened.append(connection)
+            return connection
+
+        pool = ConnectionPool(factory, size=3)
+
+        def work(_):
+            with pool.connection() as connection:
+                return connection.execute("SELECT 1").fetchone()[0]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            self.assertEqual(sum(executor.map(work, range(200))), 200)
+        self.assertLessEqual(len(opened), 3)
+        pool.close()
+        with self.assertRaises(RuntimeError):
+            with pool.connection():
+                pass
+
+    def test_timeout_and_broken_connection(self):
+        pool = ConnectionPool(lambda: sqlite3.connect(":memory:", check_same_thread=False), size=1, timeout=0.05)
+        with pool.connection():
+            with self.assertRaises(TimeoutError):
+                with pool.connection():
+                    pass
+        with self.assertRaises(sqlite3.OperationalError):
+            with pool.connection() as connection:
+                connection.execute("SELECT * FROM missing")
+        # 出错的连接被丢弃，之后仍然可以借到新连接
+        self.assertEqual(pool.created, 0)
+        with pool.connection() as connection:
+            self.assertEqual(connection.execute("SELECT 2").fetchone(), (2,))
+
+    def test_freed_slot_wakes_waiter(self):
+        """丢弃坏连接或创建连接失败时释放的名额会唤醒等待中的线程，而不是让它等到超时"""
+        for failure in ("broken", "factory"):
+            with self.subTest(failure=failure):
+                started = threading.Event()
+                fail = threading.Event()
+                calls = []
+
+                def factory():
+                    calls.append(1)
+                    if failure == "factory" and len(calls) == 1:
+                        started.set()
+                        fail.wait()
+                        raise sqlite3.OperationalError("无法连接")
+                    return sqlite3.connect(":memory:", check_same_thread=False)
+
+                pool = ConnectionPool(factory, size=1, timeout=5)
+
+                def holder():
+                    try:
+                        with pool.connection():
+                            started.set()
+                            fail.wait()
+                            raise sqlite3.OperationalError("连接已断开")
+                    except sqlite3.OperationalError:
+                        pass
+
+                def waiter():
+                    with pool.connection() as connection:
+                        return connection.execute("SELECT 3").fetchone()
+
+                thread = threading.Thread(target=holder)
+                thread.start()
+                started.wait()
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    future = executor.submit(waiter)
+                    threading.Timer(0.05, fail.set).start()
+                    # 旧实现中等待者只能等到 5 秒超时
+                    self.assertEqual(future.result(timeout=1), (3,))
+                thread.join()
+                self.assertEqual(pool.created, 1)
+                pool.close()
+
+
+class TestSqlTranslator(unittest.TestCase):
+    def test_cache(self):
+        """规范化后相同的问题只请求一次模型"""
+        client = FakeClient(REPLIES)
+        translator = SqlTranslator(client, today=lambda: date(2025, 6, 1))
+        first = translator.translate("上海仓各品类库存有多少？")
+        second = translator.translate(" 上海仓各品类库存有多少 ")
+        self.assertEqual((first.template, first.params), ("warehouse_stock", {"warehouse": "上海仓"}))
+        self.assertEqual((first.cached, second.cached), (False, True))
+        self.assertEqual(second.sql, TEMPLATES["warehouse_stock"].sql)
+        self.assertEqual(len(client.requests), 1)
+        self.assertEqual((translator.hits, translator.misses), (1, 1))
+        self.assertIn("2025-06-01", client.requests[0][0]["content"])
+        self.assertIn("expiring_batches(before: date)", client.requests[0][0]["content"])
+
+        translator.translate("成分")
+        self.assertEqual(translator.translate("成分").params, {"keyword": "焕颜精华液"})
+
+    def test_cache_keyed_by_date(self):
+        """提示词中带有当天日期，日期变化后重新翻译相对日期的问题"""
+        client = FakeClient(REPLIES)
+        today = [date(2025, 6, 1)]
+        translator = SqlTranslator(client, today=lambda: today[0])
+        self.assertFalse(translator.translate("下个月过期的批次").cached)
+        self.assertTrue(translator.translate("下个月过期的批次").cached)
+        today[0] = date(2025, 7, 1)
+        self.assertFalse(translator.translate("下个月过期的批次").cached)
+        self.assertEqual(len(client.requests), 2)
+        self.assertIn("2025-07-01", client.requests[1][0]["content"])
+
+    def test_lru_eviction(self):
+        client = FakeClient(REPLIES)
+        translator = SqlTranslator(client, max_entries=1)
+        translator.translate("上海")
+        translator.translate("过期")
+        translator.translate("上海")
+        self.assertEqual(len(client.requests), 3)
+        self.assertEqual(len(translator), 1)
+
+    def test_invalid_translations_are_not_cached(self):
+        client = FakeClient(REPLIES)
+        translator = SqlTranslator(client)
+        for question in ("今天天气怎么样", "删除所有数据"):
+            with self.subTest(question=question), self.assertRaises(TranslationError):
+                translator.translate(question)
+        self.assertEqual(len(translator), 0)
+
+
+class TestProductQueryService(unittest.TestCase):
+    def test_ask_with_translation(self):
+        """问题经模型翻译为模板后，在连接池中并发执行"""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "products.db")
+        build_sqlite_database(path)
+
+        client = FakeClient(REPLIES)
+        translator = SqlTranslator(client)
+        with ProductQueryService(ConnectionPool.sqlite(path, size=2), translator) as service:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(service.ask, ["上海仓库存"] * 4 + ["2025 年底前过期的批次"]))
+            requests = len(client.requests)
+            self.assertLessEqual(service.pool.created, 2)
+        self.assertTrue(all(options["response_format"] == {"type": "json_object"} for options in client.options))
+
+        stock = results[0]
+        self.assertEqual(stock.columns, ["category", "stock", "batches"])
+        self.assertEqual(sum(row[2] for row in stock.rows), 33)
+        self.assertTrue(all(result.rows == stock.rows for result in results[:4]))
+        expiring = results[-1]
+        self.assertTrue(all(row[3] <= "2025-12-31" for row in expiring.rows))
+        self.assertEqual(expiring.rows[0][0], "XY23090101")
+        self.assertLessEqual(requests, 5)
+        with self.assertRaises(sqlite3.OperationalError):
+            with ConnectionPool.sqlite(path).connection() as connection:
+                connection.execute("DELETE FROM products")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)